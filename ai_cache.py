@@ -0,0 +1,212 @@
+"""
+Cache of AI task suggestions, so near-identical tasks ("Weekly report",
+"weekly  report!", a duplicated template) don't each cost an API call.
+
+Entries are keyed on a SHA-256 of the model name, the normalized title and
+the pruned branch context: only the titles of the branch, normalized, so two
+copies of the same template share their suggestions although their task ids
+differ. Lookups go through two tiers:
+
+  * an in-process LRU (AI_CACHE_MEMORY_ENTRIES entries), then
+  * the ai_suggestion_cache table, shared by every worker and kept across
+    restarts. Rows older than AI_CACHE_TTL seconds don't count as hits, and
+    every AI_CACHE_PRUNE_EVERY stores the expired rows and the least recently
+    used ones beyond AI_CACHE_MAX_ROWS are deleted.
+
+Only answers that parsed as suggestions are stored, never errors. Hit and miss
+counters are in stats() (and /metrics).
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from mysql.connector import Error
+
+from db_manager import get_db_connection
+
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv('AI_CACHE_MEMORY_ENTRIES', 1000))
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 30 * 24 * 3600))
+AI_CACHE_MAX_ROWS = int(os.getenv('AI_CACHE_MAX_ROWS', 50000))
+AI_CACHE_PRUNE_EVERY = int(os.getenv('AI_CACHE_PRUNE_EVERY', 100))
+
+_WORD_RE = re.compile(r'\w+')
+
+CACHE_GET_QUERY = """
+    SELECT suggestions, TIMESTAMPDIFF(SECOND, created_at, NOW()) AS age
+    FROM ai_suggestion_cache
+    WHERE prompt_hash = %s AND created_at > NOW() - INTERVAL %s SECOND
+"""
+
+CACHE_TOUCH_QUERY = "UPDATE ai_suggestion_cache SET hits = hits + 1, used_at = NOW() WHERE prompt_hash = %s"
+
+CACHE_PUT_QUERY = """
+    INSERT INTO ai_suggestion_cache (prompt_hash, model, suggestions, created_at, used_at)
+    VALUES (%s, %s, %s, NOW(), NOW())
+    ON DUPLICATE KEY UPDATE suggestions = VALUES(suggestions), created_at = NOW(), used_at = NOW()
+"""
+
+# Least recently used rows beyond the size limit: (max_rows)
+CACHE_EVICT_QUERY = """
+    DELETE c FROM ai_suggestion_cache c
+    JOIN (
+        SELECT prompt_hash FROM ai_suggestion_cache
+        ORDER BY used_at DESC
+        LIMIT 18446744073709551615 OFFSET %s
+    ) old ON old.prompt_hash = c.prompt_hash
+"""
+
+
+def normalize_text(text):
+    """Lower-cased words separated by single spaces: case, punctuation and spacing don't matter."""
+    return ' '.join(_WORD_RE.findall((text or '').lower()))
+
+
+def prune_context(branch_context):
+    """
+    The part of a branch context (CTask.get_full_task_structure_json, as JSON) that matters
+    for the prompt: the tree of normalized titles, without ids.
+    """
+    if not branch_context:
+        return ''
+    try:
+        structure = json.loads(branch_context) if isinstance(branch_context, str) else branch_context
+    except (json.JSONDecodeError, TypeError):
+        return normalize_text(branch_context)
+
+    def prune(node):
+        if not isinstance(node, dict):
+            return normalize_text(str(node))
+        return [normalize_text(node.get('title')), [prune(child) for child in node.get('subtasks') or []]]
+
+    return json.dumps(prune(structure), separators=(',', ':'))
+
+
+def suggestion_key(model, task_title, branch_context=None, current_leaf_title=None):
+    text = '\n'.join([model or '', normalize_text(task_title), prune_context(branch_context),
+                      normalize_text(current_leaf_title)])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class SuggestionCache:
+    """Two-tier (memory LRU, then MySQL) cache of suggestion lists by suggestion_key."""
+
+    def __init__(self, memory_entries=AI_CACHE_MEMORY_ENTRIES, ttl=AI_CACHE_TTL,
+                 max_rows=AI_CACHE_MAX_ROWS, prune_every=AI_CACHE_PRUNE_EVERY, persistent=True):
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self.persistent = persistent
+        self._entries = OrderedDict()  # key -> (suggestions, expires_at)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evicted_rows': 0,
+        }
+
+    def _remember(self, key, suggestions, expires_at):
+        with self._lock:
+            self._entries[key] = (suggestions, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """A copy of the cached suggestions for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(entry[0])
+                del self._entries[key]
+
+        suggestions = self._load(key) if self.persistent else None
+        with self._lock:
+            self._stats['db_hits' if suggestions is not None else 'misses'] += 1
+        return copy.deepcopy(suggestions)
+
+    def _load(self, key):
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(CACHE_GET_QUERY, (key, self.ttl))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            suggestions = json.loads(row[0])
+            cursor.execute(CACHE_TOUCH_QUERY, (key,))
+            conn.commit()
+            self._remember(key, suggestions, time.time() + self.ttl - (row[1] or 0))
+            return suggestions
+        except (Error, json.JSONDecodeError, TypeError) as e:
+            print(f"Error reading AI suggestion cache: {e}")
+            conn.rollback()
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+    def put(self, key, model, suggestions):
+        self._remember(key, copy.deepcopy(suggestions), time.time() + self.ttl)
+        with self._lock:
+            self._stats['stores'] += 1
+            self._puts += 1
+            prune = self._puts % self.prune_every == 0
+        if not self.persistent:
+            return
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute(CACHE_PUT_QUERY, (key, model, json.dumps(suggestions)))
+            conn.commit()
+            if prune:
+                self._prune(cursor)
+                conn.commit()
+        except Error as e:
+            print(f"Error writing AI suggestion cache: {e}")
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _prune(self, cursor):
+        cursor.execute("DELETE FROM ai_suggestion_cache WHERE created_at <= NOW() - INTERVAL %s SECOND", (self.ttl,))
+        evicted = cursor.rowcount
+        cursor.execute(CACHE_EVICT_QUERY, (self.max_rows,))
+        evicted += cursor.rowcount
+        with self._lock:
+            self._stats['evicted_rows'] += evicted
+
+    def clear(self):
+        """Drop the in-process entries (the table is left alone)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self._stats['memory_hits'] + self._stats['db_hits']
+            lookups = hits + self._stats['misses']
+            return {
+                **self._stats,
+                'memory_entries': len(self._entries),
+                'hit_rate': round(hits / lookups, 3) if lookups else None,
+            }
+
+
+# Shared by every AIService in the process
+suggestion_cache = SuggestionCache()
@@ -0,0 +1,201 @@
+"""
+Branch context for AI prompts, within a token budget.
+
+When a subtask is added, the prompt describes the branch it goes into. The
+whole branch can be thousands of tasks, so build_branch_context keeps the
+tasks most relevant to the new leaf, in this order, while they fit in
+AI_CONTEXT_TOKENS (estimated at ~4 characters per token):
+
+  1. the parent, the branch root, then the other ancestors, nearest first, on
+     at most half the budget (skipped levels become one "... N more levels
+     ..." node);
+  2. the parent's children, i.e. the new leaf's siblings;
+  3. the children of the other ancestors, nearest first.
+
+Everything else is summarized: each node carries "not_shown", the number of
+its descendants left out of the context (not counting the ones already
+summarized further down). The result has the same nested {id, title,
+subtasks} shape as CTask.get_full_task_structure_json.
+
+The rows read for a parent are memoized in forest_cache at the user's data
+version, without the subtask being generated: it is left out afterwards, so
+the jobs of several new subtasks of one parent share one read.
+"""
+import json
+import os
+
+from mysql.connector import Error
+
+from db_manager import get_db_connection, get_user_data_version
+from forest_cache import forest_cache
+
+AI_CONTEXT_TOKENS = int(os.getenv('AI_CONTEXT_TOKENS', 800))
+# Children read per ancestor; more could never fit in a prompt anyway
+AI_CONTEXT_MAX_CHILDREN = int(os.getenv('AI_CONTEXT_MAX_CHILDREN', 200))
+CHARS_PER_TOKEN = 4
+
+# Ancestors of a task, root first (the task itself last)
+CONTEXT_PATH_QUERY = """
+    SELECT t.id, t.title, t.parent_id
+    FROM task_closure c
+    JOIN tasks t ON t.id = c.ancestor_id
+    WHERE c.descendant_id = %s AND t.user_id = %s
+    ORDER BY c.depth DESC
+"""
+
+# The first children of each of the given tasks: (user_id, ids..., limit)
+CONTEXT_CHILDREN_QUERY = """
+    SELECT id, title, parent_id
+    FROM (
+        SELECT t.id, t.title, t.parent_id,
+               ROW_NUMBER() OVER (PARTITION BY t.parent_id ORDER BY (t.status = 'completed'), t.created_at, t.id) AS position
+        FROM tasks t
+        WHERE t.user_id = %s AND t.parent_id IN ({placeholders})
+    ) ranked
+    WHERE position <= %s
+    ORDER BY parent_id, position
+"""
+
+# Descendant counts of the tasks that were read
+CONTEXT_DESCENDANTS_QUERY = """
+    SELECT ancestor_id, COUNT(*) - 1 AS descendants
+    FROM task_closure
+    WHERE ancestor_id IN ({placeholders})
+    GROUP BY ancestor_id
+"""
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _node_cost(title):
+    return estimate_tokens(json.dumps({"id": "0000000", "title": title or '', "subtasks": [], "not_shown": 0}))
+
+
+def select_context(path, children, budget=AI_CONTEXT_TOKENS):
+    """
+    Build the context tree from path (ancestor dicts root first, parent last, with id, title
+    and descendants) and children ({task_id: [child dicts, in display order]}).
+    """
+    if not path:
+        return None
+    used = 0
+    shown_path = set()
+    # The parent always goes in, then the root, then the other ancestors nearest first,
+    # on at most half the budget so the siblings get their share
+    for node in [path[-1], path[0]] + path[-2:0:-1]:
+        if node['id'] in shown_path:
+            continue
+        cost = _node_cost(node['title'])
+        if shown_path and used + cost > (budget if len(shown_path) < 2 else budget // 2):
+            break
+        shown_path.add(node['id'])
+        used += cost
+
+    # Children of the shown ancestors, the parent's (the new leaf's siblings) first
+    path_ids = {node['id'] for node in path}
+    shown_children = set()
+    full = False
+    for node in reversed(path):
+        if full or node['id'] not in shown_path:
+            continue
+        for child in children.get(node['id'], []):
+            if child['id'] in path_ids:
+                continue
+            cost = _node_cost(child['title'])
+            if used + cost > budget:
+                full = True
+                break
+            shown_children.add(child['id'])
+            used += cost
+
+    # Assemble bottom-up. `below` is the subtree of the nearest shown path node under the current one.
+    below = None
+    skipped = 0  # hidden path levels between the current node and `below`
+    for index in range(len(path) - 1, -1, -1):
+        node = path[index]
+        if node['id'] not in shown_path:
+            skipped += 1
+            continue
+        subtasks = []
+        accounted = 0  # descendants shown or summarized in subtasks
+        placed = below is None
+        for child in children.get(node['id'], []):
+            if not placed and not skipped and child['id'] == path[index + 1]['id']:
+                subtasks.append(below)
+                placed = True
+            elif child['id'] in shown_children:
+                entry = {"id": str(child['id']), "title": child['title'], "subtasks": []}
+                if child['descendants']:
+                    entry["not_shown"] = int(child['descendants'])
+                subtasks.append(entry)
+                accounted += 1 + int(child['descendants'])
+        if not placed:
+            # Hidden levels in between, or the path child was beyond the children read
+            subtasks.insert(0, {"title": f"... {skipped} more levels ...", "subtasks": [below]} if skipped else below)
+        if below is not None:
+            accounted += 1 + int(path[index + 1 + skipped]['descendants'])
+        entry = {"id": str(node['id']), "title": node['title'], "subtasks": subtasks}
+        not_shown = int(node['descendants']) - accounted
+        if not_shown > 0:
+            entry["not_shown"] = not_shown
+        below, skipped = entry, 0
+    return below
+
+
+def without_task(path, children, task_id):
+    """path and children (as read for select_context) as if task_id, a child of the parent, were not there."""
+    siblings = children.get(path[-1]['id'], [])
+    excluded = next((child for child in siblings if child['id'] == task_id), None)
+    if excluded is None:
+        return path, children
+    removed = 1 + excluded['descendants']
+    children = dict(children)
+    children[path[-1]['id']] = [child for child in siblings if child is not excluded]
+    return [dict(node, descendants=node['descendants'] - removed) for node in path], children
+
+
+def build_branch_context(user_id, parent_id, exclude_id=None, budget=AI_CONTEXT_TOKENS):
+    """
+    JSON context of the branch a new subtask of parent_id goes into (None if there is none).
+    exclude_id, the subtask itself, is left out, so the context (and the suggestion cache key
+    built from it) is the same as before it was added.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        version = get_user_data_version(cursor, user_id)
+        cache_key = ('ai_context', int(parent_id))
+        branch = forest_cache.get(user_id, cache_key, version)
+        if branch is None:
+            cursor.execute(CONTEXT_PATH_QUERY, (parent_id, user_id))
+            path = cursor.fetchall()
+            if not path:
+                return None
+            placeholders = ', '.join(['%s'] * len(path))
+            cursor.execute(CONTEXT_CHILDREN_QUERY.format(placeholders=placeholders),
+                           (user_id, *[node['id'] for node in path], AI_CONTEXT_MAX_CHILDREN))
+            children = {}
+            for row in cursor.fetchall():
+                children.setdefault(row['parent_id'], []).append(row)
+
+            # Counted only for the tasks that were read, in one grouped query
+            nodes = path + [child for rows in children.values() for child in rows]
+            cursor.execute(CONTEXT_DESCENDANTS_QUERY.format(placeholders=', '.join(['%s'] * len(nodes))),
+                           [node['id'] for node in nodes])
+            descendants = {row['ancestor_id']: int(row['descendants']) for row in cursor.fetchall()}
+            for node in nodes:
+                node['descendants'] = descendants.get(node['id'], 0)
+            branch = (path, children)
+            forest_cache.put(user_id, cache_key, branch, version)
+
+        path, children = without_task(*branch, exclude_id)
+        return json.dumps(select_context(path, children, budget))
+    except Error as e:
+        print(f"Error building AI branch context: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+from ai_cache import suggestion_cache, suggestion_key
 try:
     from openai import OpenAI, OpenAIError
 except ImportError:
@@ -29,13 +30,24 @@ class AIService:
             sys.stdout.flush()
             self.client = None
 
-    def get_task_suggestion(self, task_title, branch_context=None, current_leaf_title=None):
-        """Ask OpenAI for a short suggestion/breakdown for the task, considering context."""
+    def get_task_suggestion(self, task_title, branch_context=None, current_leaf_title=None, timeout=None, raise_errors=False):
+        """
+        Ask OpenAI for a short suggestion/breakdown for the task, considering context.
+        timeout caps the request in seconds. With raise_errors, API errors are raised
+        (so the caller can retry) instead of returned as an error suggestion.
+        """
         if not self.client:
             print("OpenAI request skipped: Client not initialized.")
             sys.stdout.flush()
             return None 
 
+        cache_key = suggestion_key(self.model, task_title, branch_context, current_leaf_title)
+        cached = suggestion_cache.get(cache_key)
+        if cached is not None:
+            print(f"AI suggestion cache hit for task: '{task_title}'")
+            sys.stdout.flush()
+            return cached
+
         try:
             print(f"Sending OpenAI request for task: '{task_title}'")
             sys.stdout.flush()
@@ -50,7 +62,9 @@ class AIService:
             print(f"Prompt: {prompt}")
             sys.stdout.flush()
             
+            request_options = {'timeout': timeout} if timeout else {}
             response = self.client.chat.completions.create(
+                **request_options,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a helpful productivity assistant. You are dealing gently with someone who has procrastination and needs minimal first steps to start. You MUST return JSON."},
@@ -79,6 +93,8 @@ class AIService:
                             })
                         elif isinstance(s, str):
                             result.append({"text": s, "time": 0, "done": False})
+                    if result:
+                        suggestion_cache.put(cache_key, self.model, result)
                     return result
                 return [{"text": content, "time": 0, "done": False}] # Fallback
             except json.JSONDecodeError:
@@ -86,4 +102,6 @@ class AIService:
         except Exception as e:
             print(f"OpenAI API Error: {e}")
             sys.stdout.flush()
+            if raise_errors:
+                raise
             return [{"text": f"Error contacting AI: {str(e)}", "done": False}]
@@ -0,0 +1,206 @@
+"""
+Background generation of AI suggestions.
+
+add_task inserts the task right away with ai_status = 'pending' and submits
+a job here; a bounded pool of worker threads asks the AI service for the
+suggestions and stores them (ai_status 'done', or 'failed' with the error as
+the only suggestion). The page polls /ai_status for pending tasks.
+
+A job is retried with exponential backoff until it succeeds, runs out of
+attempts or exceeds its time budget (AI_JOB_TIMEOUT seconds, which also caps
+each request). When the queue is full the job is not queued and the task is
+marked failed straight away, so a slow AI backend can't pile up work.
+
+Jobs live in memory: ones still queued when the process stops stay pending.
+Results are only stored while the task is still pending, so a suggestion that
+was cleared (or a task that was deleted) in the meantime is left alone.
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from mysql.connector import Error
+
+from ai_context import build_branch_context
+from db_manager import get_db_connection, bump_user_data_version
+from forest_cache import forest_cache
+from trigram_index import search_index
+
+AI_WORKERS = int(os.getenv('AI_WORKERS', 4))
+AI_QUEUE_SIZE = int(os.getenv('AI_QUEUE_SIZE', 200))
+# Time budget of one job, all attempts included
+AI_JOB_TIMEOUT = float(os.getenv('AI_JOB_TIMEOUT', 30))
+AI_JOB_ATTEMPTS = int(os.getenv('AI_JOB_ATTEMPTS', 3))
+AI_RETRY_BACKOFF = float(os.getenv('AI_RETRY_BACKOFF', 1))
+
+STORE_SUGGESTION_QUERY = """
+    UPDATE tasks SET ai_suggestion = %s, ai_status = %s
+    WHERE id = %s AND user_id = %s AND ai_status = 'pending'
+"""
+
+
+class AIJob:
+    __slots__ = ('ai_service', 'user_id', 'task_id', 'title', 'parent_id', 'submitted_at')
+
+    def __init__(self, ai_service, user_id, task_id, title, parent_id=None):
+        self.ai_service = ai_service
+        self.user_id = user_id
+        self.task_id = task_id
+        self.title = title
+        self.parent_id = parent_id
+        self.submitted_at = time.monotonic()
+
+
+class AIWorkerPool:
+    """Bounded queue of AIJob served by daemon threads, started on first use in each process."""
+
+    def __init__(self, workers=AI_WORKERS, queue_size=AI_QUEUE_SIZE, timeout=AI_JOB_TIMEOUT,
+                 attempts=AI_JOB_ATTEMPTS, backoff=AI_RETRY_BACKOFF):
+        self.workers = workers
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._in_flight = 0
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+        }
+
+    def _ensure_started(self):
+        with self._lock:
+            # Threads don't survive a fork, so a forked worker starts its own
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"ai-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, ai_service, user_id, task_id, title, parent_id=None):
+        """Queue a suggestion job. Returns False (and marks the task failed) when the queue is full."""
+        self._ensure_started()
+        job = AIJob(ai_service, user_id, task_id, title, parent_id)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            print(f"AI queue full, not generating suggestions for task {task_id}")
+            sys.stdout.flush()
+            self._store(job, [{"text": "AI is busy, please try again later.", "done": False}], 'failed')
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued job is finished (or timeout seconds passed). Returns True when idle."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                if self._queue.unfinished_tasks == 0:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._in_flight += 1
+            try:
+                self._process(job)
+            except Exception as e:
+                # Never let one job take a worker down
+                print(f"AI worker error on task {job.task_id}: {e}")
+                sys.stdout.flush()
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._queue.task_done()
+
+    def _process(self, job):
+        deadline = time.monotonic() + self.timeout
+        branch_context = self._branch_context(job) if job.parent_id else None
+        error = None
+        for attempt in range(self.attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                error = error or TimeoutError(f"no answer within {self.timeout:g}s")
+                break
+            try:
+                suggestions = job.ai_service.get_task_suggestion(
+                    job.title, branch_context, job.title if job.parent_id else None,
+                    timeout=remaining, raise_errors=True)
+                self._store(job, suggestions, 'done')
+                with self._lock:
+                    self._stats['completed'] += 1
+                return
+            except Exception as e:
+                error = e
+                if attempt + 1 < self.attempts:
+                    with self._lock:
+                        self._stats['retries'] += 1
+                    time.sleep(min(self.backoff * 2 ** attempt, max(deadline - time.monotonic(), 0)))
+        with self._lock:
+            self._stats['failed'] += 1
+        self._store(job, [{"text": f"Error contacting AI: {error}", "done": False}], 'failed')
+
+    def _branch_context(self, job):
+        """JSON of the parent's branch without the task itself (see ai_context), as context for the prompt."""
+        try:
+            return build_branch_context(job.user_id, job.parent_id, job.task_id)
+        except Exception as e:
+            print(f"Error fetching branch context: {e}")
+            return None
+
+    def _store(self, job, suggestions, status):
+        conn = get_db_connection()
+        if not conn:
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(STORE_SUGGESTION_QUERY, (json.dumps(suggestions) if suggestions else None, status,
+                                                    job.task_id, job.user_id))
+            if not cursor.rowcount:
+                conn.rollback()
+                return False
+            version = bump_user_data_version(cursor, job.user_id)
+            conn.commit()
+            forest_cache.invalidate(job.user_id)
+            search_index.advance(job.user_id, version)
+            return True
+        except Error as e:
+            print(f"Error storing AI suggestions for task {job.task_id}: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'workers': len(self._threads) if self._pid == os.getpid() else 0,
+                'queue_depth': self._queue.qsize(),
+                'queue_max': self._queue.maxsize,
+                'in_flight': self._in_flight,
+            }
+
+
+# Shared by every TaskManager in the process
+ai_jobs = AIWorkerPool()
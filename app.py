@@ -1,9 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file, abort, get_template_attribute
 from task_manager import TaskManager
-from db_manager import initialize_database, get_or_create_user, get_db_connection
+from blob_store import BlobStore, IMAGE_TYPES, image_url
+from forest_cache import forest_cache
+from trigram_index import search_index
+from tag_store import tag_ids
+from ai_worker import ai_jobs
+from ai_cache import suggestion_cache
+from stats_service import get_stats
+from db_manager import initialize_database, get_or_create_user, get_db_connection, get_pool_stats
+import db_manager
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
 import os
+import hmac
 import datetime
 
 load_dotenv()
@@ -29,7 +38,11 @@ google = oauth.register(
     client_kwargs={'scope': 'openid email profile'}
 )
 
+# One pooled connection per request, shared by TaskManager and CTask
+db_manager.init_app(app)
+
 manager = TaskManager()
+blob_store = BlobStore()
 
 # Ensure DB is ready
 initialize_database()
@@ -72,15 +85,12 @@ def task_detail(task_id):
     user = session['user']
     manager = TaskManager()
     
-    # Get Task and its children
-    task, children = manager.get_task_details(user['id'], task_id)
+    # Get Task and its children (?depth=N opens only the first N levels of big projects)
+    max_depth = request.args.get('depth', type=int)
+    task, children = manager.get_task_details(user['id'], task_id, max_depth)
     
-    # Needs stats for sidebar
-    # We can perform a lightweight list_tasks to get stats
-    # or expose a specific get_stats method. 
-    # For now, let's just reuse list_tasks(user_id) as it's the simplest way to ensure consistency
-    # Only need to fetch them if we want to show the sidebar correctly
-    _, stats = manager.list_tasks(user['id'])
+    # Needs stats for sidebar (computed in SQL, no tree build)
+    stats = get_stats(user['id'])
     
     if not task:
         # Task not found or not owned by user
@@ -97,15 +107,106 @@ def task_detail(task_id):
                            current_period=request.args.get('period'),
                            now=datetime.datetime.now())
 
+@app.route('/task/<int:task_id>/description')
+def task_description(task_id):
+    user = session.get('user')
+    if not user:
+        return jsonify({'status': 'error', 'message': 'Not logged in'}), 401
+
+    description = manager.get_task_description(user['id'], task_id)
+    if description is None:
+        return jsonify({'status': 'error', 'message': 'Task not found'}), 404
+    return jsonify({'id': task_id, 'description': description})
+
+@app.route('/search')
+def search():
+    user = session.get('user')
+    if not user:
+        return jsonify({'status': 'error', 'message': 'Not logged in'}), 401
+
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    hits = manager.search_tasks(user['id'], query, limit)
+    return jsonify({'query': query, 'results': hits})
+
+@app.route('/search/suggest')
+def search_suggest():
+    user = session.get('user')
+    if not user:
+        return jsonify({'status': 'error', 'message': 'Not logged in'}), 401
+
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    suggestions = manager.suggest(user['id'], query, limit)
+    return jsonify({'query': query, **suggestions})
+
+@app.route('/images', methods=['POST'])
+def upload_image():
+    user = session.get('user')
+    if not user:
+        return jsonify({'status': 'error', 'message': 'Not logged in'}), 401
+
+    image = request.files.get('image')
+    if not image:
+        return jsonify({'status': 'error', 'message': 'No image uploaded'}), 400
+
+    name = blob_store.put(image.read())
+    if not name:
+        return jsonify({'status': 'error', 'message': 'Unsupported image type'}), 415
+    return jsonify({'status': 'ok', 'url': image_url(name)})
+
+@app.route('/images/<name>')
+def serve_image(name):
+    if not session.get('user'):
+        abort(401)
+
+    path = blob_store.path_for(name)
+    if not path:
+        abort(404)
+
+    # The name is the content hash, so it doubles as a strong ETag and the file never changes
+    digest, ext = name.split('.')
+    response = send_file(path, mimetype=IMAGE_TYPES[ext], etag=digest, conditional=True)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 @app.route('/dashboard')
 def dashboard():
     user = session.get('user')
     if not user:
         return redirect(url_for('login'))
     
-    tasks_tree, stats = manager.list_tasks(user['id'])
+    stats = get_stats(user['id'])
     return render_template('dashboard.html', user=user, stats=stats)
 
+# /metrics shows pool and cache internals: only to requests with this token in X-Metrics-Token,
+# or, when it is not set, to requests from the machine itself
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+def metrics_allowed():
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), METRICS_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/metrics')
+def metrics():
+    if not metrics_allowed():
+        abort(404)
+    return jsonify({
+        'db_pool': get_pool_stats(),
+        'forest_cache': forest_cache.stats(),
+        'search_index': search_index.stats(),
+        'tag_ids': tag_ids.stats(),
+        'ai_jobs': ai_jobs.stats(),
+        'ai_suggestion_cache': suggestion_cache.stats(),
+    })
+
 @app.route('/login')
 def login():
     redirect_uri = os.getenv('GOOGLE_REDIRECT_URI')
@@ -220,7 +321,8 @@ def duplicate_task(task_id):
     if not user:
         return redirect(url_for('login'))
         
-    manager.duplicate_task(user['id'], task_id)
+    # ?times=N makes N copies at once
+    manager.duplicate_task(user['id'], task_id, request.args.get('times', 1, type=int))
     return redirect(request.referrer or url_for('index'))
 
 @app.route('/complete/<int:task_id>')
@@ -238,7 +340,8 @@ def uncomplete_task(task_id):
     if not user:
         return redirect(url_for('login'))
         
-    manager.uncomplete_task(user['id'], task_id)
+    # ?cascade=1 also reopens the completed subtasks
+    manager.uncomplete_task(user['id'], task_id, cascade=request.args.get('cascade') == '1')
     return redirect(url_for('index'))
 
 @app.route('/toggle_folding/<int:task_id>')
@@ -250,6 +353,40 @@ def toggle_folding(task_id):
     success = manager.toggle_task_folding(user['id'], task_id)
     return {"success": success}
 
+@app.route('/ai_status')
+def ai_status():
+    """Background suggestion state of ?ids=1,2,3, with the rendered suggestions once they are in."""
+    user = session.get('user')
+    if not user:
+        return {"success": False}, 401
+
+    ids = [part for part in request.args.get('ids', '').split(',') if part.strip().isdigit()]
+    render_suggestions = get_template_attribute('macros.html', 'render_ai_suggestions')
+    tasks = {}
+    for task_id, task in manager.get_ai_status(user['id'], ids).items():
+        tasks[task_id] = {"ai_status": task['ai_status']}
+        if task['ai_status'] != 'pending':
+            tasks[task_id]["html"] = str(render_suggestions(task))
+    return {"success": True, "tasks": tasks}
+
+@app.route('/move_task/<int:task_id>', methods=['POST'])
+def move_task(task_id):
+    user = session.get('user')
+    if not user:
+        return {"success": False}, 401
+
+    success = manager.move_task(user['id'], task_id, request.form.get('parent_id'))
+    return {"success": success}
+
+@app.route('/shift_branch/<int:task_id>', methods=['POST'])
+def shift_branch(task_id):
+    user = session.get('user')
+    if not user:
+        return {"success": False}, 401
+
+    success = manager.shift_branch(user['id'], task_id, request.form.get('days'))
+    return {"success": success}
+
 @app.route('/clear_suggestion/<int:task_id>')
 def clear_suggestion(task_id):
     user = session.get('user')
@@ -0,0 +1,91 @@
+"""
+Benchmark: completing a branch with one UPDATE through task_closure vs the old
+fetch-the-ids-then-UPDATE ... WHERE id IN (...) pattern, on a deep (chains of
+DEEP_CHAIN tasks under one root) and a wide (one root, all children) synthetic tree. Needs the database; every
+run is rolled back.
+
+    python bench_completion.py              # 10k tasks per tree
+    python bench_completion.py 50000        # custom size
+"""
+import sys
+import time
+
+from db_manager import get_db_connection
+from task_closure import SUBTREE_IDS_QUERY, insert_task_closure
+from task_manager import COMPLETE_SUBTREE_QUERY
+
+# Chain length of the deep tree (closure rows grow with the square of it)
+DEEP_CHAIN = 200
+
+
+def seed_tree(cursor, user_id, count, deep):
+    parent_id = None
+    root_id = None
+    for i in range(count):
+        cursor.execute("INSERT INTO tasks (title, user_id, parent_id, time_minutes) VALUES (%s, %s, %s, 5)",
+                       (f"Bench task {i}", user_id, parent_id))
+        task_id = cursor.lastrowid
+        insert_task_closure(cursor, task_id, parent_id)
+        if root_id is None:
+            root_id = task_id
+        parent_id = task_id if deep and i % DEEP_CHAIN else root_id
+    return root_id
+
+
+def ids_then_update(cursor, user_id, root_id):
+    cursor.execute(SUBTREE_IDS_QUERY, (root_id, user_id))
+    ids = [row[0] for row in cursor.fetchall()]
+    placeholders = ','.join(['%s'] * len(ids))
+    cursor.execute(f"UPDATE tasks SET status = 'completed', completed_at = NOW() WHERE id IN ({placeholders})", tuple(ids))
+    return cursor.rowcount
+
+
+def single_update(cursor, user_id, root_id):
+    cursor.execute(COMPLETE_SUBTREE_QUERY, (root_id, user_id))
+    return cursor.rowcount
+
+
+def measure(conn, cursor, label, fn, *args):
+    best = None
+    for _ in range(3):
+        conn.start_transaction()
+        start = time.perf_counter()
+        rows = fn(cursor, *args)
+        elapsed = (time.perf_counter() - start) * 1000
+        conn.rollback()
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<30}{best:>10,.1f} ms  ({rows:,} rows)")
+
+
+def run(count):
+    conn = get_db_connection()
+    if not conn:
+        print("No database connection.")
+        return
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('bench_completion', 'bench_completion@example.com', 'Completion bench'))
+        user_id = cursor.lastrowid
+        for shape, deep in [('deep', True), ('wide', False)]:
+            root_id = seed_tree(cursor, user_id, count, deep)
+            conn.commit()
+            print(f"\n{shape} tree, {count:,} tasks")
+            measure(conn, cursor, "ids + UPDATE ... IN (...)", ids_then_update, user_id, root_id)
+            measure(conn, cursor, "single closure UPDATE", single_update, user_id, root_id)
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            conn.commit()
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,60 @@
+"""
+Benchmark: InfoPanelManager.calculate_stats, python vs numpy backend.
+
+    python bench_info_panel.py                  # 100k and 500k tasks
+    python bench_info_panel.py 1000000          # custom sizes
+"""
+import random
+import sys
+import time
+
+from info_panel_manager import InfoPanelManager, np
+from task_forest import TaskForest
+
+IMPORTANCES = [None, None, None, 'Important', 'Medium', 'Normal']
+TAGS = [f"tag{i}" for i in range(200)]
+
+
+def synthetic_tasks(count, seed=1):
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(1, count + 1):
+        # Mostly shallow trees with some long chains, like real task lists
+        parent_id = None
+        if i > 1 and rng.random() < 0.8:
+            parent_id = i - 1 if rng.random() < 0.3 else rng.randint(max(1, i - 1000), i - 1)
+        tags = [{'name': rng.choice(TAGS)}] if rng.random() < 0.2 else []
+        tasks.append({
+            'id': i,
+            'parent_id': parent_id,
+            'status': 'completed' if rng.random() < 0.3 else 'pending',
+            'time_minutes': rng.choice([0, 5, 15, 30, 60]),
+            'importance': rng.choice(IMPORTANCES),
+            'tags': tags,
+        })
+    return tasks
+
+
+def measure(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"  {label:<30}{(time.perf_counter() - start) * 1000:>10,.0f} ms")
+    return result
+
+
+def run(count):
+    tasks = synthetic_tasks(count)
+    print(f"\n{count:,} tasks")
+    forest = measure("TaskForest build", lambda: TaskForest.from_tasks(tasks))
+    expected = measure("python backend", lambda: InfoPanelManager.calculate_stats(tasks, forest, backend='python'))
+    if np is None:
+        print("  numpy not installed, skipping the array backend")
+        return
+    actual = measure("numpy backend", lambda: InfoPanelManager.calculate_stats(tasks, forest, backend='numpy'))
+    assert actual == expected
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 500000]
+    for size in sizes:
+        run(size)
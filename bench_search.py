@@ -0,0 +1,68 @@
+"""
+Benchmark: trigram index (trigram_index.py) vs SearchManager.filter_tasks
+for search-as-you-type on synthetic accounts.
+
+    python bench_search.py                   # 10k, 100k and 1M tasks
+    python bench_search.py 10000 100000      # custom sizes
+"""
+import random
+import sys
+import time
+
+from search_manager import SearchManager
+from trigram_index import UserSearchIndex
+
+COMMON_WORDS = ['report', 'invoice', 'call', 'plumber', 'review', 'draft', 'budget', 'meeting', 'garden', 'email',
+                'release', 'backup', 'doctor', 'tickets', 'groceries', 'proposal', 'deploy', 'refactor', 'taxes', 'birthday']
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tor', 'va', 'qui', 'sel', 'dun', 'ph', 'ex', 'mar', 'io', 'zet', 'bra']
+TAGS = ['work', 'home', 'finance', 'health', 'urgent', 'someday', 'errands', 'family']
+QUERIES = ['rep', 'invoce', 'plumber', 'budget meet', 'fin']
+
+
+def synthetic_tasks(count, seed=1):
+    rng = random.Random(seed)
+    # A few common words plus a long tail of made-up ones, roughly like real titles
+    words = COMMON_WORDS + [''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(5000)]
+    tasks = []
+    for i in range(count):
+        tags = [{'id': rng.randrange(len(TAGS)), 'name': rng.choice(TAGS)}] if rng.random() < 0.4 else []
+        tasks.append({
+            'id': i + 1,
+            'parent_id': rng.randint(1, i) if i and rng.random() < 0.7 else None,
+            'title': f"{rng.choice(COMMON_WORDS)} {' '.join(rng.sample(words, 2))} {i}",
+            'importance': rng.choice(['Normal', 'Important', 'Medium']),
+            'tags': tags,
+        })
+    return tasks
+
+
+def _time(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(count):
+    tasks = synthetic_tasks(count)
+    start = time.perf_counter()
+    index = UserSearchIndex.build(
+        1,
+        [(t['id'], t['parent_id'], t['title']) for t in tasks],
+        [(t['id'], tag['id'], tag['name']) for t in tasks for tag in t['tags']],
+        list(enumerate(TAGS)),
+    )
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"\n{count:,} tasks  (index build {build_ms:,.0f} ms)")
+    print(f"  {'query':<14}{'filter_tasks ms':>18}{'trigram ms':>14}")
+    repeat = max(1, 100000 // count)
+    for query in QUERIES:
+        scan_ms = _time(lambda: SearchManager.filter_tasks(tasks, search_query=query), repeat)
+        index_ms = _time(lambda: index.suggest(query, 10), repeat)
+        print(f"  {query:<14}{scan_ms:>18.2f}{index_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,105 @@
+"""
+Benchmark: TaskForest vs the dict/list + recursion code it replaced.
+
+    python bench_task_forest.py             # 1M tasks
+    python bench_task_forest.py 100000      # custom size
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from task_forest import TaskForest
+
+
+def synthetic_rows(count, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, count + 1):
+        # Mostly shallow trees with some long chains, like real task lists
+        parent_id = None
+        if i > 1 and rng.random() < 0.8:
+            parent_id = i - 1 if rng.random() < 0.3 else rng.randint(max(1, i - 1000), i - 1)
+        rows.append((i, parent_id))
+    return rows
+
+
+def dict_tree(rows):
+    """The old pattern: a children map of lists and BFS with list.pop(0)."""
+    children_map = {}
+    for tid, pid in rows:
+        if pid:
+            children_map.setdefault(pid, []).append(tid)
+    return children_map
+
+
+def dict_walk(children_map, roots):
+    ids = list(roots)
+    queue = list(roots)
+    while queue:
+        current = queue.pop(0)
+        children = children_map.get(current, [])
+        ids.extend(children)
+        queue.extend(children)
+    return ids
+
+
+def dict_branch_totals(rows, children_map, minutes):
+    # Post-order without recursion (the recursive version overflows on long chains)
+    totals = {}
+    roots = [tid for tid, pid in rows if not pid]
+    stack = [(tid, False) for tid in roots]
+    while stack:
+        tid, done = stack.pop()
+        if done:
+            totals[tid] = minutes + sum(totals[c] for c in children_map.get(tid, ()))
+        else:
+            stack.append((tid, True))
+            stack.extend((c, False) for c in children_map.get(tid, ()))
+    return totals
+
+
+def forest_branch_totals(forest, minutes):
+    totals = {}
+    for tid in forest.postorder():
+        totals[tid] = minutes + sum(totals[c] for c in forest.children(tid))
+    return totals
+
+
+def measure(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    # Memory is measured in a second run, tracemalloc slows everything down
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<38}{elapsed:>10,.0f} ms{peak / 1024 / 1024:>10,.1f} MB peak")
+    return result
+
+
+def run(count):
+    rows = synthetic_rows(count)
+    roots = [tid for tid, pid in rows if not pid]
+    print(f"\n{count:,} tasks, {len(roots):,} roots")
+
+    children_map = measure("dict build", lambda: dict_tree(rows))
+    forest = measure("TaskForest build", lambda: TaskForest.from_rows(rows))
+
+    # The old BFS is quadratic in the queue length, so it only walks the first 20k roots
+    some_roots = roots[:20000]
+    measure("dict walk, 20k roots (BFS pop(0))", lambda: dict_walk(children_map, some_roots))
+    measure("TaskForest walk, 20k roots", lambda: [tid for root in some_roots for tid in forest.preorder(root)])
+    measure("TaskForest walk, whole forest", lambda: list(forest.preorder()))
+
+    measure("dict branch totals", lambda: dict_branch_totals(rows, children_map, 5))
+    measure("TaskForest branch totals", lambda: forest_branch_totals(forest, 5))
+
+    measure("TaskForest ancestors of every task", lambda: sum(1 for tid, _ in rows for _ in forest.ancestors(tid)))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000000]
+    for size in sizes:
+        run(size)
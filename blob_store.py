@@ -0,0 +1,175 @@
+"""
+Content-addressed storage for images embedded in task descriptions.
+
+Files are named after the SHA-256 of their content, so identical uploads are
+stored once and a URL never changes meaning, which lets browsers cache them
+forever. Files live on local disk under BLOB_STORE_DIR, sharded by hash prefix.
+
+Run `python blob_store.py` once to move inline base64 images out of existing
+descriptions.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+IMAGE_URL_PREFIX = '/images/'
+
+# Extension -> mimetype for the formats we accept
+IMAGE_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+_NAME_RE = re.compile(r'^([0-9a-f]{64})\.(jpg|png|gif|webp)$')
+_DATA_URL_RE = re.compile(r'data:image/[a-zA-Z0-9.+-]+;base64,([A-Za-z0-9+/=\s]+)')
+
+
+def sniff_image_type(data):
+    """Returns the file extension for supported image bytes, or None. The client's content type is not trusted."""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class BlobStore:
+    def __init__(self, root=BLOB_STORE_DIR):
+        self.root = root
+
+    def put(self, data):
+        """Stores image bytes and returns their name (<sha256>.<ext>). Returns None for unsupported data."""
+        ext = sniff_image_type(data)
+        if not ext:
+            return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{digest}.{ext}"
+        path = self._path(name)
+        if os.path.exists(path):
+            return name  # Already stored (dedupe)
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def path_for(self, name):
+        """Returns the file path for a stored blob name, or None if the name is invalid or unknown."""
+        if not _NAME_RE.match(name or ''):
+            return None
+        path = self._path(name)
+        return path if os.path.exists(path) else None
+
+    def _path(self, name):
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+
+def image_url(name):
+    return IMAGE_URL_PREFIX + name
+
+
+def rewrite_inline_images(description, store):
+    """
+    Replaces base64 data URL images in a description with URLs of stored blobs.
+    Returns (new_description, number_of_images_moved). Undecodable images are left untouched.
+    """
+    if not description or 'data:image/' not in description:
+        return description, 0
+
+    moved = 0
+
+    def replace(match):
+        nonlocal moved
+        try:
+            data = base64.b64decode(''.join(match.group(1).split()), validate=True)
+        except (binascii.Error, ValueError):
+            return match.group(0)
+        name = store.put(data)
+        if not name:
+            return match.group(0)
+        moved += 1
+        return image_url(name)
+
+    return _DATA_URL_RE.sub(replace, description), moved
+
+
+def backfill_inline_images(store=None, batch_size=20):
+    """
+    Streams through all descriptions that still contain inline images and rewrites
+    them to blob URLs, committing one small batch at a time.
+    """
+    from db_manager import get_db_connection
+    from description_utils import description_columns
+    from mysql.connector import Error
+
+    store = store or BlobStore()
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    last_id = 0
+    total_tasks = 0
+    total_images = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id, description FROM tasks
+                WHERE id > %s AND description LIKE %s
+                ORDER BY id LIMIT %s
+            """, (last_id, '%data:image/%', batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for task_id, description in rows:
+                new_description, moved = rewrite_inline_images(description, store)
+                if moved:
+                    updates.append((new_description,) + description_columns(new_description) + (task_id,))
+                    total_images += moved
+            if updates:
+                cursor.executemany(
+                    "UPDATE tasks SET description = %s, description_preview = %s, has_description = %s WHERE id = %s",
+                    updates)
+            conn.commit()
+            total_tasks += len(updates)
+            last_id = rows[-1][0]
+
+        print(f"Moved {total_images} inline images out of {total_tasks} task descriptions.")
+        return True
+    except Error as e:
+        print(f"Error backfilling inline images: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    backfill_inline_images()
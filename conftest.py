@@ -0,0 +1,19 @@
+import pytest
+
+from db_manager import get_db_connection
+
+
+@pytest.fixture(scope='session')
+def database_available():
+    conn = get_db_connection()
+    if not conn:
+        return False
+    conn.close()
+    return True
+
+
+@pytest.fixture
+def requires_database(database_available):
+    """Skip (instead of silently passing) tests that need MySQL when there is none."""
+    if not database_available:
+        pytest.skip("No database connection")
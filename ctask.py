@@ -1,21 +1,106 @@
-from db_manager import get_db_connection
+from db_manager import get_db_connection, bump_user_data_version
+from forest_cache import forest_cache
+from trigram_index import search_index
+from task_forest import TaskForest
+from task_closure import ANCESTOR_IDS_QUERY
+from stats_service import lock_rollup, subtree_stats, apply_stats_delta
+from tag_store import link_tags
 import json
 from mysql.connector import Error
 
+TASK_TAGS_QUERY = """
+    SELECT t.id, t.name
+    FROM tags t
+    JOIN task_tags tt ON t.id = tt.tag_id
+    WHERE tt.task_id = %s
+"""
+
+
 class CTask:
-    def __init__(self, user_id, task_id):
+    """
+    One task of a user. Fields and tags are loaded on first access (or all at once
+    for many tasks with load_many), so a CTask used only for a write or an export
+    costs no extra queries. Pass `conn` to run everything on the caller's connection;
+    it is then left open.
+    """
+
+    __slots__ = ('user_id', 'task_id', '_conn', '_fields', '_tags')
+
+    def __init__(self, user_id, task_id, conn=None):
         self.user_id = user_id
         try:
             self.task_id = int(task_id)
         except (ValueError, TypeError):
             self.task_id = task_id # Fallback if not convertible, though usually should be
-        self.fields = {}
-        self.tags = []
-        self._load_task()
-        self._load_tags()
+        self._conn = conn
+        self._fields = None
+        self._tags = None
+
+    @classmethod
+    def load_many(cls, user_id, task_ids, conn=None):
+        """
+        Load the user's tasks among task_ids with one query for the rows and one for
+        the tags. Returns {task_id: CTask}; ids that are missing or not the user's are left out.
+        """
+        task_ids = list(dict.fromkeys(int(task_id) for task_id in task_ids))
+        tasks = {}
+        if not task_ids:
+            return tasks
+        own_conn = conn is None
+        if own_conn:
+            conn = get_db_connection()
+        if not conn:
+            return tasks
+        try:
+            cursor = conn.cursor(dictionary=True)
+            placeholders = ', '.join(['%s'] * len(task_ids))
+            cursor.execute(f"SELECT * FROM tasks WHERE user_id = %s AND id IN ({placeholders})", (user_id, *task_ids))
+            for row in cursor.fetchall():
+                ctask = cls(user_id, row['id'], None if own_conn else conn)
+                ctask._fields = row
+                ctask._tags = []
+                tasks[row['id']] = ctask
+            if tasks:
+                placeholders = ', '.join(['%s'] * len(tasks))
+                cursor.execute(f"""
+                    SELECT tt.task_id, t.id, t.name
+                    FROM task_tags tt
+                    JOIN tags t ON t.id = tt.tag_id
+                    WHERE tt.task_id IN ({placeholders})
+                """, tuple(tasks))
+                for row in cursor.fetchall():
+                    tasks[row['task_id']]._tags.append({'id': row['id'], 'name': row['name']})
+        except Error as e:
+            print(f"Error loading tasks in CTask.load_many: {e}")
+        finally:
+            cursor.close()
+            if own_conn:
+                conn.close()
+        return tasks
+
+    def _connection(self):
+        return self._conn if self._conn is not None else get_db_connection()
+
+    def _release(self, conn):
+        if conn is not self._conn:
+            conn.close()
+
+    @property
+    def fields(self):
+        """The task's row ({} if it does not exist or is not the user's)."""
+        if self._fields is None:
+            self._load_task()
+        return self._fields
+
+    @property
+    def tags(self):
+        if self._tags is None:
+            self._load_tags()
+        return self._tags
 
     def _load_task(self):
-        conn = get_db_connection()
+        self._fields = {}
+        conn = self._connection()
         if conn:
             try:
                 cursor = conn.cursor(dictionary=True)
@@ -23,178 +108,160 @@ class CTask:
                 cursor.execute(query, (self.task_id, self.user_id))
                 row = cursor.fetchone()
                 if row:
-                    self.fields = row
+                    self._fields = row
             except Error as e:
                 print(f"Error loading task in CTask: {e}")
             finally:
                 cursor.close()
-                conn.close()
+                self._release(conn)
 
     def _load_tags(self):
-        conn = get_db_connection()
+        self._tags = []
+        conn = self._connection()
         if conn:
             try:
                 cursor = conn.cursor(dictionary=True)
-                query = """
-                    SELECT t.id, t.name 
-                    FROM tags t
-                    JOIN task_tags tt ON t.id = tt.tag_id
-                    WHERE tt.task_id = %s
-                """
-                cursor.execute(query, (self.task_id,))
-                self.tags = cursor.fetchall()
+                cursor.execute(TASK_TAGS_QUERY, (self.task_id,))
+                self._tags = cursor.fetchall()
             except Error as e:
                 print(f"Error loading tags in CTask: {e}")
             finally:
                 cursor.close()
-                conn.close()
+                self._release(conn)
 
     def add_tag(self, tag_name):
         """Ensure tag exists for user and then link it to this task."""
-        conn = get_db_connection()
+        conn = self._connection()
         if not conn:
             return False
         try:
             cursor = conn.cursor()
-            # 1. Get or create tag
-            tag_name = tag_name.lower().strip()
-            if tag_name.startswith('#'):
-                tag_name = tag_name[1:]
-            
-            if not tag_name:
+            rollup_fresh = lock_rollup(cursor, self.user_id)
+            stats_before = subtree_stats(cursor, self.user_id, self.task_id)
+            links = link_tags(cursor, self.user_id, self.task_id, [tag_name])
+            if not links:
+                conn.rollback()
                 return False
-
-            cursor.execute("SELECT id FROM tags WHERE name = %s AND user_id = %s", (tag_name, self.user_id))
-            row = cursor.fetchone()
-            if row:
-                tag_id = row[0]
-            else:
-                cursor.execute("INSERT INTO tags (name, user_id) VALUES (%s, %s)", (tag_name, self.user_id))
-                conn.commit()
-                tag_id = cursor.lastrowid
-
-            # 2. Link to task
-            cursor.execute("INSERT IGNORE INTO task_tags (task_id, tag_id) VALUES (%s, %s)", (self.task_id, tag_id))
+            apply_stats_delta(cursor, self.user_id, stats_before, subtree_stats(cursor, self.user_id, self.task_id), rollup_fresh)
+            version = bump_user_data_version(cursor, self.user_id)
             conn.commit()
-            self._load_tags() # Refresh in-memory tags
+            forest_cache.invalidate(self.user_id)
+            search_index.tags_linked(self.user_id, version, self.task_id, links)
+            self._tags = None # Reloaded on next access
             return True
         except Error as e:
             print(f"Error adding tag in CTask: {e}")
+            conn.rollback()
             return False
         finally:
             cursor.close()
-            conn.close()
+            self._release(conn)
 
     def remove_tag(self, tag_id):
         """Unlink tag from this task."""
-        conn = get_db_connection()
+        conn = self._connection()
         if not conn:
             return False
         try:
             cursor = conn.cursor()
-            query = "DELETE FROM task_tags WHERE task_id = %s AND tag_id = %s"
-            cursor.execute(query, (self.task_id, tag_id))
+            rollup_fresh = lock_rollup(cursor, self.user_id)
+            stats_before = subtree_stats(cursor, self.user_id, self.task_id)
+            query = """
+                DELETE tt FROM task_tags tt
+                JOIN tasks t ON t.id = tt.task_id
+                WHERE tt.task_id = %s AND tt.tag_id = %s AND t.user_id = %s
+            """
+            cursor.execute(query, (self.task_id, tag_id, self.user_id))
+            apply_stats_delta(cursor, self.user_id, stats_before, subtree_stats(cursor, self.user_id, self.task_id), rollup_fresh)
+            version = bump_user_data_version(cursor, self.user_id)
             conn.commit()
-            self._load_tags() # Refresh in-memory tags
+            forest_cache.invalidate(self.user_id)
+            search_index.tag_unlinked(self.user_id, version, self.task_id, tag_id)
+            self._tags = None # Reloaded on next access
             return True
         except Error as e:
             print(f"Error removing tag in CTask: {e}")
+            conn.rollback()
             return False
         finally:
             cursor.close()
-            conn.close()
+            self._release(conn)
 
     def get_tags(self):
         return self.tags
 
     def get_full_task_structure_json(self):
         """Returns the full task structure in JSON for the branch this task belongs to."""
-        conn = get_db_connection()
+        conn = self._connection()
         if not conn:
             return None
         
         try:
             cursor = conn.cursor(dictionary=True)
-            # 1. Fetch all tasks for this user
-            query = "SELECT id, title, parent_id FROM tasks WHERE user_id = %s"
-            cursor.execute(query, (self.user_id,))
-            all_user_tasks = cursor.fetchall()
-            
-            if not all_user_tasks:
+            # 1. Find the root of the branch containing self.task_id
+            cursor.execute(ANCESTOR_IDS_QUERY + " LIMIT 1", (self.task_id, self.user_id))
+            row = cursor.fetchone()
+            if not row:
                 return None
-            
-            # Map of task_id to task data
-            task_map = {t['id']: t for t in all_user_tasks}
-            
-            # 2. Find the root of the branch containing self.task_id
-            curr_id = self.task_id
-            if curr_id not in task_map:
-                # If current task is not in map (e.g. just deleted or wrong ID), load it individually
-                self._load_task()
-                if not self.fields:
-                    return None
-                curr_id = self.task_id
-                # This case shouldn't really happen if all_user_tasks is fetched correctly
-            
-            # Trace back to the absolute root parent
-            visited = set()
-            while task_map[curr_id]['parent_id'] is not None:
-                if curr_id in visited: # Cycle protection
-                    break
-                visited.add(curr_id)
-                pid = task_map[curr_id]['parent_id']
-                if pid not in task_map:
-                    break
-                curr_id = pid
-            
-            root_id = curr_id
-            
-            # 3. Build children map for efficient lookup
-            children_map = {}
-            for t_id, t_data in task_map.items():
-                pid = t_data['parent_id']
-                if pid not in children_map:
-                    children_map[pid] = []
-                children_map[pid].append(t_data)
-            
-            # 4. Recursive builder
-            def build_node(tid):
+            root_id = row['ancestor_id']
+
+            # 2. Fetch only that branch
+            cursor.execute("""
+                SELECT t.id, t.title, t.parent_id
+                FROM task_closure c
+                JOIN tasks t ON t.id = c.descendant_id
+                WHERE c.ancestor_id = %s AND t.user_id = %s
+                ORDER BY c.depth, t.id
+            """, (root_id, self.user_id))
+            branch_tasks = cursor.fetchall()
+            task_map = {t['id']: t for t in branch_tasks}
+            forest = TaskForest.from_tasks(branch_tasks)
+
+            # 3. Build the nested structure; pre-order visits every parent before its children
+            nodes = {}
+            for tid in forest.preorder(root_id):
                 t = task_map[tid]
-                node = {
+                nodes[tid] = {
                     "id": str(t['id']),
                     "title": t['title'],
                     "subtasks": []
                 }
-                for child in children_map.get(tid, []):
-                    node["subtasks"].append(build_node(child['id']))
-                return node
-            
-            return build_node(root_id)
+                parent_id = forest.parent(tid)
+                if tid != root_id:
+                    nodes[parent_id]["subtasks"].append(nodes[tid])
+
+            return nodes[root_id]
 
         except Error as e:
             print(f"Error in get_full_task_structure_json: {e}")
             return None
         finally:
             cursor.close()
-            conn.close()
+            self._release(conn)
+
     def _save_ai_suggestions(self, suggestions):
         """Helper to save the ai_suggestion JSON to the database."""
-        conn = get_db_connection()
+        conn = self._connection()
         if not conn:
             return False
         try:
             cursor = conn.cursor()
             query = "UPDATE tasks SET ai_suggestion = %s WHERE id = %s AND user_id = %s"
             cursor.execute(query, (json.dumps(suggestions), self.task_id, self.user_id))
+            version = bump_user_data_version(cursor, self.user_id)
             conn.commit()
-            self._load_task() # Refresh fields
+            forest_cache.invalidate(self.user_id)
+            search_index.advance(self.user_id, version)
+            if self._fields:
+                self._fields['ai_suggestion'] = json.dumps(suggestions)
             return True
         except Error as e:
             print(f"Error saving AI suggestions in CTask: {e}")
+            conn.rollback()
             return False
         finally:
             cursor.close()
-            conn.close()
+            self._release(conn)
 
     def remove_ai_suggestion(self, item_text):
         """Remove a specific item from the AI suggestion list."""
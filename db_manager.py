@@ -2,188 +2,307 @@ import mysql.connector
 from mysql.connector import Error
 from dotenv import load_dotenv
 import os
+import threading
+import time
 
 load_dotenv()
 
+# Pool tuning (see get_pool_stats() / the /metrics route when adjusting these)
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+# Idle connections older than this (seconds) are pinged before being handed out
+POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', 10))
+
+
+class PoolTimeout(Error):
+    """Raised when no pooled connection became available within the timeout."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a raw MySQL connection checked out from a ConnectionPool.
+    Everything is delegated to the raw connection, except close(), which hands
+    the connection back to the pool instead of tearing down the socket.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def is_connected(self):
+        return self._raw is not None and self._raw.is_connected()
+
+    def close(self):
+        self.release()
+
+    def release(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.checkin(raw)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise Error("Connection has already been returned to the pool")
+        return getattr(self._raw, name)
+
+
+class RequestConnection(PooledConnection):
+    """
+    Connection shared by everything that runs inside one Flask request.
+    close() is a no-op so TaskManager/CTask code can keep its usual
+    open/close pattern; the connection is released at request teardown.
+    """
+
+    def close(self):
+        pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MySQL connections.
+
+    Keeps up to `size` idle connections around and allows `max_overflow`
+    extra ones under load. Callers wait up to `timeout` seconds when the pool
+    is exhausted. Idle connections are health-checked on checkout and
+    transparently replaced when the server dropped them.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 timeout=POOL_TIMEOUT, ping_interval=POOL_PING_INTERVAL):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.pid = os.getpid()
+        self._idle = []  # (raw, returned_at), used LIFO to keep hot connections hot
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    def checkout(self):
+        """Return a raw connection, creating or waiting for one as needed."""
+        raw, returned_at = self._reserve()
+
+        if raw is not None:
+            if time.monotonic() - returned_at < self.ping_interval or self._is_healthy(raw):
+                return raw
+            # Stale connection: drop it and reuse its slot for a fresh one
+            self._close_quietly(raw)
+            with self._cond:
+                self._stats['discarded'] += 1
+
+        try:
+            raw = self._connect()
+        except Error:
+            with self._cond:
+                self._open -= 1
+                self._stats['failures'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return raw
+
+    def checkin(self, raw):
+        """Return a connection to the pool, ending any open transaction first."""
+        healthy = True
+        try:
+            # Never leak an open transaction (or its REPEATABLE READ snapshot) to the next user
+            raw.rollback()
+        except Error:
+            healthy = False
+
+        with self._cond:
+            if healthy and len(self._idle) < self.size:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            else:
+                self._open -= 1
+                self._stats['discarded'] += 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._close_quietly(raw)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+            })
+            return stats
+
+    def _reserve(self):
+        """Take an idle connection or a slot for a new one, waiting if the pool is exhausted."""
+        with self._cond:
+            self._stats['checkouts'] += 1
+            deadline = None
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    return None, 0
+                if deadline is None:
+                    self._stats['waits'] += 1
+                    deadline = time.monotonic() + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+
+    def _is_healthy(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Error:
+            with self._cond:
+                self._stats['failures'] += 1
+            return False
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Error:
+            pass
+
+
+def _connect():
+    return mysql.connector.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        database=os.getenv('MYSQL_DATABASE'),
+        user=os.getenv('MYSQL_USER'),
+        password=os.getenv('MYSQL_PASSWORD')
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it lazily (and again after a fork)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            # Connections inherited from a parent process (e.g. gunicorn --preload) must not be shared
+            _pool = ConnectionPool(_connect)
+        return _pool
+
+
+def get_pool_stats():
+    """Checkout/wait/failure counters and current occupancy of the connection pool."""
+    return get_pool().stats()
+
+
+def _checkout():
+    pool = get_pool()
+    return PooledConnection(pool, pool.checkout())
+
+
 def get_db_connection():
-    """Connect to the MySQL database."""
+    """
+    Get a pooled connection to the MySQL database.
+    Inside a Flask request all callers share one connection, which is
+    returned to the pool when the request ends (see init_app).
+    """
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            database=os.getenv('MYSQL_DATABASE'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD')
-        )
-        if connection.is_connected():
-            return connection
+        if _request_scoped():
+            from flask import g
+            conn = g.get('_db_connection')
+            if conn is None:
+                pool = get_pool()
+                conn = RequestConnection(pool, pool.checkout())
+                g._db_connection = conn
+            return conn
+        return _checkout()
     except Error as e:
         print(f"Error while connecting to MySQL: {e}")
         return None
 
-def initialize_database():
-    """Create the tasks table if it doesn't exist."""
+
+def _request_scoped():
     try:
-        # Connect without database to create it if needed
-        conn = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD')
-        )
-        cursor = conn.cursor()
-        
-        db_name = os.getenv('MYSQL_DATABASE')
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
-        conn.database = db_name
-        
-        create_users_table_query = """
-        CREATE TABLE IF NOT EXISTS users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            google_id VARCHAR(255) UNIQUE NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            name VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-        cursor.execute(create_users_table_query)
-
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            status VARCHAR(50) DEFAULT 'pending',
-            parent_id INT,
-            time_minutes INT DEFAULT 0,
-            ai_suggestion TEXT,
-            importance VARCHAR(50),
-            description TEXT,
-            hide_until TIMESTAMP NULL,
-            completed_at TIMESTAMP NULL,
-            due_at TIMESTAMP NULL,
-            user_id INT,
-            is_folded INT DEFAULT 0,
-            level INT DEFAULT 0,
-            branch_id VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )
-        """
-        cursor.execute(create_table_query)
-
-        create_tags_table_query = """
-        CREATE TABLE IF NOT EXISTS tags (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            user_id INT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE KEY unique_tag_user (name, user_id),
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )
-        """
-        cursor.execute(create_tags_table_query)
-
-        create_task_tags_table_query = """
-        CREATE TABLE IF NOT EXISTS task_tags (
-            task_id INT NOT NULL,
-            tag_id INT NOT NULL,
-            PRIMARY KEY (task_id, tag_id),
-            FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,
-            FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
-        )
-        """
-        cursor.execute(create_task_tags_table_query)
-        
-        # Check if user_id column exists (migration 1)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'user_id'")
-        if not cursor.fetchone():
-            print("Adding user_id column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN user_id INT")
-            cursor.execute("ALTER TABLE tasks ADD CONSTRAINT fk_user_id FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE")
-
-        # Check description column type (migration 2 - Rich Text Support)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'description'")
-        col_info = cursor.fetchone()
-        if col_info and 'text' in col_info[1].lower() and 'longtext' not in col_info[1].lower():
-            print("Upgrading description column to LONGTEXT for image support...")
-            cursor.execute("ALTER TABLE tasks MODIFY COLUMN description LONGTEXT")
-        
-        # Original FK line seemed misplaced or redundant in migration 2 logic, restoring context or safely removing if duplicate. 
-        # Line 109 in original was `cursor.execute("ALTER TABLE tasks ADD CONSTRAINT fk_user ...")` 
-        # But wait, looking at context, line 109 was INDENTED poorly. 
-        # Also, is it needed? Migration 1 added fk_user_id. Migration 2 checks description.
-        # The line 109 `fk_user` constraint seems misplaced leftovers from a successful/failed copy-paste or previous migration logic.
-        # If I look at `initialize_database`:
-        # `create_table_query` has `FOREIGN KEY (user_id) REFERENCES users(id)`.
-        # Migration 1 adds `user_id` and `fk_user_id`.
-        # Migration 2 updates `description`. 
-        # I should probably just fix the indentation of the migration 2 block and ignoring line 109 if it's garbage, or fixing it if it was intended. 
-        # Line 109 `fk_user` seems like it might be a mistake from my previous edit. 
-        # I will REMOVE line 109 as `fk_user` constraint on `user_id` was already handled in migration 1 (as `fk_user_id`).
-        # So I will just close the if block properly.
-
-        # Check if description column exists (migration 3)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'description'")
-        if not cursor.fetchone():
-            print("Adding description column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN description TEXT")
-
-        # Check if importance column exists (migration 2)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'importance'")
-        if not cursor.fetchone():
-            print("Adding importance column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN importance VARCHAR(50)")
-
-        # Check if hide_until column exists (migration 4)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'hide_until'")
-        if not cursor.fetchone():
-            print("Adding hide_until column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN hide_until TIMESTAMP NULL")
-
-        # Check if completed_at column exists (migration 5)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'completed_at'")
-        if not cursor.fetchone():
-            print("Adding completed_at column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN completed_at TIMESTAMP NULL")
-
-        # Check if due_at column exists (migration 6)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'due_at'")
-        if not cursor.fetchone():
-            print("Adding due_at column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN due_at TIMESTAMP NULL")
-
-        # Check if is_folded column exists (migration 7)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'is_folded'")
-        if not cursor.fetchone():
-            print("Adding is_folded column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN is_folded INT DEFAULT 0")
-
-        # Check if level column exists (migration 8)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'level'")
-        if not cursor.fetchone():
-            print("Adding level column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN level INT DEFAULT 0")
-
-        # Check if branch_id column exists (migration 9)
-        cursor.execute("SHOW COLUMNS FROM tasks LIKE 'branch_id'")
-        if not cursor.fetchone():
-            print("Adding branch_id column to tasks table...")
-            cursor.execute("ALTER TABLE tasks ADD COLUMN branch_id VARCHAR(255)")
-
-        # Check if show_completed_tasks column exists (migration 10)
-        cursor.execute("SHOW COLUMNS FROM users LIKE 'show_completed_tasks'")
-        if not cursor.fetchone():
-            print("Adding show_completed_tasks column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN show_completed_tasks INT DEFAULT 1")
-
-        conn.commit()
-        print("Database and tables initialized successfully.")
-        
-    except Error as e:
-        print(f"Error initializing database: {e}")
-    finally:
+        from flask import has_request_context, current_app
+    except ImportError:
+        return False
+    return has_request_context() and 'db_manager' in current_app.extensions
+
+
+def _release_request_connection(exc=None):
+    from flask import g
+    conn = g.pop('_db_connection', None)
+    if conn is not None:
+        conn.release()
+
+
+def init_app(app):
+    """Share one pooled connection per request for the given Flask app."""
+    app.extensions['db_manager'] = True
+    app.teardown_request(_release_request_connection)
+
+def initialize_database():
+    """
+    Check that the schema is up to date with a single version query.
+    Migrations are applied with `python migrations.py`; set DB_AUTO_MIGRATE=1
+    to have this apply them instead (handy for local development).
+    """
+    from migrations import LATEST_VERSION, get_schema_version, migrate
+
+    version = 0
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            version = get_schema_version(cursor)
             cursor.close()
+        finally:
             conn.close()
 
+    if version >= LATEST_VERSION:
+        return True
+
+    if os.getenv('DB_AUTO_MIGRATE') == '1':
+        return migrate() == LATEST_VERSION
+
+    print(f"Database schema is at version {version}, expected {LATEST_VERSION}. Run `python migrations.py`.")
+    return False
+
+def bump_user_data_version(cursor, user_id):
+    """
+    Increment the user's data version inside the caller's transaction and return the new value.
+    Every write to a user's tasks or tags must call this before committing, so caches in
+    any worker can tell their copy is stale.
+    """
+    cursor.execute("""
+        INSERT INTO user_data_version (user_id, version) VALUES (%s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE version = LAST_INSERT_ID(version + 1)
+    """, (user_id,))
+    return cursor.lastrowid
+
+def get_user_data_version(cursor, user_id):
+    """Current data version of a user (0 before their first write)."""
+    cursor.execute("SELECT version FROM user_data_version WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['version'] if isinstance(row, dict) else row[0]
+
 def get_or_create_user(user_info):
     """Get existing user or create a new one based on Google info."""
     conn = get_db_connection()
@@ -215,4 +334,5 @@ def get_or_create_user(user_info):
     return None
 
 if __name__ == '__main__':
-    initialize_database()
+    from migrations import migrate
+    migrate()
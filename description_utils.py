@@ -0,0 +1,53 @@
+import html
+import re
+
+# Length of the plain-text preview shown under task titles in list views
+PREVIEW_LENGTH = 200
+
+# Upper bound (characters) of tasks.search_text, the FULLTEXT-indexed shadow of title + description
+SEARCH_TEXT_LENGTH = 100000
+
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]*>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def html_to_text(description):
+    """
+    Converts a rich-text (Quill HTML) description to plain text.
+    Tags are dropped together with their attributes, so inline images
+    (including base64 data URLs) never end up in the text.
+    """
+    if not description:
+        return ""
+    text = _COMMENT_RE.sub(' ', description)
+    text = _TAG_RE.sub(' ', text)
+    text = html.unescape(text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def make_description_preview(description, length=PREVIEW_LENGTH):
+    """Returns a short plain-text preview of the description."""
+    text = html_to_text(description)
+    if len(text) > length:
+        text = text[:length - 1].rstrip() + '…'
+    return text
+
+
+def description_columns(description):
+    """
+    Returns (description_preview, has_description) to store next to a description,
+    so list queries never need to read the full LONGTEXT column.
+    """
+    has_description = bool(description and description.strip())
+    preview = make_description_preview(description) if has_description else None
+    return preview or None, 1 if has_description else 0
+
+
+def make_search_text(title, description):
+    """
+    Returns the plain text of title and description stored in tasks.search_text,
+    which backs full-text search. Recompute it whenever either of them changes.
+    """
+    text = f"{title or ''}\n{html_to_text(description)}".strip()
+    return text[:SEARCH_TEXT_LENGTH]
@@ -0,0 +1,127 @@
+"""
+In-process cache of the task forests built by TaskManager.list_tasks.
+
+Every write bumps the user's row in the user_data_version table inside its
+own transaction (db_manager.bump_user_data_version). Readers look that
+version up first and a cached forest is only served while the version it
+was built from is still current, so writes made by other gunicorn workers
+or hosts are never hidden. invalidate() additionally frees the local
+entries right after a write in this process. Entries also carry an
+expiry, because visibility depends on the clock too (hidden tasks
+reappear, period filters move with the day). Least recently used entries
+are evicted once the estimated size of all entries exceeds the memory
+cap.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+FOREST_CACHE_MAX_BYTES = int(float(os.getenv('FOREST_CACHE_MAX_MB', 64)) * 1024 * 1024)
+FOREST_CACHE_TTL = float(os.getenv('FOREST_CACHE_TTL', 300))
+
+
+def estimate_size(value):
+    """Rough deep size in bytes of a forest (dicts, lists and scalars), counting shared objects once."""
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+    return total
+
+
+class ForestCache:
+    def __init__(self, max_bytes=FOREST_CACHE_MAX_BYTES, ttl=FOREST_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, expires_at, size, value)
+        self._user_keys = {}  # user_id -> set of keys, for invalidation
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def invalidate(self, user_id):
+        """Drop a user's cached forests. Call after every committed write."""
+        with self._lock:
+            for key in self._user_keys.pop(user_id, ()):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._bytes = 0
+
+    def get(self, user_id, key, version):
+        """Return the value cached for (user_id, key) at the user's current data version, or None on a miss."""
+        full_key = (user_id, key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                cached_version, expires_at, _, value = entry
+                if cached_version == version and time.time() < expires_at:
+                    self._entries.move_to_end(full_key)
+                    self.hits += 1
+                    return value
+                self._remove(full_key)
+            self.misses += 1
+            return None
+
+    def put(self, user_id, key, value, version, expires_at=None):
+        """
+        Cache a value built from data at `version`. Read the version in the same
+        transaction as the data, before building, so a concurrent write makes it a miss.
+        """
+        expires_at = min(expires_at or float('inf'), time.time() + self.ttl)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        full_key = (user_id, key)
+        with self._lock:
+            self._remove(full_key)
+            self._entries[full_key] = (version, expires_at, size, value)
+            self._user_keys.setdefault(user_id, set()).add(full_key)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, full_key):
+        entry = self._entries.pop(full_key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            keys = self._user_keys.get(full_key[0])
+            if keys:
+                keys.discard(full_key)
+
+
+# Shared by every TaskManager and CTask in the process
+forest_cache = ForestCache()
@@ -1,3 +1,16 @@
+import os
+
+from task_forest import TaskForest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# With numpy installed, lists at least this long use the array backend
+ARRAY_STATS_MIN_TASKS = int(os.getenv('ARRAY_STATS_MIN_TASKS', 20000))
+
+
 class InfoPanelManager:
     """
     Manages logic for calculating statistics to be displayed in the Information Panel.
@@ -5,25 +18,54 @@ class InfoPanelManager:
     """
 
     @staticmethod
-    def calculate_stats(all_tasks):
+    def calculate_stats(all_tasks, forest=None, backend=None):
         """
         Calculates total time, time by importance, and time by tag for a list of tasks.
         Includes subtask time in parent categories (inheritance).
+        Pass the TaskForest of all_tasks if the caller already built one.
+        backend is 'python' or 'numpy'; by default numpy is used for large lists when installed.
         """
+        if backend is None:
+            backend = 'numpy' if np is not None and len(all_tasks) >= ARRAY_STATS_MIN_TASKS else 'python'
+        if backend == 'numpy':
+            return InfoPanelManager._calculate_stats_arrays(all_tasks, forest)
+
         stats = {
             'total_time': 0,
             'importance_summary': {},  # { 'High': 30, 'Medium': 20 ... }
             'tag_summary': {}          # { 'work': 50, 'home': 10 ... }
         }
 
-        # Build a map for quick ancestor lookup if not already provided
         tasks_map = {task['id']: task for task in all_tasks}
+        if forest is None:
+            forest = TaskForest.from_tasks(all_tasks)
 
         # Importance levels we expect
         default_importances = ['Important', 'Medium', 'Normal']
         for imp in default_importances:
             stats['importance_summary'][imp] = 0
 
+        # "Active Categories" of each task (its own + its ancestors'), computed top-down
+        # so every task only extends its parent's sets. Unchanged sets are shared.
+        active_importances = {}
+        active_tags = {}
+        empty = frozenset()
+        for task_id in forest.preorder():
+            task = tasks_map[task_id]
+            parent_id = forest.parent(task_id)
+            importances = active_importances[parent_id] if parent_id is not None else empty
+            tags = active_tags[parent_id] if parent_id is not None else empty
+
+            imp = task.get('importance')
+            if imp and imp not in importances:
+                importances = importances | {imp}
+            names = {tag_obj.get('name') for tag_obj in task.get('tags', []) if tag_obj.get('name')}
+            if not names <= tags:
+                tags = tags | names
+
+            active_importances[task_id] = importances
+            active_tags[task_id] = tags
+
         for task in all_tasks:
             # Global total: Only sum work that is NOT completed
             if task.get('status') == 'completed':
@@ -32,40 +74,137 @@ class InfoPanelManager:
             own_time = task.get('time_minutes', 0) or 0
             stats['total_time'] += own_time
 
-            # Calculate "Active Categories" for this task (Direct + Ancestors)
-            active_importances = set()
-            active_tags = set()
-
-            curr = task
-            while curr:
-                # Importance
-                imp = curr.get('importance')
-                if imp and imp != '':
-                    active_importances.add(imp)
-                
-                # Tags
-                tags = curr.get('tags', [])
-                for tag_obj in tags:
-                    tag_name = tag_obj.get('name')
-                    if tag_name:
-                        active_tags.add(tag_name)
-                
-                # Move to parent
-                parent_id = curr.get('parent_id')
-                curr = tasks_map.get(parent_id) if parent_id else None
-
             # If no importance found in heritage, it's effectively 'Normal'
-            if not active_importances:
-                active_importances.add('Normal')
+            importances = active_importances[task['id']] or ('Normal',)
 
             # Add own_time to all active buckets
-            for imp in active_importances:
+            for imp in importances:
                 stats['importance_summary'][imp] = stats['importance_summary'].get(imp, 0) + own_time
-            
-            for tag in active_tags:
+
+            for tag in active_tags[task['id']]:
                 stats['tag_summary'][tag] = stats['tag_summary'].get(tag, 0) + own_time
 
         # Sort tag summary by time descending
         stats['tag_summary'] = dict(sorted(stats['tag_summary'].items(), key=lambda item: item[1], reverse=True))
 
         return stats
+
+    @staticmethod
+    def _calculate_stats_arrays(all_tasks, forest=None):
+        """
+        calculate_stats on numpy arrays, same result.
+
+        Tasks are laid out in pre-order, so every subtree is a contiguous range and its open
+        minutes are a difference of prefix sums. Inheritance is resolved on those ranges: a
+        task's minutes count for an importance or tag if the range of some task carrying it
+        covers the task, so each bucket is the sum over the outermost carriers (those with no
+        carrier of the same value above them), added up with bincount.
+        """
+        if not all_tasks:
+            return InfoPanelManager.calculate_stats(all_tasks, backend='python')
+        if forest is None:
+            forest = TaskForest.from_tasks(all_tasks)
+        n = len(all_tasks)
+
+        # Per-task arrays, in the order of all_tasks (= forest positions), and a CSR task -> tag matrix
+        minutes = []
+        is_open = []
+        importance = []
+        tag_counts_per_task = []
+        tag_indices = []
+        importance_codes = {}
+        tag_codes = {}
+        for task in all_tasks:
+            minutes.append(task.get('time_minutes', 0) or 0)
+            is_open.append(task.get('status') != 'completed')
+            imp = task.get('importance')
+            importance.append(importance_codes.setdefault(imp, len(importance_codes)) if imp else -1)
+            tags = task.get('tags')
+            if tags:
+                names = {tag_obj.get('name') for tag_obj in tags if tag_obj.get('name')}
+                tag_indices.extend([tag_codes.setdefault(name, len(tag_codes)) for name in names])
+                tag_counts_per_task.append(len(names))
+            else:
+                tag_counts_per_task.append(0)
+        minutes = np.array(minutes, dtype=np.int64)
+        is_open = np.array(is_open, dtype=bool)
+        importance = np.array(importance, dtype=np.int64)
+        tag_indices = np.array(tag_indices, dtype=np.int64)
+        tag_counts_per_task = np.array(tag_counts_per_task, dtype=np.int64)
+
+        parent = np.frombuffer(forest.parent_positions(), dtype=np.int64)
+
+        # Depth by pointer jumping
+        depth = (parent >= 0).astype(np.int64)
+        jump = parent.copy()
+        linked = np.flatnonzero(jump >= 0)
+        while linked.size:
+            depth[linked] += depth[jump[linked]]
+            jump[linked] = jump[jump[linked]]
+            linked = linked[jump[linked] >= 0]
+        by_depth = np.argsort(depth, kind='stable')
+        bounds = np.searchsorted(depth[by_depth], np.arange(depth.max(initial=0) + 2))
+        levels = [by_depth[bounds[level]:bounds[level + 1]] for level in range(len(bounds) - 1)]
+
+        # Subtree sizes bottom-up, then pre-order ranges top-down: a task starts right after
+        # its parent and the subtrees of its earlier siblings (roots: after earlier roots)
+        size = np.ones(n, dtype=np.int64)
+        for nodes in reversed(levels[1:]):
+            np.add.at(size, parent[nodes], size[nodes])
+        by_parent = np.argsort(parent, kind='stable')
+        sibling_sizes = size[by_parent]
+        before = np.cumsum(sibling_sizes) - sibling_sizes
+        group_starts = np.flatnonzero(np.r_[True, parent[by_parent][1:] != parent[by_parent][:-1]])
+        before -= np.repeat(before[group_starts], np.diff(np.r_[group_starts, n]))
+        offset = np.empty(n, dtype=np.int64)
+        offset[by_parent] = before
+        start = np.empty(n, dtype=np.int64)
+        start[levels[0]] = offset[levels[0]]
+        for nodes in levels[1:]:
+            start[nodes] = start[parent[nodes]] + 1 + offset[nodes]
+        end = start + size
+        order = np.empty(n, dtype=np.int64)
+        order[start] = np.arange(n)
+
+        open_minutes = np.where(is_open, minutes, 0)
+        minutes_prefix = np.concatenate(([0], np.cumsum(open_minutes[order])))
+        count_prefix = np.concatenate(([0], np.cumsum(is_open[order])))
+
+        def bucket_sums(carriers, codes, buckets):
+            """Open (minutes, tasks) per code under the outermost carriers of each code."""
+            if not carriers.size:
+                return np.zeros(buckets, dtype=np.int64), np.zeros(buckets, dtype=np.int64)
+            # Offsetting by code keeps each code's ranges apart in one sorted sequence
+            offset = codes * (n + 1)
+            by_start = np.lexsort((start[carriers], codes))
+            carriers = carriers[by_start]
+            starts = start[carriers] + offset[by_start]
+            ends = end[carriers] + offset[by_start]
+            reach = np.concatenate(([-1], np.maximum.accumulate(ends)[:-1]))
+            outer = carriers[starts >= reach]
+            outer_codes = codes[by_start][starts >= reach]
+            sums = minutes_prefix[end[outer]] - minutes_prefix[start[outer]]
+            counts = count_prefix[end[outer]] - count_prefix[start[outer]]
+            return (np.bincount(outer_codes, weights=sums, minlength=buckets).astype(np.int64),
+                    np.bincount(outer_codes, weights=counts, minlength=buckets).astype(np.int64))
+
+        rated = np.flatnonzero(importance >= 0)
+        importance_minutes, importance_counts = bucket_sums(rated, importance[rated], len(importance_codes))
+        rated_minutes, _ = bucket_sums(rated, np.zeros(rated.size, dtype=np.int64), 1)
+        tagged = np.repeat(np.arange(n), tag_counts_per_task)
+        tag_minutes, tag_counts = bucket_sums(tagged, tag_indices, len(tag_codes))
+
+        total = int(open_minutes.sum())
+        stats = {
+            'total_time': total,
+            'importance_summary': {imp: 0 for imp in ['Important', 'Medium', 'Normal']},
+            'tag_summary': {}
+        }
+        for imp, code in importance_codes.items():
+            if importance_counts[code]:
+                stats['importance_summary'][imp] = stats['importance_summary'].get(imp, 0) + int(importance_minutes[code])
+        # Open tasks with no importance anywhere above them count as Normal
+        stats['importance_summary']['Normal'] += total - int(rated_minutes[0])
+        tag_summary = {name: int(tag_minutes[code]) for name, code in tag_codes.items() if tag_counts[code]}
+        stats['tag_summary'] = dict(sorted(tag_summary.items(), key=lambda item: item[1], reverse=True))
+        return stats
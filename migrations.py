@@ -0,0 +1,416 @@
+"""
+Versioned schema migrations.
+
+Every step runs once, in order, and is recorded in the `schema_migrations`
+table. Steps are written to be idempotent so they can also be applied to
+databases created before the version table existed.
+
+Run after each deploy:
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # show current and latest version
+
+Web workers only compare the stored version with LATEST_VERSION
+(see db_manager.initialize_database).
+"""
+import os
+import sys
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def _constraint_exists(cursor, table, name):
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.table_constraints
+        WHERE table_schema = DATABASE() AND table_name = %s AND constraint_name = %s
+    """, (table, name))
+    return cursor.fetchone()[0] > 0
+
+
+def _index_exists(cursor, table, name):
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, name))
+    return cursor.fetchone()[0] > 0
+
+
+def _add_index(cursor, table, name, columns, kind=''):
+    if not _index_exists(cursor, table, name):
+        print(f"Adding index {name} on {table}...")
+        cursor.execute(f"CREATE {kind + ' ' if kind else ''}INDEX {name} ON {table} ({columns})")
+
+
+def _add_column(cursor, table, column, definition):
+    if not _column_exists(cursor, table, column):
+        print(f"Adding {column} column to {table} table...")
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# --- Migration steps ---
+
+def _create_base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            google_id VARCHAR(255) UNIQUE NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            name VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            status VARCHAR(50) DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            user_id INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_tag_user (name, user_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_parent_id(cursor):
+    # Formerly migrate_db.py
+    if not _column_exists(cursor, 'tasks', 'parent_id'):
+        print("Adding parent_id column to tasks table...")
+        cursor.execute("ALTER TABLE tasks ADD COLUMN parent_id INT DEFAULT NULL")
+        cursor.execute("ALTER TABLE tasks ADD CONSTRAINT fk_parent FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE")
+
+
+def _add_time_minutes(cursor):
+    # Formerly migrate_time.py
+    _add_column(cursor, 'tasks', 'time_minutes', "INT DEFAULT 0")
+
+
+def _add_task_details(cursor):
+    # Formerly sql_changes.sql
+    _add_column(cursor, 'tasks', 'importance', "VARCHAR(50)")
+    _add_column(cursor, 'tasks', 'description', "TEXT")
+    _add_column(cursor, 'tasks', 'hide_until', "TIMESTAMP NULL")
+    _add_column(cursor, 'tasks', 'completed_at', "TIMESTAMP NULL")
+    _add_column(cursor, 'tasks', 'ai_suggestion', "TEXT")
+
+
+def _add_user_id(cursor):
+    _add_column(cursor, 'tasks', 'user_id', "INT")
+    if not _constraint_exists(cursor, 'tasks', 'fk_user_id'):
+        cursor.execute("SELECT COUNT(*) FROM information_schema.key_column_usage "
+                       "WHERE table_schema = DATABASE() AND table_name = 'tasks' "
+                       "AND column_name = 'user_id' AND referenced_table_name = 'users'")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("ALTER TABLE tasks ADD CONSTRAINT fk_user_id FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE")
+
+
+def _description_longtext(cursor):
+    # Rich text descriptions embed images
+    cursor.execute("SHOW COLUMNS FROM tasks LIKE 'description'")
+    col_info = cursor.fetchone()
+    if col_info and 'longtext' not in col_info[1].lower():
+        print("Upgrading description column to LONGTEXT for image support...")
+        cursor.execute("ALTER TABLE tasks MODIFY COLUMN description LONGTEXT")
+
+
+def _add_due_at(cursor):
+    _add_column(cursor, 'tasks', 'due_at', "TIMESTAMP NULL")
+
+
+def _add_is_folded(cursor):
+    _add_column(cursor, 'tasks', 'is_folded', "INT DEFAULT 0")
+
+
+def _add_tree_fields(cursor):
+    _add_column(cursor, 'tasks', 'level', "INT DEFAULT 0")
+    _add_column(cursor, 'tasks', 'branch_id', "VARCHAR(255)")
+
+
+def _create_task_tags(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS task_tags (
+            task_id INT NOT NULL,
+            tag_id INT NOT NULL,
+            PRIMARY KEY (task_id, tag_id),
+            FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,
+            FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_show_completed_tasks(cursor):
+    _add_column(cursor, 'users', 'show_completed_tasks', "INT DEFAULT 1")
+
+
+def _add_list_indexes(cursor):
+    # list_tasks orders pending tasks by created_at and completed ones by completed_at, pending first.
+    # sort_key folds that into one column: completed tasks are pushed 100 years back, so
+    # ORDER BY sort_key DESC reads (user_id, sort_key) backwards with no filesort.
+    _add_column(cursor, 'tasks', 'sort_key',
+                "DATETIME AS (IF(status = 'completed', completed_at - INTERVAL 100 YEAR, created_at)) STORED")
+    _add_index(cursor, 'tasks', 'idx_tasks_user_sort', "user_id, sort_key")
+    _add_index(cursor, 'tasks', 'idx_tasks_user_status_hide_due', "user_id, status, hide_until, due_at")
+    _add_index(cursor, 'tasks', 'idx_tasks_user_parent', "user_id, parent_id")
+    _add_index(cursor, 'tasks', 'idx_tasks_user_branch', "user_id, branch_id")
+    _add_index(cursor, 'task_tags', 'idx_task_tags_tag', "tag_id, task_id")
+
+
+def _add_description_preview(cursor):
+    from description_utils import description_columns
+
+    _add_column(cursor, 'tasks', 'description_preview', "VARCHAR(255) NULL")
+    _add_column(cursor, 'tasks', 'has_description', "TINYINT NOT NULL DEFAULT 0")
+
+    # Backfill in id order, a batch at a time, so huge descriptions are never all in memory at once
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id, description FROM tasks
+            WHERE id > %s AND description IS NOT NULL
+            ORDER BY id LIMIT 200
+        """, (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = [description_columns(description) + (task_id,) for task_id, description in rows]
+        cursor.executemany("UPDATE tasks SET description_preview = %s, has_description = %s WHERE id = %s", updates)
+        cursor.execute("COMMIT")
+        last_id = rows[-1][0]
+
+
+def _create_user_data_version(cursor):
+    # Bumped in the same transaction as every write; caches compare against it
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_data_version (
+            user_id INT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_search_text(cursor):
+    from description_utils import make_search_text
+
+    _add_column(cursor, 'tasks', 'search_text', "MEDIUMTEXT NULL")
+
+    # Backfill before building the FULLTEXT index, which is much faster than indexing row by row
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id, title, description FROM tasks
+            WHERE id > %s
+            ORDER BY id LIMIT 200
+        """, (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = [(make_search_text(title, description), task_id) for task_id, title, description in rows]
+        cursor.executemany("UPDATE tasks SET search_text = %s WHERE id = %s", updates)
+        cursor.execute("COMMIT")
+        last_id = rows[-1][0]
+
+    _add_index(cursor, 'tasks', 'ft_tasks_search', "search_text", kind='FULLTEXT')
+
+
+def _create_task_closure(cursor):
+    from task_closure import rebuild_closure
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS task_closure (
+            ancestor_id INT NOT NULL,
+            descendant_id INT NOT NULL,
+            depth INT NOT NULL,
+            PRIMARY KEY (ancestor_id, descendant_id),
+            KEY idx_task_closure_descendant (descendant_id, depth),
+            FOREIGN KEY (ancestor_id) REFERENCES tasks(id) ON DELETE CASCADE,
+            FOREIGN KEY (descendant_id) REFERENCES tasks(id) ON DELETE CASCADE
+        )
+    """)
+    print(f"Built task_closure with {rebuild_closure(cursor)} rows.")
+    cursor.execute("COMMIT")
+
+
+def _create_user_stats_rollup(cursor):
+    # Filled lazily per user by stats_service (rebuilt on first read), then kept up to date by deltas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats_rollup (
+            user_id INT NOT NULL,
+            dimension VARCHAR(16) NOT NULL,
+            name VARCHAR(255) NOT NULL DEFAULT '',
+            tasks INT NOT NULL DEFAULT 0,
+            minutes BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, dimension, name),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats_rollup_state (
+            user_id INT PRIMARY KEY,
+            expires_at TIMESTAMP NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_branch_total_minutes(cursor):
+    from task_closure import recompute_branch_totals
+
+    _add_column(cursor, 'tasks', 'branch_total_minutes', "INT NOT NULL DEFAULT 0")
+    recompute_branch_totals(cursor)
+    cursor.execute("COMMIT")
+
+
+def _add_ai_status(cursor):
+    # NULL: no suggestion requested; pending / done / failed (see ai_worker)
+    _add_column(cursor, 'tasks', 'ai_status', "VARCHAR(16) NULL")
+
+
+def _create_ai_suggestion_cache(cursor):
+    # Shared by every user: keyed on the normalized prompt, not on a task (see ai_cache)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_suggestion_cache (
+            prompt_hash CHAR(64) PRIMARY KEY,
+            model VARCHAR(100) NOT NULL,
+            suggestions TEXT NOT NULL,
+            hits INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            used_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_ai_suggestion_cache_used_at (used_at),
+            INDEX idx_ai_suggestion_cache_created_at (created_at)
+        )
+    """)
+
+
+# Ordered list of (version, name, step). Append new steps; never renumber or edit applied ones.
+MIGRATIONS = [
+    (1, 'create base tables', _create_base_tables),
+    (2, 'tasks.parent_id', _add_parent_id),
+    (3, 'tasks.time_minutes', _add_time_minutes),
+    (4, 'tasks importance/description/hide_until/completed_at', _add_task_details),
+    (5, 'tasks.user_id', _add_user_id),
+    (6, 'tasks.description LONGTEXT', _description_longtext),
+    (7, 'tasks.due_at', _add_due_at),
+    (8, 'tasks.is_folded', _add_is_folded),
+    (9, 'tasks.level and tasks.branch_id', _add_tree_fields),
+    (10, 'task_tags table', _create_task_tags),
+    (11, 'users.show_completed_tasks', _add_show_completed_tasks),
+    (12, 'list_tasks indexes and tasks.sort_key', _add_list_indexes),
+    (13, 'tasks.description_preview and tasks.has_description', _add_description_preview),
+    (14, 'user_data_version table', _create_user_data_version),
+    (15, 'tasks.search_text with FULLTEXT index', _add_search_text),
+    (16, 'task_closure table', _create_task_closure),
+    (17, 'user_stats_rollup tables', _create_user_stats_rollup),
+    (18, 'tasks.branch_total_minutes', _add_branch_total_minutes),
+    (19, 'tasks.ai_status', _add_ai_status),
+    (20, 'ai_suggestion_cache table', _create_ai_suggestion_cache),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    """Return the applied schema version (0 if migrations never ran)."""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        row = cursor.fetchone()
+        return (row[0] or 0) if row else 0
+    except Error:
+        return 0
+
+
+def _server_connection():
+    return mysql.connector.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER'),
+        password=os.getenv('MYSQL_PASSWORD')
+    )
+
+
+def migrate(target=LATEST_VERSION):
+    """Create the database if needed and apply all pending migrations up to target."""
+    conn = None
+    cursor = None
+    try:
+        conn = _server_connection()
+        cursor = conn.cursor()
+
+        db_name = os.getenv('MYSQL_DATABASE')
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
+        conn.database = db_name
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        current = get_schema_version(cursor)
+
+        for version, name, step in MIGRATIONS:
+            if version <= current or version > target:
+                continue
+            print(f"Applying migration {version}: {name}")
+            step(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            current = version
+
+        print(f"Database schema is at version {current}.")
+        return current
+    except Error as e:
+        print(f"Error applying migrations: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def print_status():
+    from db_manager import get_db_connection
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cursor = conn.cursor()
+        current = get_schema_version(cursor)
+        print(f"Current version: {current}, latest version: {LATEST_VERSION}")
+        for version, name, _ in MIGRATIONS:
+            state = 'applied' if version <= current else 'pending'
+            print(f"  {version:>3} {state:<8} {name}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    if '--status' in sys.argv:
+        print_status()
+    else:
+        sys.exit(0 if migrate() is not None else 1)
@@ -1,7 +1,77 @@
+import re
+from datetime import datetime, timedelta
+
+from task_forest import TaskForest
+
+# Visible = not hidden right now (same rule as TaskManager.list_tasks)
+_VISIBLE = "({t}.hide_until IS NULL OR {t}.hide_until <= NOW())"
+_IS_COMPLETED = "({t}.status <=> 'completed')"
+_IMPORTANCE = "COALESCE(NULLIF({t}.importance, ''), 'Normal')"
+
+
+# InnoDB does not index words shorter than innodb_ft_min_token_size (3 by default)
+FULLTEXT_MIN_TOKEN = 3
+_WORD_RE = re.compile(r'\w+')
+
+
+def fulltext_query(search_query):
+    """
+    Boolean-mode AGAINST() string for a search box query: every word is required and
+    matched as a prefix ("repo fix" -> "+repo* +fix*"). Returns None if no word is long enough.
+    """
+    if not search_query:
+        return None
+    words = [w for w in _WORD_RE.findall(search_query.lower()) if len(w) >= FULLTEXT_MIN_TOKEN]
+    if not words:
+        return None
+    return ' '.join(f"+{w}*" for w in dict.fromkeys(words))
+
+
+def like_contains(value):
+    """LIKE pattern matching `value` anywhere, with LIKE wildcards escaped."""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _binary_contains(expr):
+    # Lower-cased, byte-wise LIKE: case-insensitive like str.lower() but not accent-insensitive like the column collation
+    return f"CAST(LOWER({expr}) AS BINARY) LIKE CAST(%s AS BINARY)"
+
+
+def period_bounds(period, now=None):
+    """
+    Date boundaries of a period filter as used by filter_tasks.
+    Returns (completed_range, pending_range); each range is (start, end) with None for an open side.
+    """
+    now = now or datetime.now()
+    today_start = datetime(now.year, now.month, now.day)
+    tomorrow_start = today_start + timedelta(days=1)
+    day_after_tomorrow = today_start + timedelta(days=2)
+    days_to_next_monday = 7 - now.weekday()
+    next_week_start = today_start + timedelta(days=days_to_next_monday)
+    next_week_end = next_week_start + timedelta(days=7)
+    seven_days_later = now + timedelta(days=7)
+
+    if period == 'today':
+        # Completed today; due today or overdue
+        return (today_start, tomorrow_start), (None, tomorrow_start)
+    if period == 'tomorrow':
+        return (tomorrow_start, day_after_tomorrow), (tomorrow_start, day_after_tomorrow)
+    if period == 'this_week':
+        return (now, seven_days_later), (now, seven_days_later)
+    if period == 'next_week':
+        return (next_week_start, next_week_end), (next_week_start, next_week_end)
+    return None
+
+
 class SearchManager:
     """
     Manages search and filtering logic for tasks.
     Separated from the main business logic to keep the codebase clean.
+
+    filter_tasks filters already loaded tasks in Python; build_filter_query is
+    its SQL counterpart, used by TaskManager.list_tasks so only the matching
+    branches are read from the database. Both must return the same tasks.
     """
 
     @staticmethod
@@ -12,8 +82,6 @@ class SearchManager:
         if not search_query and not tag_filter and not importance_filter and not period_filter:
             return all_tasks
 
-        from datetime import datetime, timedelta
-
         # Period Filter logic refinement
         effective_period = None if tag_filter else period_filter
         if effective_period == 'all':
@@ -96,44 +164,112 @@ class SearchManager:
             if match:
                 filtered_ids.add(task['id'])
 
+        if not filtered_ids:
+            return []
+
+        forest = TaskForest.from_tasks(all_tasks)
+
         # Include descendants if tag_filter is present
-        if tag_filter and filtered_ids:
+        if tag_filter:
             expanded_set = set(filtered_ids)
-            children_map = {}
-            for t in all_tasks:
-                pid = t.get('parent_id')
-                if pid:
-                    if pid not in children_map: children_map[pid] = []
-                    children_map[pid].append(t['id'])
-            
-            def add_descendants(tid):
-                for cid in children_map.get(tid, []):
-                    if cid not in expanded_set:
-                        expanded_set.add(cid)
-                        add_descendants(cid)
-            
-            for tid in list(filtered_ids):
-                add_descendants(tid)
+            for tid in filtered_ids:
+                expanded_set.update(forest.descendants(tid))
             filtered_ids = expanded_set
 
         # To maintain tree structure for matched tasks, we should include their ancestors.
-        if filtered_ids:
-            expanded_set = set(filtered_ids)
-            tasks_map = {t['id']: t for t in all_tasks}
-            
-            for tid in list(filtered_ids):
-                curr = tasks_map.get(tid)
-                while curr and curr.get('parent_id'):
-                    pid = curr['parent_id']
-                    if pid not in expanded_set:
-                        parent = tasks_map.get(pid)
-                        if parent:
-                            expanded_set.add(pid)
-                            curr = parent
-                        else: break
-                    else: break
-            
-            # Preserve original sort order from all_tasks
-            return [t for t in all_tasks if t['id'] in expanded_set]
+        expanded_set = set(filtered_ids)
+        for tid in filtered_ids:
+            for pid in forest.ancestors(tid):
+                if pid in expanded_set:
+                    break
+                expanded_set.add(pid)
+
+        # Preserve original sort order from all_tasks
+        return [t for t in all_tasks if t['id'] in expanded_set]
+
+    @staticmethod
+    def build_filter_query(user_id, search_query=None, tag_filter=None, importance_filter=None, period_filter=None, now=None, fulltext=True):
+        """
+        Builds the SQL equivalent of filter_tasks. Returns (with_clause, params), where
+        with_clause is a WITH RECURSIVE clause defining `filtered_ids(id)`: the visible tasks
+        that match, their descendants when filtering by tag, and all their ancestors.
+        Returns None when no filter applies (all tasks are shown).
+
+        With fulltext=True the search query also matches words of the description
+        (and title) by prefix through the FULLTEXT index on tasks.search_text.
+        """
+        if not search_query and not tag_filter and not importance_filter and not period_filter:
+            return None
+
+        effective_period = None if tag_filter else period_filter
+        if effective_period == 'all':
+            effective_period = None
+
+        conditions = ["t.user_id = %s", _VISIBLE.format(t='t')]
+        params = [user_id]
+
+        if search_query:
+            pattern = like_contains(search_query.lower())
+            against = fulltext_query(search_query) if fulltext else None
+            conditions.append(
+                "(" + _binary_contains("t.title")
+                + " OR EXISTS (SELECT 1 FROM task_tags stt JOIN tags sg ON sg.id = stt.tag_id"
+                + " WHERE stt.task_id = t.id AND " + _binary_contains("sg.name") + ")"
+                + " OR " + _binary_contains(_IMPORTANCE.format(t='t'))
+                + (" OR MATCH(t.search_text) AGAINST (%s IN BOOLEAN MODE)" if against else "") + ")"
+            )
+            params.extend([pattern, pattern, pattern])
+            if against:
+                params.append(against)
+
+        if tag_filter:
+            conditions.append("EXISTS (SELECT 1 FROM task_tags ftt JOIN tags fg ON fg.id = ftt.tag_id"
+                              " WHERE ftt.task_id = t.id AND CAST(fg.name AS BINARY) = CAST(%s AS BINARY))")
+            params.append(tag_filter)
+
+        if importance_filter:
+            conditions.append(f"CAST({_IMPORTANCE.format(t='t')} AS BINARY) = CAST(%s AS BINARY)")
+            params.append(importance_filter)
+
+        if effective_period:
+            bounds = period_bounds(effective_period, now)
+            if bounds:
+                branches = []
+                for column, completed, (start, end) in (("completed_at", True, bounds[0]), ("due_at", False, bounds[1])):
+                    clause = [_IS_COMPLETED.format(t='t') if completed else f"NOT {_IS_COMPLETED.format(t='t')}"]
+                    clause.append(f"t.{column} IS NOT NULL")
+                    if start is not None:
+                        clause.append(f"t.{column} >= %s")
+                        params.append(start)
+                    if end is not None:
+                        clause.append(f"t.{column} < %s")
+                        params.append(end)
+                    branches.append("(" + " AND ".join(clause) + ")")
+                conditions.append("(" + " OR ".join(branches) + ")")
+
+        ctes = ["matched AS (SELECT t.id FROM tasks t WHERE " + " AND ".join(conditions) + ")"]
+        seed = "matched"
+
+        if tag_filter:
+            # Tagged tasks bring their whole (visible) subtree along
+            ctes.append(
+                "tagged_subtree AS ("
+                " SELECT id FROM matched"
+                " UNION"
+                " SELECT c.id FROM tasks c JOIN tagged_subtree s ON c.parent_id = s.id"
+                " WHERE c.user_id = %s AND " + _VISIBLE.format(t='c') + ")"
+            )
+            params.append(user_id)
+            seed = "tagged_subtree"
+
+        # Walk up to the roots so the tree structure of every match is kept. UNION (not ALL) also stops cycles.
+        ctes.append(
+            "filtered_ids AS ("
+            f" SELECT t.id, t.parent_id FROM tasks t JOIN {seed} m ON m.id = t.id"
+            " UNION"
+            " SELECT p.id, p.parent_id FROM tasks p JOIN filtered_ids f ON p.id = f.parent_id"
+            " WHERE p.user_id = %s AND " + _VISIBLE.format(t='p') + ")"
+        )
+        params.append(user_id)
 
-        return []
+        return "WITH RECURSIVE " + ", ".join(ctes), params
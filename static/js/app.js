@@ -139,3 +139,38 @@ function toggleTaskFolding(taskId) {
         })
         .catch(err => console.error('Error persisting folding state:', err));
 }
+
+// Suggestions generated in the background (ai_worker) are polled until they are in
+const AI_POLL_INTERVAL_MS = 2000;
+const AI_POLL_MAX_MS = 120000;
+
+function pollAiSuggestions(startedAt) {
+    const pending = document.querySelectorAll('[data-ai-pending]');
+    if (!pending.length) return;
+    startedAt = startedAt || Date.now();
+    if (Date.now() - startedAt > AI_POLL_MAX_MS) return;
+
+    const ids = Array.from(pending, el => el.id.replace('ai-suggestions-', ''));
+    fetch('/ai_status?ids=' + ids.join(','))
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) return;
+            ids.forEach(taskId => {
+                const el = document.getElementById('ai-suggestions-' + taskId);
+                const task = data.tasks[taskId];
+                if (!el) return;
+                if (!task) {
+                    // Deleted meanwhile
+                    el.removeAttribute('data-ai-pending');
+                } else if (task.html !== undefined) {
+                    el.outerHTML = task.html;
+                }
+            });
+            setTimeout(() => pollAiSuggestions(startedAt), AI_POLL_INTERVAL_MS);
+        })
+        .catch(err => console.error('Error polling AI suggestions:', err));
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    setTimeout(pollAiSuggestions, AI_POLL_INTERVAL_MS);
+});
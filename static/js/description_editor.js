@@ -1,12 +1,13 @@
 /**
  * Description Editor Module (Quill Version)
- * Handles Quill initialization, image resizing, PDF drop, and auto-save.
+ * Handles Quill initialization, image resizing and upload, PDF drop, and auto-save.
  */
 
 const DescriptionEditor = {
     taskId: null,
     editorId: 'task-description-editor',
     saveUrl: '/update_task',
+    uploadUrl: '/images',
     quill: null,
     saveTimeout: null,
 
@@ -130,22 +131,45 @@ const DescriptionEditor = {
                 canvas.height = height;
                 ctx.drawImage(img, 0, 0, width, height);
 
-                // Compress to JPEG 70%
-                const dataUrl = canvas.toDataURL('image/jpeg', 0.7);
+                // Compress to JPEG 70% and upload it to the image store
+                canvas.toBlob((blob) => {
+                    console.log(`Compressed Image Size: ${(blob.size / 1024).toFixed(2)} KB`);
+                    this.uploadImage(blob)
+                        .then(url => this.insertImage(url))
+                        .catch(error => {
+                            // Fall back to an inline image; the server moves it to the store on save
+                            console.error('Image upload failed, embedding inline:', error);
+                            this.insertImage(canvas.toDataURL('image/jpeg', 0.7));
+                        });
+                }, 'image/jpeg', 0.7);
+            };
+        };
+    },
 
-                // Calculate compressed size
-                const compressedSize = Math.round((dataUrl.length * 3) / 4); // Approx base64 size
-                console.log(`Compressed Image Size: ${(compressedSize / 1024).toFixed(2)} KB`);
+    uploadImage: function (blob) {
+        const formData = new FormData();
+        formData.append('image', blob, 'image.jpg');
 
-                // Insert into editor
-                const range = this.quill.getSelection(true) || { index: this.quill.getLength() - 1 };
-                this.quill.insertEmbed(range.index, 'image', dataUrl);
-                this.quill.setSelection(range.index + 1);
+        return fetch(this.uploadUrl, {
+            method: 'POST',
+            body: formData
+        })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Upload failed: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(data => data.url);
+    },
 
-                // Trigger save
-                this.saveDescription();
-            };
-        };
+    insertImage: function (src) {
+        const range = this.quill.getSelection(true) || { index: this.quill.getLength() - 1 };
+        this.quill.insertEmbed(range.index, 'image', src);
+        this.quill.setSelection(range.index + 1);
+
+        // Trigger save
+        this.saveDescription();
     },
 
     setupAutoSave: function () {
@@ -0,0 +1,307 @@
+"""
+Sidebar statistics, kept in a per-user rollup table.
+
+get_stats(user_id) returns the same dict as InfoPanelManager.calculate_stats
+over the user's visible tasks: open minutes in total, per importance and per
+tag, where a task also counts towards the importances and tags of its
+ancestors (through task_closure). As in the Python version, inheritance stops
+at a hidden ancestor.
+
+user_stats_rollup holds one row per (user, dimension, name) with the number
+of open tasks and their minutes. Every write that can change the numbers
+(add, time/importance edits, complete/uncomplete, hide, move, delete, tag
+links) takes the contribution of the affected subtree before and after the
+write and applies the difference, inside the write's own transaction:
+
+    fresh = lock_rollup(cursor, user_id)  # first statement of the transaction
+    before = subtree_stats(cursor, user_id, task_id)
+    ...write...
+    apply_stats_delta(cursor, user_id, before, subtree_stats(cursor, user_id, task_id), fresh)
+
+lock_rollup serialises the writers of one user before they read anything, so
+no two of them compute a delta from the same snapshot.
+
+Hidden tasks reappear without a write, so the rollup is only valid until the
+user's next hide_until (user_stats_rollup_state.expires_at); after that, or
+when it was never built, it is rebuilt from scratch. `python stats_service.py`
+compares every rollup with a full recomputation (--rebuild repairs drift).
+"""
+import sys
+import time
+
+from mysql.connector import Error
+
+from db_manager import get_db_connection, get_user_data_version
+from forest_cache import forest_cache
+
+DEFAULT_IMPORTANCES = ['Important', 'Medium', 'Normal']
+
+_STATS_CACHE_KEY = ('stats',)
+
+# Rows are (dimension, name, tasks, minutes) over the open, visible tasks in scope:
+#   total / unrated (no importance anywhere up the chain, counted as Normal) / importance / tag.
+# cut_depth is the distance to the nearest hidden ancestor; only ancestors closer than that count.
+_CONTRIBUTION_QUERY = """
+    WITH open_tasks AS (
+        SELECT d.id, COALESCE(d.time_minutes, 0) AS minutes,
+               COALESCE((
+                   SELECT MIN(h.depth)
+                   FROM task_closure h
+                   JOIN tasks ht ON ht.id = h.ancestor_id
+                   WHERE h.descendant_id = d.id AND ht.hide_until > NOW()
+               ), 1000000) AS cut_depth
+        FROM tasks d
+        WHERE d.user_id = %s{scope}
+        AND NOT (d.status <=> 'completed')
+        AND (d.hide_until IS NULL OR d.hide_until <= NOW())
+    ),
+    inherited_importance AS (
+        SELECT DISTINCT o.id, o.minutes, a.importance AS name
+        FROM open_tasks o
+        JOIN task_closure c ON c.descendant_id = o.id AND c.depth < o.cut_depth
+        JOIN tasks a ON a.id = c.ancestor_id
+        WHERE a.importance <> ''
+    ),
+    inherited_tags AS (
+        SELECT DISTINCT o.id, o.minutes, g.name
+        FROM open_tasks o
+        JOIN task_closure c ON c.descendant_id = o.id AND c.depth < o.cut_depth
+        JOIN task_tags tt ON tt.task_id = c.ancestor_id
+        JOIN tags g ON g.id = tt.tag_id
+        WHERE g.name <> ''
+    )
+    SELECT 'total' AS dimension, '' AS name, COUNT(*) AS tasks, COALESCE(SUM(minutes), 0) AS minutes FROM open_tasks
+    UNION ALL
+    SELECT 'unrated', '', COUNT(*), COALESCE(SUM(o.minutes), 0) FROM open_tasks o
+    WHERE o.id NOT IN (SELECT id FROM inherited_importance)
+    UNION ALL
+    SELECT 'importance', name, COUNT(*), SUM(minutes) FROM inherited_importance GROUP BY name
+    UNION ALL
+    SELECT 'tag', name, COUNT(*), SUM(minutes) FROM inherited_tags GROUP BY name
+"""
+
+# Full recomputation for a user: (user_id)
+STATS_QUERY = _CONTRIBUTION_QUERY.format(scope='')
+
+# Contribution of a task and its descendants: (user_id, task_id)
+SUBTREE_STATS_QUERY = _CONTRIBUTION_QUERY.format(
+    scope="\n        AND d.id IN (SELECT descendant_id FROM task_closure WHERE ancestor_id = %s)")
+
+ROLLUP_QUERY = "SELECT dimension, name, tasks, minutes FROM user_stats_rollup WHERE user_id = %s"
+
+# fresh is NULL when the rollup was never built, 0 once a hidden task has reappeared since
+ROLLUP_STATE_QUERY = """
+    SELECT (expires_at IS NULL OR expires_at > NOW()) AS fresh,
+           TIMESTAMPDIFF(SECOND, NOW(), expires_at) AS seconds
+    FROM user_stats_rollup_state
+    WHERE user_id = %s
+"""
+
+NEXT_UNHIDE_AT_QUERY = "SELECT MIN(hide_until) FROM tasks WHERE user_id = %s AND hide_until > NOW()"
+
+ROLLUP_UPSERT = """
+    INSERT INTO user_stats_rollup (user_id, dimension, name, tasks, minutes)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE tasks = tasks + VALUES(tasks), minutes = minutes + VALUES(minutes)
+"""
+
+
+def _values(row):
+    return tuple(row.values()) if isinstance(row, dict) else row
+
+
+def contribution_from_rows(rows):
+    """{(dimension, name): (tasks, minutes)} from STATS_QUERY / SUBTREE_STATS_QUERY / ROLLUP_QUERY rows."""
+    contribution = {}
+    for row in rows:
+        dimension, name, tasks, minutes = _values(row)
+        if tasks:
+            contribution[(dimension, name)] = (int(tasks), int(minutes or 0))
+    return contribution
+
+
+def empty_stats():
+    return {
+        'total_time': 0,
+        'importance_summary': {imp: 0 for imp in DEFAULT_IMPORTANCES},
+        'tag_summary': {}
+    }
+
+
+def stats_from_contribution(contribution):
+    """Build the calculate_stats-shaped dict from a contribution mapping."""
+    stats = empty_stats()
+    for (dimension, name), (_, minutes) in contribution.items():
+        if dimension == 'total':
+            stats['total_time'] = minutes
+        elif dimension == 'unrated':
+            stats['importance_summary']['Normal'] += minutes
+        elif dimension == 'importance':
+            stats['importance_summary'][name] = stats['importance_summary'].get(name, 0) + minutes
+        elif dimension == 'tag':
+            stats['tag_summary'][name] = minutes
+    stats['tag_summary'] = dict(sorted(stats['tag_summary'].items(), key=lambda item: item[1], reverse=True))
+    return stats
+
+
+def subtree_stats(cursor, user_id, task_id):
+    """Contribution of task_id and its descendants to the user's rollup."""
+    cursor.execute(SUBTREE_STATS_QUERY, (user_id, task_id))
+    return contribution_from_rows(cursor.fetchall())
+
+
+def rebuild_user_stats(cursor, user_id):
+    """Recompute the user's rollup from scratch. Returns the new contribution mapping."""
+    cursor.execute(STATS_QUERY, (user_id,))
+    contribution = contribution_from_rows(cursor.fetchall())
+    cursor.execute("DELETE FROM user_stats_rollup WHERE user_id = %s", (user_id,))
+    if contribution:
+        cursor.executemany("""
+            INSERT INTO user_stats_rollup (user_id, dimension, name, tasks, minutes)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE tasks = VALUES(tasks), minutes = VALUES(minutes)
+        """, [(user_id, dimension, name, tasks, minutes)
+              for (dimension, name), (tasks, minutes) in contribution.items()])
+    cursor.execute(NEXT_UNHIDE_AT_QUERY, (user_id,))
+    expires_at = _values(cursor.fetchone())[0]
+    cursor.execute("""
+        INSERT INTO user_stats_rollup_state (user_id, expires_at) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE expires_at = VALUES(expires_at)
+    """, (user_id, expires_at))
+    return contribution
+
+
+def lock_rollup(cursor, user_id):
+    """
+    Start a write's transaction by locking the user's rollup state row (created as expired
+    if missing), and return whether the rollup is fresh, for apply_stats_delta.
+
+    Call it before any other statement of the write: under REPEATABLE READ the first plain
+    read fixes the snapshot, and it has to be taken after the lock, once the previous writer
+    of the same user has committed. START TRANSACTION also ends the read-only transaction
+    earlier reads may have left open on a shared request connection.
+    """
+    cursor.execute("START TRANSACTION")
+    cursor.execute("""
+        INSERT INTO user_stats_rollup_state (user_id, expires_at) VALUES (%s, NOW())
+        ON DUPLICATE KEY UPDATE user_id = user_id
+    """, (user_id,))
+    cursor.execute(ROLLUP_STATE_QUERY + " FOR UPDATE", (user_id,))
+    return bool(_values(cursor.fetchone())[0])
+
+
+def apply_stats_delta(cursor, user_id, before, after, fresh):
+    """
+    Add `after - before` (contributions from subtree_stats) to the user's rollup, in the
+    caller's transaction. `fresh` comes from lock_rollup, taken before `before` was read;
+    a rollup that is missing or expired is rebuilt instead.
+    """
+    if not fresh:
+        rebuild_user_stats(cursor, user_id)
+        return
+
+    deltas = []
+    for key in before.keys() | after.keys():
+        before_tasks, before_minutes = before.get(key, (0, 0))
+        after_tasks, after_minutes = after.get(key, (0, 0))
+        if after_tasks != before_tasks or after_minutes != before_minutes:
+            deltas.append((user_id, *key, after_tasks - before_tasks, after_minutes - before_minutes))
+    if deltas:
+        cursor.executemany(ROLLUP_UPSERT, deltas)
+        cursor.execute("DELETE FROM user_stats_rollup WHERE user_id = %s AND tasks <= 0", (user_id,))
+    # A hide or a delete can move the next unhide
+    cursor.execute(NEXT_UNHIDE_AT_QUERY, (user_id,))
+    expires_at = _values(cursor.fetchone())[0]
+    cursor.execute("UPDATE user_stats_rollup_state SET expires_at = %s WHERE user_id = %s", (expires_at, user_id))
+
+
+def reset_stats_rollups(cursor):
+    """Drop every rollup (e.g. after a bulk repair); each is rebuilt on its next read or write."""
+    cursor.execute("DELETE FROM user_stats_rollup_state")
+    cursor.execute("DELETE FROM user_stats_rollup")
+
+
+def get_stats(user_id):
+    """Total, importance and tag time summaries of a user's visible open tasks."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            version = get_user_data_version(cursor, user_id)
+            cached = forest_cache.get(user_id, _STATS_CACHE_KEY, version)
+            if cached is not None:
+                return cached
+
+            cursor.execute(ROLLUP_STATE_QUERY, (user_id,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                cursor.execute(ROLLUP_QUERY, (user_id,))
+                contribution = contribution_from_rows(cursor.fetchall())
+                seconds = row[1]
+            else:
+                # Rebuild under the same lock as the writers, unless one of them just did
+                if lock_rollup(cursor, user_id):
+                    cursor.execute(ROLLUP_QUERY, (user_id,))
+                    contribution = contribution_from_rows(cursor.fetchall())
+                else:
+                    contribution = rebuild_user_stats(cursor, user_id)
+                conn.commit()
+                cursor.execute(ROLLUP_STATE_QUERY, (user_id,))
+                seconds = cursor.fetchone()[1]
+
+            stats = stats_from_contribution(contribution)
+            expires_at = time.time() + max(int(seconds), 0) if seconds is not None else None
+            forest_cache.put(user_id, _STATS_CACHE_KEY, stats, version, expires_at)
+            return stats
+        except Error as e:
+            print(f"Error calculating stats: {e}")
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+    return empty_stats()
+
+
+def verify_rollups(rebuild=False):
+    """
+    Compare every built rollup with a full recomputation and print the differences.
+    With rebuild=True, rebuild the ones that differ. Returns the number of users that differed.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT user_id FROM user_stats_rollup_state WHERE expires_at IS NULL OR expires_at > NOW()")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        drifted = 0
+        for user_id in user_ids:
+            cursor.execute(ROLLUP_QUERY, (user_id,))
+            stored = contribution_from_rows(cursor.fetchall())
+            cursor.execute(STATS_QUERY, (user_id,))
+            expected = contribution_from_rows(cursor.fetchall())
+            if stored == expected:
+                continue
+            drifted += 1
+            print(f"User {user_id}: rollup differs from recomputation")
+            for key in sorted(stored.keys() | expected.keys()):
+                if stored.get(key) != expected.get(key):
+                    print(f"  {key[0]} {key[1]!r}: stored {stored.get(key)}, expected {expected.get(key)}")
+            if rebuild:
+                lock_rollup(cursor, user_id)
+                rebuild_user_stats(cursor, user_id)
+                conn.commit()
+        print(f"Checked {len(user_ids)} rollups, {drifted} differed" + (" (rebuilt)." if rebuild and drifted else "."))
+        return drifted
+    except Error as e:
+        print(f"Error verifying stats rollups: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    result = verify_rollups(rebuild='--rebuild' in sys.argv)
+    sys.exit(0 if result == 0 or (result is not None and '--rebuild' in sys.argv) else 1)
@@ -0,0 +1,156 @@
+"""
+Batched tag lookups and links.
+
+resolve_tag_ids turns any number of tag names into ids with at most two
+statements (an INSERT ... ON DUPLICATE KEY UPDATE for the names, then one
+SELECT), and link_tags links them to a task with one multi-row INSERT.
+Both run on the caller's cursor, inside its transaction, so a task with any
+number of hashtags costs a constant number of round trips.
+
+Names are matched under the tags.name collation, like its unique key, so
+names that differ only by accents share one tag.
+
+Name -> id pairs are kept in a bounded per-user cache (tag_ids). Tags are
+never renamed and only go away together with their user, so a cached id only
+goes stale if the transaction that created the tag was rolled back; the
+link then fails its foreign key, and link_tags drops the user's entries and
+resolves the names again.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from mysql.connector import IntegrityError
+
+TAG_CACHE_MAX_USERS = int(os.getenv('TAG_CACHE_MAX_USERS', 1000))
+# Names kept per user; a user with more tags just misses on the least recently used ones
+TAG_CACHE_MAX_NAMES = int(os.getenv('TAG_CACHE_MAX_NAMES', 500))
+
+
+def normalize_tag_name(name):
+    """Tags are stored lower-case, without the leading '#'."""
+    name = (name or '').lower().strip()
+    if name.startswith('#'):
+        name = name[1:]
+    return name
+
+
+class TagIdCache:
+    """Per-user name -> tag id maps, least recently used users (and names) dropped first."""
+
+    def __init__(self, max_users=TAG_CACHE_MAX_USERS, max_names=TAG_CACHE_MAX_NAMES):
+        self.max_users = max_users
+        self.max_names = max_names
+        self._users = OrderedDict()  # user_id -> OrderedDict(name -> id)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, user_id, names):
+        """The cached ids among `names`, as {name: id}."""
+        found = {}
+        with self._lock:
+            ids = self._users.get(user_id)
+            if ids is not None:
+                self._users.move_to_end(user_id)
+                for name in names:
+                    tag_id = ids.get(name)
+                    if tag_id is not None:
+                        ids.move_to_end(name)
+                        found[name] = tag_id
+            self.hits += len(found)
+            self.misses += len(names) - len(found)
+        return found
+
+    def put_many(self, user_id, mapping):
+        with self._lock:
+            ids = self._users.get(user_id)
+            if ids is None:
+                ids = self._users[user_id] = OrderedDict()
+            self._users.move_to_end(user_id)
+            ids.update(mapping)
+            while len(ids) > self.max_names:
+                ids.popitem(last=False)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'names': sum(len(ids) for ids in self._users.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Shared by every request in the process
+tag_ids = TagIdCache()
+
+
+def resolve_tag_ids(cursor, user_id, names, use_cache=True):
+    """
+    Ids of the user's tags called `names` (normalized), creating the missing ones.
+    Returns {name: id}. Runs in the caller's transaction.
+    """
+    names = list(dict.fromkeys(name for name in map(normalize_tag_name, names) if name))
+    if not names:
+        return {}
+    resolved = tag_ids.get_many(user_id, names) if use_cache else {}
+    missing = [name for name in names if name not in resolved]
+    if missing:
+        cursor.execute(
+            "INSERT INTO tags (name, user_id) VALUES " + ', '.join(['(%s, %s)'] * len(missing))
+            + " ON DUPLICATE KEY UPDATE id = id",
+            [value for name in missing for value in (name, user_id)])
+        # One lookup per name, compared like the unique key (under the column's collation),
+        # so a name equal to an existing one up to accents ('café', 'cafe') maps to that row
+        cursor.execute(
+            ' UNION ALL '.join(["SELECT %s AS name, id FROM tags WHERE user_id = %s AND name = %s"] * len(missing)),
+            [value for name in missing for value in (name, user_id, name)])
+        fetched = {}
+        for row in cursor.fetchall():
+            name, tag_id = (row['name'], row['id']) if isinstance(row, dict) else row
+            fetched[name] = tag_id
+        dropped = [name for name in missing if name not in fetched]
+        if dropped:
+            print(f"Could not resolve tags {dropped} for user {user_id}")
+        tag_ids.put_many(user_id, fetched)
+        resolved.update(fetched)
+    return {name: resolved[name] for name in names if name in resolved}
+
+
+def link_tags(cursor, user_id, task_id, names):
+    """
+    Link the tags called `names` to a task, creating them as needed, in one multi-row INSERT.
+    Returns the [(tag_id, name)] pairs now linked (whether or not they already were).
+    """
+    for attempt in range(2):
+        resolved = resolve_tag_ids(cursor, user_id, names, use_cache=attempt == 0)
+        if not resolved:
+            return []
+        # Names equal under the collation share a tag: link it once, under the first name
+        linked = {}
+        for name, tag_id in resolved.items():
+            linked.setdefault(tag_id, name)
+        try:
+            cursor.execute(
+                # Not INSERT IGNORE, which would also swallow the foreign key error below
+                "INSERT INTO task_tags (task_id, tag_id) VALUES " + ', '.join(['(%s, %s)'] * len(linked))
+                + " ON DUPLICATE KEY UPDATE tag_id = tag_id",
+                [value for tag_id in linked for value in (task_id, tag_id)])
+            break
+        except IntegrityError:
+            # A cached id whose tag never got committed
+            tag_ids.invalidate(user_id)
+            if attempt:
+                raise
+    return list(linked.items())
@@ -0,0 +1,212 @@
+"""
+Closure table of the task hierarchy.
+
+task_closure holds one row (ancestor_id, descendant_id, depth) for every
+task and each of its ancestors, plus a depth-0 row linking every task to
+itself. Subtree and ancestor lookups are then single indexed queries whose
+cost depends on the size of the branch, not of the account.
+
+The helpers take a cursor and run inside the caller's transaction, next to
+the write they belong to. Rows of deleted tasks go away through the
+ON DELETE CASCADE foreign keys.
+
+tasks.branch_total_minutes (open minutes of a task and all its descendants)
+is kept up to date with the same table: a change of a task's open minutes is
+added to its whole ancestor path in one UPDATE (add_to_branch_totals).
+`python task_closure.py` checks the stored totals against a recomputation
+(--rebuild fixes them).
+"""
+import sys
+
+# Descendants of a task (depth 0 is the task itself), scoped to the owner
+SUBTREE_IDS_QUERY = """
+    SELECT c.descendant_id
+    FROM task_closure c
+    JOIN tasks t ON t.id = c.descendant_id
+    WHERE c.ancestor_id = %s AND t.user_id = %s
+"""
+
+# Ancestors of a task, root first (the task itself is the last row)
+ANCESTOR_IDS_QUERY = """
+    SELECT c.ancestor_id
+    FROM task_closure c
+    JOIN tasks t ON t.id = c.ancestor_id
+    WHERE c.descendant_id = %s AND t.user_id = %s
+    ORDER BY c.depth DESC
+"""
+
+
+def insert_task_closure(cursor, task_id, parent_id=None):
+    """Add the rows of a new leaf task: itself, plus every ancestor of its parent."""
+    cursor.execute("INSERT INTO task_closure (ancestor_id, descendant_id, depth) VALUES (%s, %s, 0)",
+                   (task_id, task_id))
+    if parent_id:
+        cursor.execute("""
+            INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, %s, depth + 1
+            FROM task_closure
+            WHERE descendant_id = %s
+        """, (task_id, parent_id))
+
+
+def move_subtree_closure(cursor, task_id, new_parent_id=None):
+    """
+    Re-link the subtree of task_id under new_parent_id (None = make it a root).
+    The caller must make sure new_parent_id is not inside the subtree.
+    """
+    # Drop the links from the old ancestors to every task of the subtree
+    cursor.execute("""
+        DELETE link
+        FROM task_closure link
+        JOIN task_closure sub ON sub.descendant_id = link.descendant_id AND sub.ancestor_id = %s
+        LEFT JOIN task_closure inner_link ON inner_link.ancestor_id = %s AND inner_link.descendant_id = link.ancestor_id
+        WHERE inner_link.ancestor_id IS NULL
+    """, (task_id, task_id))
+    if new_parent_id:
+        cursor.execute("""
+            INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+            SELECT above.ancestor_id, sub.descendant_id, above.depth + sub.depth + 1
+            FROM task_closure above
+            JOIN task_closure sub ON sub.ancestor_id = %s
+            WHERE above.descendant_id = %s
+        """, (task_id, new_parent_id))
+
+
+def clone_subtree_closure(cursor, source_id, id_map, parent_id=None):
+    """
+    Add the rows of a copy of source_id's subtree, placed under parent_id.
+    id_map maps every original task of the subtree to its copy.
+    """
+    cursor.execute("""
+        SELECT c.ancestor_id, c.descendant_id, c.depth
+        FROM task_closure c
+        JOIN task_closure r ON r.descendant_id = c.ancestor_id AND r.ancestor_id = %s
+    """, (source_id,))
+    rows = [(id_map[row[0]], id_map[row[1]], row[2]) if not isinstance(row, dict)
+            else (id_map[row['ancestor_id']], id_map[row['descendant_id']], row['depth'])
+            for row in cursor.fetchall()]
+    for i in range(0, len(rows), 1000):
+        chunk = rows[i:i + 1000]
+        cursor.execute("INSERT INTO task_closure (ancestor_id, descendant_id, depth) VALUES "
+                       + ', '.join(['(%s, %s, %s)'] * len(chunk)), [value for row in chunk for value in row])
+    if parent_id:
+        move_subtree_closure(cursor, id_map[source_id], parent_id)
+
+
+def is_in_subtree(cursor, ancestor_id, task_id):
+    """True if task_id is ancestor_id itself or one of its descendants."""
+    cursor.execute("SELECT 1 FROM task_closure WHERE ancestor_id = %s AND descendant_id = %s",
+                   (ancestor_id, task_id))
+    return cursor.fetchone() is not None
+
+
+# Open minutes of every task in scope plus all its descendants, straight from the closure
+_BRANCH_TOTALS = """
+    SELECT c.ancestor_id AS id, SUM(IF(d.status = 'completed', 0, COALESCE(d.time_minutes, 0))) AS total
+    FROM task_closure c
+    JOIN tasks d ON d.id = c.descendant_id
+    {where}
+    GROUP BY c.ancestor_id
+"""
+
+BRANCH_TOTAL_DRIFT_QUERY = """
+    SELECT t.id, t.branch_total_minutes, s.total
+    FROM tasks t
+    JOIN ({totals}) s ON s.id = t.id
+    WHERE t.branch_total_minutes <> s.total
+""".format(totals=_BRANCH_TOTALS.format(where=''))
+
+
+def add_to_branch_totals(cursor, task_id, minutes, include_self=True):
+    """Add minutes to branch_total_minutes of every ancestor of task_id (and of task_id itself)."""
+    if not minutes:
+        return
+    cursor.execute("""
+        UPDATE tasks t
+        JOIN task_closure c ON c.ancestor_id = t.id
+        SET t.branch_total_minutes = t.branch_total_minutes + %s
+        WHERE c.descendant_id = %s AND c.depth >= %s
+    """, (minutes, task_id, 0 if include_self else 1))
+
+
+def get_branch_total(cursor, task_id):
+    cursor.execute("SELECT branch_total_minutes FROM tasks WHERE id = %s", (task_id,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['branch_total_minutes'] if isinstance(row, dict) else row[0]
+
+
+def recompute_branch_totals(cursor, task_id=None):
+    """Recompute branch_total_minutes from scratch for the subtree of task_id, or for every task."""
+    if task_id is None:
+        totals, params = _BRANCH_TOTALS.format(where=''), ()
+    else:
+        where = "WHERE c.ancestor_id IN (SELECT descendant_id FROM task_closure WHERE ancestor_id = %s)"
+        totals, params = _BRANCH_TOTALS.format(where=where), (task_id,)
+    # The GROUP BY keeps the derived table materialized, so it may read the updated table
+    cursor.execute(f"""
+        UPDATE tasks t
+        JOIN ({totals}) s ON s.id = t.id
+        SET t.branch_total_minutes = s.total
+    """, params)
+
+
+def rebuild_closure(cursor, max_depth=10000):
+    """
+    Recompute the whole table from tasks.parent_id, one tree level per statement.
+    INSERT IGNORE stops at the first repeated pair, so parent cycles cannot loop forever.
+    Returns the number of rows. Needs a tuple (non-dictionary) cursor.
+    """
+    cursor.execute("DELETE FROM task_closure")
+    cursor.execute("INSERT INTO task_closure (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM tasks")
+    depth = 0
+    while depth < max_depth:
+        cursor.execute("""
+            INSERT IGNORE INTO task_closure (ancestor_id, descendant_id, depth)
+            SELECT c.ancestor_id, t.id, c.depth + 1
+            FROM tasks t
+            JOIN task_closure c ON c.descendant_id = t.parent_id AND c.depth = %s
+        """, (depth,))
+        if cursor.rowcount <= 0:
+            break
+        depth += 1
+    cursor.execute("SELECT COUNT(*) FROM task_closure")
+    return cursor.fetchone()[0]
+
+
+def check_branch_totals(rebuild=False):
+    """
+    Print the tasks whose stored branch_total_minutes differs from a recomputation.
+    With rebuild=True, recompute every task's total. Returns the number of differing tasks.
+    """
+    from mysql.connector import Error
+    from db_manager import get_db_connection
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(BRANCH_TOTAL_DRIFT_QUERY)
+        drift = cursor.fetchall()
+        for task_id, stored, expected in drift[:50]:
+            print(f"Task {task_id}: stored {stored}, expected {expected}")
+        if rebuild and drift:
+            recompute_branch_totals(cursor)
+            cursor.execute("UPDATE user_data_version SET version = version + 1")
+            conn.commit()
+        print(f"{len(drift)} tasks with a wrong branch total" + (" (rebuilt)." if rebuild and drift else "."))
+        return len(drift)
+    except Error as e:
+        print(f"Error checking branch totals: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    result = check_branch_totals(rebuild='--rebuild' in sys.argv)
+    sys.exit(0 if result == 0 or (result is not None and '--rebuild' in sys.argv) else 1)
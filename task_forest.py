@@ -0,0 +1,234 @@
+"""
+Compact, array-backed task forest shared by every tree walk in the app.
+
+Tasks are addressed by id; internally each task gets a position and the
+links are kept in parallel arrays (parent, first child, next sibling), so a
+forest of a million tasks costs a few arrays instead of a dict and a list per
+task. Children keep the order in which tasks were given (callers pass rows
+already sorted). All traversals are iterative, so deep trees never hit the
+recursion limit.
+
+A task whose parent is not in the forest (NULL, hidden, deleted) is a root.
+Parent links that form a cycle are cut when the forest is built: the first
+task met on each cycle becomes a root and is listed in `cut`, so every
+traversal terminates.
+"""
+from array import array
+
+_NONE = -1
+
+
+class TaskForest:
+    __slots__ = ('ids', '_pos', '_parent', '_first_child', '_next_sibling', '_first_root', 'cut')
+
+    def __init__(self, ids, parent_ids):
+        self.ids = list(ids)
+        n = len(self.ids)
+        self._pos = {task_id: i for i, task_id in enumerate(self.ids)}
+        self._parent = array('q', [_NONE]) * n
+        self._first_child = array('q', [_NONE]) * n
+        self._next_sibling = array('q', [_NONE]) * n
+        self._first_root = _NONE
+        self.cut = set()
+
+        pos = self._pos
+        parent = self._parent
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        last_child = array('q', [_NONE]) * n
+        last_root = _NONE
+        for i, parent_id in enumerate(parent_ids):
+            p = pos.get(parent_id, _NONE) if parent_id is not None else _NONE
+            if p == i:
+                p = _NONE
+                self.cut.add(self.ids[i])
+            parent[i] = p
+            if p == _NONE:
+                if last_root == _NONE:
+                    self._first_root = i
+                else:
+                    next_sibling[last_root] = i
+                last_root = i
+            else:
+                if last_child[p] == _NONE:
+                    first_child[p] = i
+                else:
+                    next_sibling[last_child[p]] = i
+                last_child[p] = i
+
+        self._break_cycles(last_root)
+
+    @classmethod
+    def from_tasks(cls, tasks, id_key='id', parent_key='parent_id'):
+        """Build from task dicts (or any mappings with an id and a parent id)."""
+        return cls((t[id_key] for t in tasks), [t.get(parent_key) for t in tasks])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (id, parent_id, ...) tuples, e.g. straight from a cursor."""
+        return cls((row[0] for row in rows), [row[1] for row in rows])
+
+    def _break_cycles(self, last_root):
+        # Tasks on a parent cycle (and anything below them) are not reachable from any root
+        n = len(self.ids)
+        reached = bytearray(n)
+        count = 0
+        for i in self._walk(_NONE):
+            reached[i] = 1
+            count += 1
+        if count == n:
+            return
+        parent = self._parent
+        for start in range(n):
+            if reached[start]:
+                continue
+            # Climb until a task repeats: that task is on the cycle
+            seen = set()
+            i = start
+            while i != _NONE and i not in seen and not reached[i]:
+                seen.add(i)
+                i = parent[i]
+            if i == _NONE or reached[i]:
+                continue
+            self._detach(i)
+            if last_root == _NONE:
+                self._first_root = i
+            else:
+                self._next_sibling[last_root] = i
+            last_root = i
+            self.cut.add(self.ids[i])
+            for j in self._walk(i):
+                reached[j] = 1
+
+    def _detach(self, i):
+        p = self._parent[i]
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        if first_child[p] == i:
+            first_child[p] = next_sibling[i]
+        else:
+            prev = first_child[p]
+            while next_sibling[prev] != i:
+                prev = next_sibling[prev]
+            next_sibling[prev] = next_sibling[i]
+        next_sibling[i] = _NONE
+        self._parent[i] = _NONE
+
+    def _walk(self, start):
+        """Positions in pre-order: the whole forest (start=_NONE) or the subtree of start."""
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        if start == _NONE:
+            stack = [self._first_root] if self._first_root != _NONE else []
+        else:
+            yield start
+            child = first_child[start]
+            stack = [child] if child != _NONE else []
+        while stack:
+            i = stack.pop()
+            yield i
+            # The sibling is pushed first so the whole subtree of i comes before it
+            sibling = next_sibling[i]
+            if sibling != _NONE:
+                stack.append(sibling)
+            child = first_child[i]
+            if child != _NONE:
+                stack.append(child)
+
+    def _walk_post(self, start):
+        """Positions in post-order, children before their parent, without a stack."""
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        parent = self._parent
+        i = self._first_root if start == _NONE else start
+        if i == _NONE:
+            return
+        while True:
+            while first_child[i] != _NONE:
+                i = first_child[i]
+            while True:
+                yield i
+                if i == start:
+                    return
+                if next_sibling[i] != _NONE:
+                    i = next_sibling[i]
+                    break
+                i = parent[i]
+                if i == _NONE:
+                    return
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, task_id):
+        return task_id in self._pos
+
+    @property
+    def roots(self):
+        ids = self.ids
+        next_sibling = self._next_sibling
+        roots = []
+        i = self._first_root
+        while i != _NONE:
+            roots.append(ids[i])
+            i = next_sibling[i]
+        return roots
+
+    def parent(self, task_id):
+        """Parent id, or None for roots."""
+        p = self._parent[self._pos[task_id]]
+        return self.ids[p] if p != _NONE else None
+
+    def children(self, task_id):
+        ids = self.ids
+        next_sibling = self._next_sibling
+        children = []
+        i = self._first_child[self._pos[task_id]]
+        while i != _NONE:
+            children.append(ids[i])
+            i = next_sibling[i]
+        return children
+
+    def preorder(self, task_id=None):
+        """Ids in pre-order: the whole forest, or task_id and its descendants."""
+        ids = self.ids
+        start = _NONE if task_id is None else self._pos[task_id]
+        return (ids[i] for i in self._walk(start))
+
+    def postorder(self, task_id=None):
+        """Ids in post-order (every task after all of its descendants)."""
+        ids = self.ids
+        start = _NONE if task_id is None else self._pos[task_id]
+        return (ids[i] for i in self._walk_post(start))
+
+    def descendants(self, task_id):
+        """Ids of all descendants of task_id, in pre-order, without task_id itself."""
+        walk = self.preorder(task_id)
+        next(walk)
+        return walk
+
+    def ancestors(self, task_id):
+        """Ids from the parent of task_id up to its root."""
+        ids = self.ids
+        parent = self._parent
+        i = parent[self._pos[task_id]]
+        while i != _NONE:
+            yield ids[i]
+            i = parent[i]
+
+    def root(self, task_id):
+        i = self._pos[task_id]
+        parent = self._parent
+        while parent[i] != _NONE:
+            i = parent[i]
+        return self.ids[i]
+
+    def depth(self, task_id):
+        return sum(1 for _ in self.ancestors(task_id))
+
+    def parent_positions(self):
+        """
+        Parent of every task as an index into `ids` (-1 for roots), after cycles were cut.
+        An int64 array('q'), so numpy.frombuffer can wrap it without copying. Do not modify.
+        """
+        return self._parent
@@ -1,94 +1,272 @@
-from db_manager import get_db_connection
+from db_manager import get_db_connection, bump_user_data_version, get_user_data_version
 import json
+import time
 from mysql.connector import Error
 
 from ai_service import AIService
 from tag_utils import extract_tags_from_text, strip_tags_from_text
+from description_utils import description_columns, make_search_text
+from blob_store import BlobStore, rewrite_inline_images
 from ctask import CTask
 from info_panel_manager import InfoPanelManager
-from search_manager import SearchManager
+from search_manager import SearchManager, fulltext_query, like_contains
+from task_forest import TaskForest
+from task_closure import (insert_task_closure, clone_subtree_closure, move_subtree_closure, is_in_subtree, rebuild_closure,
+                          add_to_branch_totals, get_branch_total, recompute_branch_totals)
+from forest_cache import forest_cache
+from trigram_index import search_index
+from stats_service import lock_rollup, subtree_stats, apply_stats_delta, reset_stats_rollups
+from tag_store import link_tags
+from ai_worker import ai_jobs
+
+# Hot queries of the index page. Kept here so test_query_plans.py can EXPLAIN the exact SQL.
+# List views read description_preview/has_description; the full description is only loaded
+# for the task detail page (get_task_details / get_task_description).
+# sort_key puts pending tasks first (newest created first), then completed ones (newest completed first).
+LIST_TASKS_QUERY = """
+    SELECT id, title, status, created_at, parent_id, time_minutes, ai_suggestion, importance, description_preview, has_description, hide_until, due_at, is_folded, level, branch_id, completed_at, branch_total_minutes, ai_status
+    FROM tasks
+    WHERE user_id = %s
+    AND (hide_until IS NULL OR hide_until <= NOW())
+    ORDER BY sort_key DESC
+"""
+
+# Filtered list: SearchManager.build_filter_query supplies the WITH clause defining filtered_ids
+FILTERED_LIST_TASKS_QUERY = """
+    {with_clause}
+    SELECT id, title, status, created_at, parent_id, time_minutes, ai_suggestion, importance, description_preview, has_description, hide_until, due_at, is_folded, level, branch_id, completed_at, branch_total_minutes, ai_status
+    FROM tasks
+    WHERE user_id = %s
+    AND (hide_until IS NULL OR hide_until <= NOW())
+    AND id IN (SELECT id FROM filtered_ids)
+    ORDER BY sort_key DESC
+"""
+
+# Hidden tasks whose (stored) branch totals must be taken off their visible ancestors in the list view
+HIDDEN_BRANCH_TOTALS_QUERY = """
+    SELECT parent_id, branch_total_minutes
+    FROM tasks
+    WHERE user_id = %s AND hide_until > NOW() AND parent_id IS NOT NULL AND branch_total_minutes <> 0
+"""
+
+USER_TASK_TAGS_QUERY = """
+    SELECT tt.task_id, t.id, t.name
+    FROM tags t
+    JOIN task_tags tt ON t.id = tt.tag_id
+    WHERE t.user_id = %s
+"""
+
+TASK_TAGS_FOR_IDS_QUERY = """
+    SELECT tt.task_id, t.id, t.name
+    FROM tags t
+    JOIN task_tags tt ON t.id = tt.tag_id
+    WHERE t.user_id = %s AND tt.task_id IN ({placeholders})
+"""
+
+# Ranked full-text search (FULLTEXT index ft_tasks_search on the title + description shadow)
+SEARCH_TASKS_QUERY = """
+    SELECT id, title, status, parent_id, description_preview,
+           MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM tasks
+    WHERE user_id = %s
+    AND (hide_until IS NULL OR hide_until <= NOW())
+    AND MATCH(search_text) AGAINST (%s IN BOOLEAN MODE)
+    ORDER BY score DESC, sort_key DESC
+    LIMIT %s
+"""
+
+# Fallback for queries with no word long enough for the FULLTEXT index
+SEARCH_TITLES_QUERY = """
+    SELECT id, title, status, parent_id, description_preview, 0 AS score
+    FROM tasks
+    WHERE user_id = %s
+    AND (hide_until IS NULL OR hide_until <= NOW())
+    AND LOWER(title) LIKE %s
+    ORDER BY sort_key DESC
+    LIMIT %s
+"""
+
+# Rows the in-memory trigram index (trigram_index.py) is built from
+SEARCH_INDEX_TASKS_QUERY = "SELECT id, parent_id, title FROM tasks WHERE user_id = %s"
+SEARCH_INDEX_TAGS_QUERY = "SELECT id, name FROM tags WHERE user_id = %s"
+
+# Deepest subtask level get_task_details loads when no depth limit is given
+MAX_TREE_DEPTH = 1000
+
+# One task's branch through task_closure, the task itself first.
+# Tasks on the depth limit also get whether they have children.
+TASK_BRANCH_QUERY = """
+    SELECT t.id, t.title, t.status, t.created_at, t.parent_id, t.time_minutes, t.ai_suggestion, t.importance,
+           IF(c.depth = 0, t.description, NULL) AS description, t.description_preview, t.has_description,
+           t.hide_until, t.due_at, t.is_folded, t.level, t.branch_id, t.completed_at, c.depth,
+           t.branch_total_minutes, t.ai_status,
+           c.depth = %s AND EXISTS (SELECT 1 FROM tasks ch WHERE ch.parent_id = t.id) AS has_more
+    FROM task_closure c
+    JOIN tasks t ON t.id = c.descendant_id
+    WHERE c.ancestor_id = %s AND t.user_id = %s AND c.depth <= %s
+    ORDER BY c.depth = 0 DESC, (t.status = 'completed') ASC, t.created_at DESC
+"""
+
+TASK_BRANCH_TAGS_QUERY = """
+    SELECT tt.task_id, g.id, g.name
+    FROM task_closure c
+    JOIN task_tags tt ON tt.task_id = c.descendant_id
+    JOIN tags g ON g.id = tt.tag_id
+    WHERE c.ancestor_id = %s AND c.depth <= %s AND g.user_id = %s
+"""
+
+# Polled by the page while suggestions are generated in the background
+AI_STATUS_QUERY = "SELECT id, status, ai_status, ai_suggestion FROM tasks WHERE user_id = %s AND id IN ({placeholders})"
+MAX_AI_STATUS_IDS = 100
+
+# What duplicate_task copies of a branch, parents before children
+DUPLICATE_BRANCH_QUERY = """
+    SELECT t.id, t.parent_id, t.title, t.description, t.description_preview, t.has_description,
+           t.time_minutes, t.importance, t.ai_suggestion, t.due_at, t.level, t.branch_id, c.depth
+    FROM task_closure c
+    JOIN tasks t ON t.id = c.descendant_id
+    WHERE c.ancestor_id = %s AND t.user_id = %s
+    ORDER BY c.depth, t.id
+"""
+
+DUPLICATE_BRANCH_TAGS_QUERY = """
+    SELECT tt.task_id, tt.tag_id
+    FROM task_closure c
+    JOIN task_tags tt ON tt.task_id = c.descendant_id
+    WHERE c.ancestor_id = %s
+"""
+
+# One level of copies per statement: rows=', '.join([DUPLICATE_ROW] * n)
+DUPLICATE_INSERT_QUERY = (
+    "INSERT INTO tasks (user_id, title, description, description_preview, has_description, search_text, "
+    "time_minutes, importance, ai_suggestion, parent_id, due_at, level, branch_id, branch_total_minutes) VALUES {rows}"
+)
+DUPLICATE_ROW = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+# Most copies one duplicate_task call makes
+MAX_DUPLICATES = 100
+# Rows per multi-row INSERT
+INSERT_BATCH_SIZE = 500
+
+# Completion of a whole branch in one statement through task_closure: (task_id, user_id)
+COMPLETE_SUBTREE_QUERY = """
+    UPDATE tasks t
+    JOIN task_closure c ON c.descendant_id = t.id
+    SET t.status = 'completed', t.completed_at = NOW(), t.branch_total_minutes = 0
+    WHERE c.ancestor_id = %s AND t.user_id = %s
+"""
+
+# Move the due dates of a branch by a number of seconds: (seconds, task_id, min_depth, user_id).
+# min_depth 1 leaves the task itself alone.
+SHIFT_DUE_DATES_QUERY = """
+    UPDATE tasks t
+    JOIN task_closure c ON c.descendant_id = t.id
+    SET t.due_at = t.due_at + INTERVAL %s SECOND
+    WHERE c.ancestor_id = %s AND c.depth >= %s AND t.user_id = %s AND t.due_at IS NOT NULL
+"""
+
+UNCOMPLETE_SUBTREE_QUERY = """
+    UPDATE tasks t
+    JOIN task_closure c ON c.descendant_id = t.id
+    SET t.status = 'pending', t.completed_at = NULL
+    WHERE c.ancestor_id = %s AND t.user_id = %s AND t.status = 'completed'
+"""
+
+# Seconds until the next hidden task of a user becomes visible again (NULL if none)
+NEXT_UNHIDE_QUERY = """
+    SELECT TIMESTAMPDIFF(SECOND, NOW(), MIN(hide_until)) AS seconds
+    FROM tasks
+    WHERE user_id = %s AND hide_until > NOW()
+"""
 
 class TaskManager:
     def __init__(self):
         self.ai_service = AIService()
+        self.blob_store = BlobStore()
 
-    def duplicate_task(self, user_id, task_id):
-        """Duplicate a task and its subtasks recursively."""
+    def duplicate_task(self, user_id, task_id, times=1):
+        """
+        Duplicate a task and its subtasks, `times` copies next to the original (e.g. to stamp out a template).
+        The branch is read once; the copies are written level by level with multi-row INSERTs,
+        all in one transaction.
+        """
+        try:
+            times = max(1, min(int(times), MAX_DUPLICATES))
+        except (ValueError, TypeError):
+            times = 1
         conn = get_db_connection()
         if not conn:
             return False
-        
+
         try:
             cursor = conn.cursor(dictionary=True)
-            
-            # 1. Fetch original task
-            cursor.execute("SELECT * FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
-            original_task = cursor.fetchone()
-            
-            if not original_task:
+            rollup_fresh = lock_rollup(cursor, user_id)
+            cursor.execute(DUPLICATE_BRANCH_QUERY, (task_id, user_id))
+            branch = cursor.fetchall()
+            if not branch or branch[0]['id'] != task_id:
+                conn.rollback()
                 return False
-            
-            # 2. Define recursive copy function (internal to method or class)
-            def copy_task_recursive(original_id, parent_id_for_new, is_root=False):
-                # Fetch original data again or pass it if already fetched (for root)
-                if is_root:
-                    curr_task = original_task
-                else:
-                    cursor.execute("SELECT * FROM tasks WHERE id = %s AND user_id = %s", (original_id, user_id))
-                    curr_task = cursor.fetchone()
-                    if not curr_task:
-                        return
-                    
-                # Prepare new title
-                new_title = curr_task['title']
-                if is_root:
-                    new_title += " copy"
-                    
-                # Insert new task
-                insert_query = """
-                    INSERT INTO tasks (user_id, title, description, time_minutes, importance, ai_suggestion, parent_id, due_at, branch_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                # Note: branch_id logic is complex usually, CTask handles it on insert triggers or similar? 
-                # Assuming simple insert works and triggers handle branch_id if exists. 
-                # If DB triggers handle branch_id, passing NULL or letting it default is fine.
-                # However, original schema might not have triggers. 
-                # Let's check if we need to set branch_id manually. 
-                # For now, let's assume we pass what we have, but usually branch_id is root's ID.
-                # If we create a NEW root, its branch_id is itself (or updated later). 
-                # Let's ignore branch_id in INSERT if it's auto-handled or pass None.
-                
-                cursor.execute(insert_query, (
-                    user_id, 
-                    new_title, 
-                    curr_task['description'], 
-                    curr_task['time_minutes'], 
-                    curr_task['importance'], 
-                    curr_task['ai_suggestion'], 
-                    parent_id_for_new,
-                    curr_task['due_at'],
-                    None # branch_id defaults usually, or handled by logic
-                ))
-                new_task_id = cursor.lastrowid
-                
-                # Copy Tags
-                cursor.execute("SELECT tag_id FROM task_tags WHERE task_id = %s", (original_id,))
-                tags = cursor.fetchall()
-                for tag in tags:
-                    cursor.execute("INSERT INTO task_tags (task_id, tag_id) VALUES (%s, %s)", (new_task_id, tag['tag_id']))
-                
-                # Recursively copy children
-                cursor.execute("SELECT id FROM tasks WHERE parent_id = %s AND user_id = %s", (original_id, user_id))
-                children = cursor.fetchall()
-                
-                for child in children:
-                    copy_task_recursive(child['id'], new_task_id, is_root=False)
-                    
-            # 3. Start recursion
-            copy_task_recursive(task_id, original_task['parent_id'], is_root=True)
+            cursor.execute(DUPLICATE_BRANCH_TAGS_QUERY, (task_id,))
+            branch_tags = cursor.fetchall()
+            cursor.execute("SELECT @@auto_increment_increment AS step")
+            id_step = cursor.fetchone()['step']
+            cursor.close()
+            cursor = conn.cursor()
+
+            root = branch[0]
+            # Copies are pending, so a branch total is simply all of its minutes (deepest tasks first)
+            totals = {t['id']: t['time_minutes'] or 0 for t in branch}
+            for t in reversed(branch[1:]):
+                totals[t['parent_id']] += totals[t['id']]
+            levels = {}
+            for t in branch:
+                levels.setdefault(t['depth'], []).append(t)
+
+            for copy_number in range(1, times + 1):
+                suffix = " copy" if times == 1 else f" copy {copy_number}"
+                id_map = {}
+                branch_id = root['branch_id'] if root['parent_id'] else None
+                for depth in sorted(levels):
+                    tasks = levels[depth]
+                    for i in range(0, len(tasks), INSERT_BATCH_SIZE):
+                        chunk = tasks[i:i + INSERT_BATCH_SIZE]
+                        values = []
+                        for t in chunk:
+                            title = t['title'] + suffix if t['id'] == task_id else t['title']
+                            values.extend([
+                                user_id, title, t['description'], t['description_preview'], t['has_description'],
+                                make_search_text(title, t['description']), t['time_minutes'], t['importance'],
+                                t['ai_suggestion'], id_map.get(t['parent_id'], root['parent_id']), t['due_at'],
+                                (root['level'] or 0) + depth, branch_id, totals[t['id']],
+                            ])
+                        cursor.execute(DUPLICATE_INSERT_QUERY.format(rows=', '.join([DUPLICATE_ROW] * len(chunk))), values)
+                        # A multi-row INSERT gets consecutive ids, starting at lastrowid
+                        first_id = cursor.lastrowid
+                        for k, t in enumerate(chunk):
+                            id_map[t['id']] = first_id + k * id_step
+                    if depth == 0 and branch_id is None:
+                        # A copied top-level task starts its own branch
+                        branch_id = str(id_map[task_id])
+                        cursor.execute("UPDATE tasks SET branch_id = %s WHERE id = %s", (branch_id, id_map[task_id]))
+
+                links = [(id_map[row['task_id']], row['tag_id']) for row in branch_tags]
+                for i in range(0, len(links), INSERT_BATCH_SIZE):
+                    chunk = links[i:i + INSERT_BATCH_SIZE]
+                    cursor.execute("INSERT INTO task_tags (task_id, tag_id) VALUES " + ', '.join(['(%s, %s)'] * len(chunk)),
+                                   [value for link in chunk for value in link])
+
+                copy_id = id_map[task_id]
+                clone_subtree_closure(cursor, task_id, id_map, root['parent_id'])
+                add_to_branch_totals(cursor, copy_id, totals[task_id], include_self=False)
+                apply_stats_delta(cursor, user_id, {}, subtree_stats(cursor, user_id, copy_id), rollup_fresh)
+
+            bump_user_data_version(cursor, user_id)
             conn.commit()
+            forest_cache.invalidate(user_id)
+            search_index.invalidate(user_id)
+            print(f"Duplicated task {task_id} {times}x ({len(branch)} tasks each).")
             return True
-            
+
         except Error as e:
             print(f"Error duplicating task: {e}")
             conn.rollback()
@@ -102,27 +280,11 @@ class TaskManager:
         conn = get_db_connection()
         if conn:
             try:
-                # Call AI
-                ai_suggestion_json = None
-                if run_ai:
-                    branch_context = None
-                    current_leaf_title = None
-                    
-                    if parent_id:
-                        try:
-                            # Use CTask to get branch context
-                            parent_ctask = CTask(user_id, int(parent_id))
-                            branch_structure = parent_ctask.get_full_task_structure_json()
-                            if branch_structure:
-                                branch_context = json.dumps(branch_structure)
-                            current_leaf_title = title
-                        except Exception as e:
-                            print(f"Error fetching branch context: {e}")
+                # Suggestions are generated in the background (ai_worker); the page polls for them
+                ai_status = 'pending' if run_ai and self.ai_service.client else None
 
-                    ai_suggestions = self.ai_service.get_task_suggestion(title, branch_context, current_leaf_title)
-                    ai_suggestion_json = json.dumps(ai_suggestions) if ai_suggestions else None
-                
                 cursor = conn.cursor()
+                rollup_fresh = lock_rollup(cursor, user_id)
                 if parent_id == '' or parent_id == 'None':
                     parent_id = None
                 
@@ -149,35 +311,46 @@ class TaskManager:
                         level = parent[0] + 1
                         branch_id = parent[1]
 
-                query = "INSERT INTO tasks (title, status, parent_id, time_minutes, ai_suggestion, user_id, importance, description, due_at, level, branch_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-                cursor.execute(query, (title, 'pending', parent_id, time_minutes, ai_suggestion_json, user_id, importance, description, due_at, level, branch_id))
-                conn.commit()
+                description, _ = rewrite_inline_images(description, self.blob_store)
+                description_preview, has_description = description_columns(description)
+
+                search_text = make_search_text(title, description)
+
+                query = "INSERT INTO tasks (title, status, parent_id, time_minutes, ai_status, user_id, importance, description, description_preview, has_description, search_text, due_at, level, branch_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+                cursor.execute(query, (title, 'pending', parent_id, time_minutes, ai_status, user_id, importance, description, description_preview, has_description, search_text, due_at, level, branch_id))
                 task_id = cursor.lastrowid
+                insert_task_closure(cursor, task_id, parent_id)
+                add_to_branch_totals(cursor, task_id, time_minutes)
 
                 # If root task, branch_id is its own ID
                 if not parent_id:
                     branch_id = str(task_id)
                     cursor.execute("UPDATE tasks SET branch_id = %s WHERE id = %s", (branch_id, task_id))
-                    conn.commit()
-                
-                # Handle Tags
-                if tags_to_add:
-                    ctask = CTask(user_id, task_id)
-                    for tag in tags_to_add:
-                        ctask.add_tag(tag)
+
+                # Handle Tags, in the same transaction
+                tag_links = link_tags(cursor, user_id, task_id, tags_to_add) if tags_to_add else []
+
+                apply_stats_delta(cursor, user_id, {}, subtree_stats(cursor, user_id, task_id), rollup_fresh)
+                version = bump_user_data_version(cursor, user_id)
+                conn.commit()
+                search_index.task_saved(user_id, version, task_id, title, int(parent_id) if parent_id else None, tag_links)
+                if ai_status:
+                    ai_jobs.submit(self.ai_service, user_id, task_id, title, int(parent_id) if parent_id else None)
 
                 # Remove suggestion from parent if this was converted from one
                 if parent_id and from_suggestion_text:
                     try:
-                        parent_ctask = CTask(user_id, int(parent_id))
+                        parent_ctask = CTask(user_id, int(parent_id), conn)
                         parent_ctask.remove_ai_suggestion(from_suggestion_text)
                     except Exception as e:
                         print(f"Error removing suggestion from parent: {e}")
 
+                forest_cache.invalidate(user_id)
                 print(f"Task '{title}' added successfully.")
                 return True
             except Error as e:
                 print(f"Error adding task: {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
@@ -185,37 +358,45 @@ class TaskManager:
         return False
 
     def list_tasks(self, user_id, search_query=None, tag_filter=None, importance_filter=None, period_filter=None):
-        """List tasks in a hierarchy, optionally filtered by search query, tag, importance, or period."""
+        """
+        List tasks in a hierarchy, optionally filtered by search query, tag, importance, or period.
+        Built forests are cached per user and filter set until the user's data version changes (see forest_cache).
+        """
+        cache_key = (search_query, tag_filter, importance_filter, period_filter)
         conn = get_db_connection()
         tasks_tree = []
         if conn:
             try:
                 cursor = conn.cursor(dictionary=True)
-                # Sort: Pending (0) first, Completed (1) last. Then by created_at.
-                query = """
-                    SELECT id, title, status, created_at, parent_id, time_minutes, ai_suggestion, importance, description, hide_until, due_at, is_folded, level, branch_id, completed_at
-                    FROM tasks 
-                    WHERE user_id = %s 
-                    AND (hide_until IS NULL OR hide_until <= NOW())
-                    ORDER BY 
-                        (status = 'completed') ASC,
-                        CASE 
-                            WHEN status = 'completed' THEN completed_at 
-                            ELSE created_at 
-                        END DESC
-                """
-                cursor.execute(query, (user_id,))
+                # One indexed lookup decides whether a cached forest is still current,
+                # whichever worker made the last write
+                version = get_user_data_version(cursor, user_id)
+                cached = forest_cache.get(user_id, cache_key, version)
+                if cached is not None:
+                    return cached
+
+                # Sort: Pending first, Completed last (served by idx_tasks_user_sort).
+                # Filters are applied in SQL so only the matching branches are read.
+                filter_query = SearchManager.build_filter_query(user_id, search_query, tag_filter, importance_filter, period_filter)
+                if filter_query:
+                    with_clause, filter_params = filter_query
+                    cursor.execute(FILTERED_LIST_TASKS_QUERY.format(with_clause=with_clause), (*filter_params, user_id))
+                else:
+                    cursor.execute(LIST_TASKS_QUERY, (user_id,))
                 all_tasks = cursor.fetchall()
 
                 # --- 1. Build Tree Structure ---
-                # Fetch all tags for all user tasks to avoid N+1 problem
-                cursor.execute("""
-                    SELECT tt.task_id, t.id, t.name 
-                    FROM tags t
-                    JOIN task_tags tt ON t.id = tt.tag_id
-                    WHERE t.user_id = %s
-                """, (user_id,))
-                all_tags_raw = cursor.fetchall()
+                # Fetch all tags for the listed tasks to avoid N+1 problem
+                if filter_query:
+                    all_tags_raw = []
+                    task_ids = [task['id'] for task in all_tasks]
+                    if task_ids:
+                        placeholders = ', '.join(['%s'] * len(task_ids))
+                        cursor.execute(TASK_TAGS_FOR_IDS_QUERY.format(placeholders=placeholders), (user_id, *task_ids))
+                        all_tags_raw = cursor.fetchall()
+                else:
+                    cursor.execute(USER_TASK_TAGS_QUERY, (user_id,))
+                    all_tags_raw = cursor.fetchall()
                 task_tags_map = {}
                 for row in all_tags_raw:
                     tid = row['task_id']
@@ -225,9 +406,8 @@ class TaskManager:
 
                 tasks_map = {task['id']: task for task in all_tasks}
                 for task in all_tasks:
-                   task['children'] = []
                    task['own_time'] = task['time_minutes'] if task['time_minutes'] else 0
-                   task['branch_total'] = 0 # Will be calculated
+                   task['branch_total'] = task['branch_total_minutes']
                    task['tags'] = task_tags_map.get(task['id'], [])
 
                    if task['ai_suggestion']:
@@ -235,41 +415,46 @@ class TaskManager:
                            task['ai_suggestion'] = json.loads(task['ai_suggestion'])
                        except (json.JSONDecodeError, TypeError):
                            pass
-                
-                # --- 1.5 Apply Filters if provided ---
-                if search_query or tag_filter or importance_filter or period_filter:
-                    all_tasks = SearchManager.filter_tasks(all_tasks, search_query, tag_filter, importance_filter, period_filter)
-                    # Rebuild maps with filtered tasks
-                    tasks_map = {task['id']: task for task in all_tasks}
-                
-                # Link children to parents
+
+                # Link children to parents. Tasks whose parent is not listed (hidden) stay out of the tree.
+                forest = TaskForest.from_tasks(all_tasks)
                 root_tasks = []
-                for task in all_tasks:
-                    if task['parent_id']:
-                        parent = tasks_map.get(task['parent_id'])
-                        if parent:
-                            parent['children'].append(task)
-                    else:
+                for task_id in forest.roots:
+                    task = tasks_map[task_id]
+                    if not task['parent_id'] or task_id in forest.cut:
                         root_tasks.append(task)
-                
-                # --- 2. Calculate Branch Totals (Recursive) ---
-                def calculate_branch_total(task):
-                    # Only count own time if NOT completed
-                    total = task['own_time'] if task['status'] != 'completed' else 0
-                    
-                    for child in task['children']:
-                        total += calculate_branch_total(child)
-                    
-                    task['branch_total'] = total
-                    return total
+                for task in all_tasks:
+                    task['children'] = [tasks_map[child_id] for child_id in forest.children(task['id'])]
 
-                # Run on all roots (this will traverse the whole forest)
-                for task in root_tasks:
-                    calculate_branch_total(task)
+                # --- 2. Branch Totals ---
+                if filter_query:
+                    # Only the matching tasks count (children before parents)
+                    for task_id in forest.postorder():
+                        task = tasks_map[task_id]
+                        # Only count own time if NOT completed
+                        total = task['own_time'] if task['status'] != 'completed' else 0
+                        for child in task['children']:
+                            total += child['branch_total']
+                        task['branch_total'] = total
+                else:
+                    # Stored totals include hidden branches; take those off the visible ancestors
+                    cursor.execute(HIDDEN_BRANCH_TOTALS_QUERY, (user_id,))
+                    for row in cursor.fetchall():
+                        parent = tasks_map.get(row['parent_id'])
+                        if parent is None:
+                            continue  # under another hidden task, already taken off with it
+                        parent['branch_total'] -= row['branch_total_minutes']
+                        for ancestor_id in forest.ancestors(parent['id']):
+                            tasks_map[ancestor_id]['branch_total'] -= row['branch_total_minutes']
 
                 tasks_tree = root_tasks
                 
-                stats = InfoPanelManager.calculate_stats(all_tasks)
+                stats = InfoPanelManager.calculate_stats(all_tasks, forest)
+
+                cursor.execute(NEXT_UNHIDE_QUERY, (user_id,))
+                row = cursor.fetchone()
+                expires_at = self._forest_expiry(row['seconds'] if row else None, tag_filter, period_filter)
+                forest_cache.put(user_id, cache_key, (tasks_tree, stats), version, expires_at)
                 return tasks_tree, stats
 
             except Error as e:
@@ -281,118 +466,206 @@ class TaskManager:
         
         return [], InfoPanelManager.calculate_stats([])
 
-    def get_task_details(self, user_id, task_id):
+    @staticmethod
+    def _forest_expiry(seconds_until_unhide, tag_filter=None, period_filter=None):
+        """
+        Timestamp until which a built forest stays valid without any write:
+        the next time a hidden task reappears and, for period views, the next midnight.
         """
-        Fetches a specific task and its hierarchical children.
+        import datetime
+        now = time.time()
+        expiry = float('inf')
+        if seconds_until_unhide is not None:
+            expiry = now + max(int(seconds_until_unhide), 0)
+        if period_filter and period_filter != 'all' and not tag_filter:
+            tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+            midnight = datetime.datetime.combine(tomorrow, datetime.time()).timestamp()
+            expiry = min(expiry, midnight)
+        return expiry
+
+    def get_task_details(self, user_id, task_id, max_depth=None):
         """
+        Fetches a specific task and its hierarchical children (hidden ones included).
+        Only the task's branch is read: one query for the tasks, one for their tags.
+        With max_depth, subtasks deeper than that many levels are left out; tasks on the
+        last level get `has_more`. Branch totals are the stored ones, so they always count
+        the whole branch.
+        """
+        depth_limit = max_depth if max_depth is not None else MAX_TREE_DEPTH
         try:
             conn = get_db_connection()
             if conn:
                 cursor = conn.cursor(dictionary=True)
-                
-                # 1. Fetch the main task
-                query_task = """
-                    SELECT id, title, status, created_at, parent_id, time_minutes, ai_suggestion, importance, description, hide_until, due_at, is_folded, level, branch_id
-                    FROM tasks 
-                    WHERE id = %s AND user_id = %s
-                """
-                cursor.execute(query_task, (task_id, user_id))
-                task = cursor.fetchone()
-                
-                if not task:
-                    return None, []
 
-                # Fetch tags for the main task
-                cursor.execute("""
-                    SELECT t.id, t.name 
-                    FROM tags t
-                    JOIN task_tags tt ON t.id = tt.tag_id
-                    WHERE tt.task_id = %s
-                """, (task_id,))
-                task['tags'] = cursor.fetchall()
-
-                # Parse AI Suggestion
-                if task.get('ai_suggestion'):
-                    try:
-                        import json
-                        if isinstance(task['ai_suggestion'], str) and (task['ai_suggestion'].startswith('[') or task['ai_suggestion'].startswith('{')):
-                             task['ai_suggestion'] = json.loads(task['ai_suggestion'])
-                    except:
-                        pass
-                
-                # 2. Fetch all descendants (naive approach: fetch all user tasks and build tree, effectively reusing list_tasks logic but filtering for this branch)
-                # For efficiency/simplicity reusing list_tasks logic but we need to find the subtree
-                
-                # Alternatively, fetch all tasks for user and filter in python
-                query_all = """
-                    SELECT id, title, status, created_at, parent_id, time_minutes, ai_suggestion, importance, description, hide_until, due_at, is_folded, level, branch_id, completed_at
-                    FROM tasks 
-                    WHERE user_id = %s 
-                    ORDER BY (status = 'completed') ASC, created_at DESC
-                """
-                cursor.execute(query_all, (user_id,))
-                all_tasks = cursor.fetchall()
+                # 1. The task (depth 0, with its full description) and its descendants
+                cursor.execute(TASK_BRANCH_QUERY, (depth_limit, task_id, user_id, depth_limit))
+                branch_tasks = cursor.fetchall()
+                if not branch_tasks or branch_tasks[0]['depth'] != 0:
+                    return None, []
 
-                # Fetch tags for all tasks to avoid N+1
-                cursor.execute("""
-                    SELECT tt.task_id, t.id, t.name 
-                    FROM tags t
-                    JOIN task_tags tt ON t.id = tt.tag_id
-                    WHERE t.user_id = %s
-                """, (user_id,))
-                all_tags_raw = cursor.fetchall()
+                # 2. Tags of the same tasks
+                cursor.execute(TASK_BRANCH_TAGS_QUERY, (task_id, depth_limit, user_id))
                 task_tags_map = {}
-                for row in all_tags_raw:
-                    tid = row['task_id']
-                    if tid not in task_tags_map:
-                        task_tags_map[tid] = []
-                    task_tags_map[tid].append({'id': row['id'], 'name': row['name']})
-                
-                # Parse JSON for all
-                import json
-                for t in all_tasks:
-                     if t.get('ai_suggestion') and isinstance(t['ai_suggestion'], str) and (t['ai_suggestion'].startswith('[') or t['ai_suggestion'].startswith('{')):
+                for row in cursor.fetchall():
+                    task_tags_map.setdefault(row['task_id'], []).append({'id': row['id'], 'name': row['name']})
+
+                tasks_map = {t['id']: t for t in branch_tasks}
+                for t in branch_tasks:
+                    t['tags'] = task_tags_map.get(t['id'], [])
+                    t['own_time'] = t['time_minutes'] or 0
+                    if t.get('ai_suggestion') and isinstance(t['ai_suggestion'], str) and (t['ai_suggestion'].startswith('[') or t['ai_suggestion'].startswith('{')):
                         try:
                             t['ai_suggestion'] = json.loads(t['ai_suggestion'])
-                        except:
+                        except (json.JSONDecodeError, TypeError):
                             pass
-                
-                # Build Map
-                tasks_map = {t['id']: t for t in all_tasks}
-                for t in all_tasks:
-                    t['children'] = []
-                    t['tags'] = task_tags_map.get(t['id'], [])
-                    
-                # Build Tree
-                root_children = []
-                for t in all_tasks:
-                    pid = t['parent_id']
-                    if pid and pid in tasks_map:
-                        tasks_map[pid]['children'].append(t)
-                    elif pid == task_id: 
-                         # Direct child of our target task (if we only fetched descendants this would be easier, 
-                         # but since we fetched all, we look for nodes whose parent is task_id)
-                         root_children.append(t)
-                
-                # Wait, if we fetch ALL tasks, we can just look up task_id in tasks_map and get its children
-                # But we already fetched singular task separately to ensure it exists and get it even if hidden? 
-                # (Logic above filters hide_until, maybe we want to see hidden subtasks in detail view? Assuming yes for now)
-                
-                target_node = tasks_map.get(task_id)
-                children = target_node['children'] if target_node else []
-                
-                # Recalculate branch totals if needed (list_tasks does it)
-                # For now, return the children list
-                
-                conn.close()
-                return task, children
 
-        except Exception as e:
+                # Build the subtree
+                forest = TaskForest.from_tasks(branch_tasks)
+                for tid in forest.preorder(task_id):
+                    t = tasks_map[tid]
+                    t['children'] = [tasks_map[child_id] for child_id in forest.children(tid)]
+                    t['branch_total'] = t['branch_total_minutes']
+
+                task = tasks_map[task_id]
+                return task, task['children']
+            return None, []
+
+        except Error as e:
             print(f"Error fetching task details: {e}")
             return None, []
+        finally:
+            if conn and conn.is_connected():
+                cursor.close()
+                conn.close()
+
+    def get_task_description(self, user_id, task_id):
+        """Fetch the full (rich text) description of a single task."""
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT description FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
+                row = cursor.fetchone()
+                return (row[0] or '') if row else None
+            except Error as e:
+                print(f"Error fetching task description: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+        return None
+
+    def get_ai_status(self, user_id, task_ids):
+        """
+        {task_id: task} for the user's tasks among task_ids, each with id, status, ai_status
+        and the (parsed) ai_suggestion, for polling background suggestions.
+        """
+        task_ids = [int(task_id) for task_id in task_ids][:MAX_AI_STATUS_IDS]
+        if not task_ids:
+            return {}
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True)
+                placeholders = ', '.join(['%s'] * len(task_ids))
+                cursor.execute(AI_STATUS_QUERY.format(placeholders=placeholders), (user_id, *task_ids))
+                tasks = {}
+                for task in cursor.fetchall():
+                    if task['ai_suggestion']:
+                        try:
+                            task['ai_suggestion'] = json.loads(task['ai_suggestion'])
+                        except (json.JSONDecodeError, TypeError):
+                            pass
+                    tasks[task['id']] = task
+                return tasks
+            except Error as e:
+                print(f"Error fetching AI status: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+        return {}
+
+    def search_tasks(self, user_id, query, limit=20):
+        """
+        Full-text search over titles and descriptions, best matches first.
+        Each hit carries `path`: its ancestors from the root down, as {'id', 'title'}.
+        """
+        if not query or not query.strip():
+            return []
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True)
+                against = fulltext_query(query)
+                if against:
+                    cursor.execute(SEARCH_TASKS_QUERY, (against, user_id, against, limit))
+                else:
+                    cursor.execute(SEARCH_TITLES_QUERY, (user_id, like_contains(query.strip().lower()), limit))
+                hits = cursor.fetchall()
+
+                # Load ancestors level by level (one query per tree level, not per hit)
+                known = {}
+                requested = set()
+                pending = {hit['parent_id'] for hit in hits if hit['parent_id']}
+                while pending:
+                    requested |= pending
+                    placeholders = ', '.join(['%s'] * len(pending))
+                    cursor.execute(f"SELECT id, title, parent_id FROM tasks WHERE user_id = %s AND id IN ({placeholders})",
+                                   (user_id, *pending))
+                    rows = cursor.fetchall()
+                    for row in rows:
+                        known[row['id']] = row
+                    pending = {row['parent_id'] for row in rows if row['parent_id']} - requested
+
+                for hit in hits:
+                    path = []
+                    parent_id = hit['parent_id']
+                    while parent_id in known and len(path) < len(known):
+                        parent = known[parent_id]
+                        path.append({'id': parent['id'], 'title': parent['title']})
+                        parent_id = parent['parent_id']
+                    hit['path'] = list(reversed(path))
+                    hit['score'] = float(hit['score'])
+                return hits
+            except Error as e:
+                print(f"Error searching tasks: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+        return []
+
+    def suggest(self, user_id, query, limit=10):
+        """
+        Typo-tolerant search-as-you-type over task titles and tag names, served from
+        the per-user trigram index. Returns {'tasks': [...], 'tags': [...]}, best first.
+        """
+        empty = {'tasks': [], 'tags': []}
+        if not query or not query.strip():
+            return empty
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                version = get_user_data_version(cursor, user_id)
+
+                def load():
+                    cursor.execute(SEARCH_INDEX_TASKS_QUERY, (user_id,))
+                    tasks = cursor.fetchall()
+                    cursor.execute(USER_TASK_TAGS_QUERY, (user_id,))
+                    task_tags = cursor.fetchall()
+                    cursor.execute(SEARCH_INDEX_TAGS_QUERY, (user_id,))
+                    return tasks, task_tags, cursor.fetchall()
+
+                index = search_index.get(user_id, version, load)
+                return index.suggest(query, limit) if index else empty
+            except Error as e:
+                print(f"Error building search suggestions: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+        return empty
 
     def backfill_tree_fields(self):
-        """Calculate and update level and branch_id for all tasks."""
+        """Calculate and update level and branch_id for all tasks, and rebuild task_closure."""
         conn = get_db_connection()
         if not conn:
             return False
@@ -402,99 +675,117 @@ class TaskManager:
             cursor.execute("SELECT id, parent_id FROM tasks")
             all_tasks = cursor.fetchall()
             
-            tasks_map = {t['id']: t for t in all_tasks}
+            # Parents come before children in pre-order, so each task extends its parent's values.
+            # Orphaned tasks count as roots.
+            forest = TaskForest.from_tasks(all_tasks)
+            levels = {}
+            branches = {}
             updates = []
-
-            for task in all_tasks:
-                level = 0
-                current = task
-                path = []
-                
-                # Traverse up to find root
-                while current['parent_id']:
-                    path.append(current['id'])
-                    parent = tasks_map.get(current['parent_id'])
-                    if not parent:
-                        break # Orphaned task
-                    current = parent
-                    level += 1
-                
-                # current is now root
-                branch_id = str(current['id'])
-                updates.append((level, branch_id, task['id']))
+            for task_id in forest.preorder():
+                parent_id = forest.parent(task_id)
+                if parent_id is None:
+                    levels[task_id] = 0
+                    branches[task_id] = str(task_id)
+                else:
+                    levels[task_id] = levels[parent_id] + 1
+                    branches[task_id] = branches[parent_id]
+                updates.append((levels[task_id], branches[task_id], task_id))
             
             # Batch update
             cursor.close() # Switch to normal cursor for updates
             cursor = conn.cursor()
             update_query = "UPDATE tasks SET level = %s, branch_id = %s WHERE id = %s"
             cursor.executemany(update_query, updates)
+            rebuild_closure(cursor)
+            recompute_branch_totals(cursor)
+            reset_stats_rollups(cursor)
+            cursor.execute("UPDATE user_data_version SET version = version + 1")
             conn.commit()
+            forest_cache.clear()
+            search_index.clear()
             print(f"Backfilled {len(updates)} tasks with tree fields.")
             return True
             
         except Error as e:
             print(f"Error backfilling tree fields: {e}")
+            conn.rollback()
             return False
         finally:
             cursor.close()
             conn.close()
 
     def complete_task(self, user_id, task_id):
-        """Mark a task AND all its descendants as completed."""
+        """Mark a task AND all its descendants as completed, in a single UPDATE."""
         conn = get_db_connection()
         if conn:
             try:
                 cursor = conn.cursor()
-                
-                # 1. Find all descendants recursively
-                # Since we don't have a simple recursive query handy universally,
-                # let's fetch all (id, parent_id) and build a quick graph.
-                cursor.execute("SELECT id, parent_id FROM tasks WHERE user_id = %s", (user_id,))
-                all_nodes = cursor.fetchall()
-                
-                # Build tree in memory
-                children_map = {}
-                for tid, pid in all_nodes:
-                    if pid:
-                        if pid not in children_map: children_map[pid] = []
-                        children_map[pid].append(tid)
-
-                ids_to_complete = [task_id]
-                queue = [task_id]
-                
-                while queue:
-                    current = queue.pop(0)
-                    children = children_map.get(current, [])
-                    ids_to_complete.extend(children)
-                    queue.extend(children)
-                
-                # 2. Update all of them
-                format_strings = ','.join(['%s'] * len(ids_to_complete))
-                query = f"UPDATE tasks SET status = 'completed', completed_at = NOW() WHERE id IN ({format_strings})"
-                cursor.execute(query, tuple(ids_to_complete))
+                rollup_fresh = lock_rollup(cursor, user_id)
+                cursor.execute("SELECT branch_total_minutes FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
+                row = cursor.fetchone()
+                if not row:
+                    conn.rollback()
+                    return False
+
+                stats_before = subtree_stats(cursor, user_id, task_id)
+                # Nothing below the task stays open, so its ancestors lose its whole branch total
+                add_to_branch_totals(cursor, task_id, -row[0], include_self=False)
+                cursor.execute(COMPLETE_SUBTREE_QUERY, (task_id, user_id))
+                count = cursor.rowcount
+                apply_stats_delta(cursor, user_id, stats_before, subtree_stats(cursor, user_id, task_id), rollup_fresh)
+                version = bump_user_data_version(cursor, user_id)
                 conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.advance(user_id, version)
+                print(f"Completed task {task_id} ({count} tasks updated).")
                 return True
             except Error as e:
                 print(f"Error completing task: {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
                 conn.close()
         return False
 
-    def uncomplete_task(self, user_id, task_id):
-        """Mark a task as pending (Undo completion)."""
+    def uncomplete_task(self, user_id, task_id, cascade=False):
+        """Mark a task as pending (Undo completion). With cascade, its completed descendants too."""
         conn = get_db_connection()
         if conn:
             try:
                 cursor = conn.cursor()
+                rollup_fresh = lock_rollup(cursor, user_id)
+                cursor.execute("SELECT status, time_minutes, branch_total_minutes FROM tasks WHERE id = %s AND user_id = %s",
+                               (task_id, user_id))
+                row = cursor.fetchone()
+                if not row:
+                    conn.rollback()
+                    return False
+                status, time_minutes, branch_total = row
+
+                stats_before = subtree_stats(cursor, user_id, task_id)
                 # Status 'pending' is the active state
-                query = "UPDATE tasks SET status = 'pending', completed_at = NULL WHERE id = %s AND user_id = %s"
-                cursor.execute(query, (task_id, user_id))
+                if cascade:
+                    cursor.execute(UNCOMPLETE_SUBTREE_QUERY, (task_id, user_id))
+                    count = cursor.rowcount
+                    recompute_branch_totals(cursor, task_id)
+                    add_to_branch_totals(cursor, task_id, get_branch_total(cursor, task_id) - branch_total, include_self=False)
+                else:
+                    query = "UPDATE tasks SET status = 'pending', completed_at = NULL WHERE id = %s AND user_id = %s"
+                    cursor.execute(query, (task_id, user_id))
+                    count = cursor.rowcount
+                    if status == 'completed':
+                        add_to_branch_totals(cursor, task_id, time_minutes or 0)
+                apply_stats_delta(cursor, user_id, stats_before, subtree_stats(cursor, user_id, task_id), rollup_fresh)
+                version = bump_user_data_version(cursor, user_id)
                 conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.advance(user_id, version)
+                print(f"Uncompleted task {task_id} ({count} tasks updated).")
                 return True
             except Error as e:
                 print(f"Error uncompleting task: {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
@@ -507,12 +798,14 @@ class TaskManager:
         if conn:
             try:
                 cursor = conn.cursor(dictionary=True)
+                rollup_fresh = lock_rollup(cursor, user_id)
                 
                 # Check exist and get old due_at
-                check_query = "SELECT id, title, time_minutes, due_at FROM tasks WHERE id = %s AND user_id = %s"
+                check_query = "SELECT id, title, status, time_minutes, due_at FROM tasks WHERE id = %s AND user_id = %s"
                 cursor.execute(check_query, (task_id, user_id))
                 row = cursor.fetchone()
                 if not row:
+                    conn.rollback()
                     return False
                 
                 old_due_at = row['due_at']
@@ -520,6 +813,7 @@ class TaskManager:
                 # Prepare update
                 updates = []
                 params = []
+                time_delta = 0
                 
                 tags_to_add = []
                 if title is not None:
@@ -545,15 +839,33 @@ class TaskManager:
                     # We use a simple regex here to avoid breaking HTML structure
                     import re
                     description = re.sub(r'#[\w-]+', '', description)
+
+                    # Move any inline base64 images into the blob store
+                    description, _ = rewrite_inline_images(description, self.blob_store)
                     
                     updates.append("description = %s")
                     params.append(description)
+                    updates.append("description_preview = %s")
+                    updates.append("has_description = %s")
+                    params.extend(description_columns(description))
+
+                # Keep the full-text shadow in step with title and description
+                if title is not None or description is not None:
+                    if description is None:
+                        cursor.execute("SELECT description FROM tasks WHERE id = %s", (task_id,))
+                        description_for_search = cursor.fetchone()['description']
+                    else:
+                        description_for_search = description
+                    updates.append("search_text = %s")
+                    params.append(make_search_text(title if title is not None else row['title'], description_for_search))
                 
                 if time_minutes is not None:
                     try:
                         time_val = int(time_minutes)
                         updates.append("time_minutes = %s")
                         params.append(time_val)
+                        if row['status'] != 'completed':
+                            time_delta = time_val - (row['time_minutes'] or 0)
                     except (ValueError, TypeError):
                         pass
 
@@ -576,6 +888,7 @@ class TaskManager:
                             print(f"Error parsing new due_at: {e}")
 
                 if not updates:
+                    conn.rollback()
                     return True
                 
                 params.append(task_id)
@@ -583,69 +896,141 @@ class TaskManager:
                 
                 cursor.close()
                 cursor = conn.cursor()
+                # Time, importance and tags feed the sidebar stats of the task and (importance, tags) its subtree
+                affects_stats = time_minutes is not None or importance is not None or bool(tags_to_add)
+                if affects_stats:
+                    stats_before = subtree_stats(cursor, user_id, task_id)
                 cursor.execute(query, tuple(params))
-                conn.commit()
+                add_to_branch_totals(cursor, task_id, time_delta)
+                tag_links = link_tags(cursor, user_id, task_id, tags_to_add) if tags_to_add else []
+                if affects_stats:
+                    apply_stats_delta(cursor, user_id, stats_before, subtree_stats(cursor, user_id, task_id), rollup_fresh)
 
-                # Recursive Shifting if requested
+                # Shift the subtasks' due dates by as much as the task's moved, in the same transaction
                 if shift_subtasks and old_due_at and new_due_at_obj:
-                    # Calculate delta
                     try:
                         import datetime
                         if isinstance(old_due_at, str):
                             old_due_at_obj = datetime.datetime.fromisoformat(old_due_at.replace(' ', 'T'))
                         else:
                             old_due_at_obj = old_due_at
-                        
-                        delta = new_due_at_obj - old_due_at_obj
-                        
-                        if delta.total_seconds() != 0:
-                            # Fetch all descendants recursively
-                            cursor.execute("SELECT id, parent_id, due_at FROM tasks WHERE user_id = %s", (user_id,))
-                            all_nodes = cursor.fetchall()
-                            
-                            # Build children map
-                            children_map = {}
-                            due_at_map = {}
-                            for tid, pid, d_at in all_nodes:
-                                due_at_map[tid] = d_at
-                                if pid:
-                                    if pid not in children_map: children_map[pid] = []
-                                    children_map[pid].append(tid)
-
-                            # BFS/DFS to find all descendants
-                            descendants = []
-                            queue = children_map.get(int(task_id), [])
-                            while queue:
-                                curr = queue.pop(0)
-                                descendants.append(curr)
-                                queue.extend(children_map.get(curr, []))
-
-                            # Update each descendant that has a due_at
-                            for tid in descendants:
-                                curr_due = due_at_map.get(tid)
-                                if curr_due:
-                                    if isinstance(curr_due, str):
-                                        curr_due_obj = datetime.datetime.fromisoformat(curr_due.replace(' ', 'T'))
-                                    else:
-                                        curr_due_obj = curr_due
-                                    
-                                    shifted_due = curr_due_obj + delta
-                                    cursor.execute("UPDATE tasks SET due_at = %s WHERE id = %s", (shifted_due, tid))
-                            
-                            conn.commit()
-                    except Exception as e:
+                        seconds = int((new_due_at_obj - old_due_at_obj).total_seconds())
+                        if seconds:
+                            cursor.execute(SHIFT_DUE_DATES_QUERY, (seconds, task_id, 1, user_id))
+                    except (ValueError, TypeError) as e:
                         print(f"Error shifting subtasks: {e}")
 
-                # Handle Tags
-                if tags_to_add:
-                    ctask = CTask(user_id, task_id)
-                    for tag in tags_to_add:
-                        ctask.add_tag(tag)
+                version = bump_user_data_version(cursor, user_id)
+                conn.commit()
+                if title is not None:
+                    search_index.task_saved(user_id, version, task_id, title, tags=tag_links)
+                elif tag_links:
+                    search_index.tags_linked(user_id, version, task_id, tag_links)
+                else:
+                    search_index.advance(user_id, version)
 
+                forest_cache.invalidate(user_id)
                 print(f"Task {task_id} updated.")
                 return True
             except Error as e:
                 print(f"Error updating task: {e}")
+                conn.rollback()
+                return False
+            finally:
+                cursor.close()
+                conn.close()
+        return False
+
+    def move_task(self, user_id, task_id, new_parent_id=None):
+        """
+        Move a task (with its subtasks) under another task, or to the top level if new_parent_id is None.
+        Refuses to move a task into its own subtree.
+        """
+        if new_parent_id in ('', 'None'):
+            new_parent_id = None
+        elif new_parent_id is not None:
+            # Form input: checked before the transaction is started
+            try:
+                new_parent_id = int(new_parent_id)
+            except (TypeError, ValueError):
+                print(f"Invalid parent id for move: {new_parent_id!r}")
+                return False
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                rollup_fresh = lock_rollup(cursor, user_id)
+                cursor.execute("SELECT id FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
+                if not cursor.fetchone():
+                    conn.rollback()
+                    return False
+
+                level = 0
+                branch_id = str(task_id)
+                if new_parent_id:
+                    cursor.execute("SELECT level, branch_id FROM tasks WHERE id = %s AND user_id = %s", (new_parent_id, user_id))
+                    parent = cursor.fetchone()
+                    if not parent or is_in_subtree(cursor, task_id, new_parent_id):
+                        conn.rollback()
+                        return False
+                    level = (parent[0] or 0) + 1
+                    branch_id = parent[1]
+
+                stats_before = subtree_stats(cursor, user_id, task_id)
+                branch_total = get_branch_total(cursor, task_id)
+                add_to_branch_totals(cursor, task_id, -branch_total, include_self=False)
+                cursor.execute("UPDATE tasks SET parent_id = %s WHERE id = %s", (new_parent_id, task_id))
+                move_subtree_closure(cursor, task_id, new_parent_id)
+                add_to_branch_totals(cursor, task_id, branch_total, include_self=False)
+                # Levels and branch of the whole moved subtree
+                cursor.execute("""
+                    UPDATE tasks t
+                    JOIN task_closure c ON c.descendant_id = t.id
+                    SET t.level = c.depth + %s, t.branch_id = %s
+                    WHERE c.ancestor_id = %s
+                """, (level, branch_id, task_id))
+                apply_stats_delta(cursor, user_id, stats_before, subtree_stats(cursor, user_id, task_id), rollup_fresh)
+                version = bump_user_data_version(cursor, user_id)
+                conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.task_moved(user_id, version, task_id, new_parent_id)
+                return True
+            except Error as e:
+                print(f"Error moving task: {e}")
+                conn.rollback()
+                return False
+            finally:
+                cursor.close()
+                conn.close()
+        return False
+
+    def shift_branch(self, user_id, task_id, days):
+        """Move the due dates of a task and all its subtasks by `days` (negative moves them earlier)."""
+        try:
+            seconds = int(float(days) * 86400)
+        except (ValueError, TypeError):
+            return False
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
+                if not cursor.fetchone():
+                    return False
+                if not seconds:
+                    return True
+
+                cursor.execute(SHIFT_DUE_DATES_QUERY, (seconds, task_id, 0, user_id))
+                count = cursor.rowcount
+                version = bump_user_data_version(cursor, user_id)
+                conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.advance(user_id, version)
+                print(f"Shifted {count} due dates in the branch of task {task_id} by {days} days.")
+                return True
+            except Error as e:
+                print(f"Error shifting branch: {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
@@ -658,13 +1043,25 @@ class TaskManager:
         if conn:
             try:
                 cursor = conn.cursor()
+                rollup_fresh = lock_rollup(cursor, user_id)
                 # ON DELETE CASCADE is set in DB, so deleting parent deletes children
+                # (and their task_closure rows)
+                stats_before = subtree_stats(cursor, user_id, task_id)
+                cursor.execute("SELECT branch_total_minutes FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
+                row = cursor.fetchone()
+                if row:
+                    add_to_branch_totals(cursor, task_id, -row[0], include_self=False)
                 query = "DELETE FROM tasks WHERE id = %s AND user_id = %s"
                 cursor.execute(query, (task_id, user_id))
+                apply_stats_delta(cursor, user_id, stats_before, {}, rollup_fresh)
+                version = bump_user_data_version(cursor, user_id)
                 conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.task_deleted(user_id, version, task_id)
                 return True
             except Error as e:
                 print(f"Error deleting task: {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
@@ -679,12 +1076,17 @@ class TaskManager:
         if conn:
             try:
                 cursor = conn.cursor()
-                query = "UPDATE tasks SET ai_suggestion = NULL WHERE id = %s AND user_id = %s"
+                # Also drops a pending job's result
+                query = "UPDATE tasks SET ai_suggestion = NULL, ai_status = NULL WHERE id = %s AND user_id = %s"
                 cursor.execute(query, (task_id, user_id))
+                version = bump_user_data_version(cursor, user_id)
                 conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.advance(user_id, version)
                 return True
             except Error as e:
                 print(f"Error clearing AI suggestion: {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
@@ -719,6 +1121,7 @@ class TaskManager:
         if conn:
             try:
                 cursor = conn.cursor()
+                rollup_fresh = lock_rollup(cursor, user_id)
                 now = datetime.datetime.now()
                 hide_until = now
                 if duration_str == '1h':
@@ -728,12 +1131,18 @@ class TaskManager:
                 elif duration_str == 'next_week':
                     hide_until = now + datetime.timedelta(days=7)
                 
+                stats_before = subtree_stats(cursor, user_id, task_id)
                 query = "UPDATE tasks SET hide_until = %s WHERE id = %s AND user_id = %s"
                 cursor.execute(query, (hide_until, task_id, user_id))
+                apply_stats_delta(cursor, user_id, stats_before, subtree_stats(cursor, user_id, task_id), rollup_fresh)
+                version = bump_user_data_version(cursor, user_id)
                 conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.advance(user_id, version)
                 return True
             except Error as e:
                 print(f"Error hiding task: {e}")
+                conn.rollback()
             finally:
                 cursor.close()
                 conn.close()
@@ -747,10 +1156,14 @@ class TaskManager:
                 cursor = conn.cursor()
                 query = "UPDATE tasks SET is_folded = 1 - is_folded WHERE id = %s AND user_id = %s"
                 cursor.execute(query, (task_id, user_id))
+                version = bump_user_data_version(cursor, user_id)
                 conn.commit()
+                forest_cache.invalidate(user_id)
+                search_index.advance(user_id, version)
                 return True
             except Error as e:
                 print(f"Error toggling task folding: {e}")
+                conn.rollback()
             finally:
                 cursor.close()
                 conn.close()
@@ -0,0 +1,111 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import ai_service
+from ai_cache import SuggestionCache, suggestion_key, prune_context, normalize_text
+from db_manager import get_db_connection
+
+
+def _branch(root_id, child_id):
+    return json.dumps({"id": str(root_id), "title": "Weekly  Report", "subtasks": [
+        {"id": str(child_id), "title": "Collect numbers!", "subtasks": []}]})
+
+
+def test_keys_ignore_noise():
+    print("Testing suggestion cache keys...")
+    assert normalize_text("  Pay   RENT! ") == "pay rent"
+    # Two copies of the same template differ only in their ids
+    assert prune_context(_branch(1, 2)) == prune_context(_branch(10, 20))
+    assert prune_context(None) == ''
+
+    key = suggestion_key('gpt', 'Pay rent', _branch(1, 2))
+    assert key == suggestion_key('gpt', 'pay rent.', _branch(10, 20))
+    assert key != suggestion_key('other-model', 'Pay rent', _branch(1, 2))
+    assert key != suggestion_key('gpt', 'Pay taxes', _branch(1, 2))
+    assert key != suggestion_key('gpt', 'Pay rent')
+
+
+def test_memory_tier():
+    print("\nTesting the in-process tier...")
+    cache = SuggestionCache(memory_entries=2, ttl=60, persistent=False)
+    cache.put('a', 'gpt', [{"text": "A", "done": False}])
+    cache.put('b', 'gpt', [{"text": "B", "done": False}])
+
+    hit = cache.get('a')
+    assert hit == [{"text": "A", "done": False}]
+    # Callers get their own copy
+    hit[0]['done'] = True
+    assert cache.get('a')[0]['done'] is False
+
+    # 'b' is the least recently used one
+    cache.put('c', 'gpt', [{"text": "C", "done": False}])
+    assert cache.get('b') is None
+
+    expired = SuggestionCache(ttl=0.05, persistent=False)
+    expired.put('a', 'gpt', [{"text": "A"}])
+    time.sleep(0.1)
+    assert expired.get('a') is None
+
+    stats = cache.stats()
+    print(f"Stats: {stats}")
+    assert stats['memory_hits'] == 2 and stats['misses'] == 1
+    assert stats['hit_rate'] == 0.667
+
+
+def test_service_uses_cache():
+    print("\nTesting that cached suggestions cost no API call...")
+    service = ai_service.AIService()
+    service.client = MagicMock()
+    service.client.chat.completions.create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(
+        content=json.dumps({"suggested_subtasks": [{"text": "Open the bank app", "estimated_time": 2}]})))])
+
+    original = ai_service.suggestion_cache
+    ai_service.suggestion_cache = SuggestionCache(persistent=False)
+    try:
+        first = service.get_task_suggestion("Pay rent", _branch(1, 2))
+        started = time.perf_counter()
+        second = service.get_task_suggestion("pay   rent", _branch(5, 6))
+        elapsed = time.perf_counter() - started
+    finally:
+        ai_service.suggestion_cache = original
+
+    assert first == second == [{"text": "Open the bank app", "time": 2, "done": False}]
+    assert service.client.chat.completions.create.call_count == 1
+    print(f"Cached answer in {elapsed * 1000:.2f} ms")
+    assert elapsed < 0.05
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_persistent_tier():
+    print("\nTesting the ai_suggestion_cache table...")
+    key = suggestion_key('test-model', 'Persistent cache check')
+    writer = SuggestionCache()
+    writer.put(key, 'test-model', [{"text": "Stored", "done": False}])
+
+    # Another process: nothing in memory yet
+    reader = SuggestionCache()
+    assert reader.get(key) == [{"text": "Stored", "done": False}]
+    assert reader.stats()['db_hits'] == 1
+    assert reader.get(key) is not None
+    assert reader.stats()['memory_hits'] == 1
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT hits FROM ai_suggestion_cache WHERE prompt_hash = %s", (key,))
+        assert cursor.fetchone()[0] >= 1
+    finally:
+        cursor.execute("DELETE FROM ai_suggestion_cache WHERE prompt_hash = %s", (key,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    test_keys_ignore_noise()
+    test_memory_tier()
+    test_service_uses_cache()
+    test_persistent_tier()
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from ai_context import select_context, build_branch_context, estimate_tokens, without_task
+from db_manager import get_db_connection, bump_user_data_version
+from forest_cache import forest_cache
+
+
+def _branch(depth, fanout):
+    """A chain of `depth` ancestors, each with `fanout` leaf children besides the next ancestor."""
+    path, children = [], {}
+    next_id = 1
+    for level in range(depth):
+        path.append({'id': next_id, 'title': f"Level {level}", 'descendants': 0})
+        next_id += 1
+    for level, node in enumerate(path):
+        kids = [path[level + 1]] if level + 1 < depth else []
+        for i in range(fanout):
+            kids.append({'id': next_id, 'title': f"Step {level}.{i}", 'descendants': i % 3})
+            next_id += 1
+        children[node['id']] = kids
+    # Descendant counts of the path, bottom-up
+    below = 0
+    for level in range(depth - 1, -1, -1):
+        own = sum(1 + kid['descendants'] for kid in children[path[level]['id']] if kid['id'] != path[level + 1]['id']) \
+            if level + 1 < depth else sum(1 + kid['descendants'] for kid in children[path[level]['id']])
+        path[level]['descendants'] = own + (below + 1 if level + 1 < depth else 0)
+        below = path[level]['descendants']
+    return path, children
+
+
+def _count(node):
+    """(tasks shown, tasks summarized) in a context tree."""
+    shown = 1 if 'id' in node else 0
+    summarized = node.get('not_shown', 0)
+    for child in node['subtasks']:
+        child_shown, child_summarized = _count(child)
+        shown += child_shown
+        summarized += child_summarized
+    return shown, summarized
+
+
+def test_everything_fits():
+    print("Testing a small branch...")
+    path, children = _branch(3, 2)
+    context = select_context(path, children, budget=10000)
+    assert context['title'] == 'Level 0'
+    shown, summarized = _count(context)
+    assert shown + summarized == path[0]['descendants'] + 1
+    # Siblings keep their order, with the path child in its place
+    assert [child['title'] for child in context['subtasks']] == ['Level 1', 'Step 0.0', 'Step 0.1']
+
+
+def test_budget_keeps_the_nearest_tasks():
+    print("\nTesting the token budget on a large branch...")
+    path, children = _branch(40, 100)
+    budget = 400
+    context = select_context(path, children, budget=budget)
+    text = json.dumps(context)
+    print(f"{len(text)} characters, ~{estimate_tokens(text)} tokens for {path[0]['descendants'] + 1} tasks")
+    assert estimate_tokens(text) <= budget * 1.5
+
+    # Root, then skipped levels, then the parent with its children (the new leaf's siblings)
+    assert context['title'] == 'Level 0'
+    node = context
+    while node['subtasks'] and node['subtasks'][0].get('title', '').startswith(('Level', '...')):
+        node = node['subtasks'][0]
+    assert node['title'] == 'Level 39'
+    assert node['subtasks'] and node['subtasks'][0]['title'] == 'Step 39.0'
+    assert any(child['title'].startswith('...') for child in context['subtasks'])
+
+    shown, summarized = _count(context)
+    assert shown + summarized == path[0]['descendants'] + 1
+
+    # Even a budget of nothing keeps the parent
+    assert select_context(path, children, budget=0)['title'] == 'Level 39'
+
+
+def test_without_task():
+    print("\nTesting that the new subtask is left out...")
+    path, children = _branch(3, 2)
+    parent_id = path[-1]['id']
+    new = {'id': 99, 'title': 'New step', 'descendants': 0}
+    with_new = [dict(node, descendants=node['descendants'] + 1) for node in path]
+    children_with_new = dict(children)
+    children_with_new[parent_id] = children[parent_id] + [new]
+
+    left_path, left_children = without_task(with_new, children_with_new, 99)
+    assert select_context(left_path, left_children) == select_context(path, children)
+    # The cached rows are not changed
+    assert children_with_new[parent_id][-1] is new and with_new[0]['descendants'] == path[0]['descendants'] + 1
+    assert without_task(path, children, None) == (path, children)
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_build_is_memoized():
+    print("\nTesting build_branch_context...")
+    conn = get_db_connection()
+    from task_closure import insert_task_closure
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('ai_context_check', 'ai_context_check@example.com', 'AI context check'))
+        user_id = cursor.lastrowid
+        parent_id = None
+        for title in ('Project', 'Phase', 'Milestone'):
+            cursor.execute("INSERT INTO tasks (title, user_id, parent_id) VALUES (%s, %s, %s)", (title, user_id, parent_id))
+            task_id = cursor.lastrowid
+            insert_task_closure(cursor, task_id, parent_id)
+            parent_id = task_id
+        conn.commit()
+
+        context = build_branch_context(user_id, parent_id)
+        structure = json.loads(context)
+        assert structure['title'] == 'Project'
+        assert structure['subtasks'][0]['subtasks'][0]['title'] == 'Milestone'
+        # Same data version: built again from the memoized rows
+        assert build_branch_context(user_id, parent_id) == context
+
+        # Two new subtasks: each job reads the branch without its own subtask, from one memoized read
+        new_ids = []
+        for title in ('First step', 'Second step'):
+            cursor.execute("INSERT INTO tasks (title, user_id, parent_id) VALUES (%s, %s, %s)", (title, user_id, parent_id))
+            new_ids.append(cursor.lastrowid)
+            insert_task_closure(cursor, new_ids[-1], parent_id)
+        bump_user_data_version(cursor, user_id)
+        conn.commit()
+        first = build_branch_context(user_id, parent_id, new_ids[0])
+        hits = forest_cache.stats()['hits']
+        second = build_branch_context(user_id, parent_id, new_ids[1])
+        assert forest_cache.stats()['hits'] == hits + 1
+        assert 'Second step' in first and 'First step' not in first
+        assert 'First step' in second and 'Second step' not in second
+    finally:
+        if user_id is not None:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    test_everything_fits()
+    test_budget_keeps_the_nearest_tasks()
+    test_without_task()
+    test_build_is_memoized()
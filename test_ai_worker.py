@@ -0,0 +1,111 @@
+import threading
+import time
+
+from ai_worker import AIWorkerPool
+
+
+class _RecordingPool(AIWorkerPool):
+    """Keeps stored results in memory instead of the database."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stored = {}
+
+    def _store(self, job, suggestions, status):
+        self.stored[job.task_id] = (status, suggestions)
+        return True
+
+    def _branch_context(self, job):
+        return '{"id": "%s"}' % job.parent_id
+
+
+class _FlakyService:
+    """Fails the first `failures` calls of every title, then answers."""
+
+    def __init__(self, failures=0, delay=0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = {}
+        self.timeouts = []
+        self.lock = threading.Lock()
+
+    def get_task_suggestion(self, task_title, branch_context=None, current_leaf_title=None, timeout=None, raise_errors=False):
+        with self.lock:
+            self.calls[task_title] = self.calls.get(task_title, 0) + 1
+            calls = self.calls[task_title]
+            self.timeouts.append(timeout)
+        time.sleep(self.delay)
+        if calls <= self.failures:
+            raise ConnectionError("API unavailable")
+        return [{"text": f"Start {task_title} ({branch_context})", "time": 5, "done": False}]
+
+
+def test_jobs_are_processed_with_retries():
+    print("Testing background suggestion jobs...")
+    pool = _RecordingPool(workers=2, queue_size=10, timeout=5, attempts=3, backoff=0.01)
+    service = _FlakyService(failures=1)
+    for task_id in range(1, 5):
+        assert pool.submit(service, 1, task_id, f"task {task_id}", parent_id=task_id if task_id % 2 else None)
+    assert pool.wait_idle(timeout=5)
+
+    stats = pool.stats()
+    print(f"Stats: {stats}")
+    assert stats['completed'] == 4 and stats['failed'] == 0
+    assert stats['retries'] == 4
+    assert stats['queue_depth'] == 0 and stats['in_flight'] == 0
+    assert all(status == 'done' for status, _ in pool.stored.values())
+    assert pool.stored[1][1][0]['text'] == 'Start task 1 ({"id": "1"})'
+    assert pool.stored[2][1][0]['text'] == 'Start task 2 (None)'
+    # Every request is capped by what is left of the job's budget
+    assert all(timeout is not None and 0 < timeout <= 5 for timeout in service.timeouts)
+
+
+def test_failure_and_timeout():
+    print("\nTesting failed jobs...")
+    pool = _RecordingPool(workers=1, queue_size=10, timeout=5, attempts=2, backoff=0.01)
+    pool.submit(_FlakyService(failures=10), 1, 1, "never")
+    assert pool.wait_idle(timeout=5)
+    status, suggestions = pool.stored[1]
+    assert status == 'failed'
+    assert 'API unavailable' in suggestions[0]['text']
+
+    # A slow backend runs out of the job's time budget instead of retrying forever
+    pool = _RecordingPool(workers=1, queue_size=10, timeout=0.2, attempts=100, backoff=0.05)
+    slow = _FlakyService(failures=100, delay=0.1)
+    pool.submit(slow, 1, 2, "slow")
+    assert pool.wait_idle(timeout=5)
+    assert pool.stored[2][0] == 'failed'
+    assert slow.calls['slow'] < 5
+
+
+def test_full_queue_rejects():
+    print("\nTesting the queue bound...")
+    release = threading.Event()
+
+    class _BlockingService(_FlakyService):
+        def get_task_suggestion(self, *args, **kwargs):
+            release.wait(5)
+            return super().get_task_suggestion(*args, **kwargs)
+
+    pool = _RecordingPool(workers=1, queue_size=1, timeout=5, attempts=1)
+    service = _BlockingService()
+    assert pool.submit(service, 1, 1, "first")
+    # Wait for the worker to take the first job, so the second fills the queue
+    deadline = time.monotonic() + 5
+    while pool.stats()['in_flight'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.submit(service, 1, 2, "second")
+    assert not pool.submit(service, 1, 3, "third")
+    assert pool.stored[3][0] == 'failed'
+    assert pool.stats()['queue_depth'] == 1
+    assert pool.stats()['rejected'] == 1
+
+    release.set()
+    assert pool.wait_idle(timeout=5)
+    assert pool.stored[1][0] == pool.stored[2][0] == 'done'
+
+
+if __name__ == '__main__':
+    test_jobs_are_processed_with_retries()
+    test_failure_and_timeout()
+    test_full_queue_rejects()
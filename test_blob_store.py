@@ -0,0 +1,57 @@
+import base64
+import os
+import tempfile
+
+from blob_store import BlobStore, rewrite_inline_images, sniff_image_type
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+JPEG_BYTES = b'\xff\xd8\xff\xe0' + b'\x01' * 32
+
+
+def test_put_dedupes_by_content():
+    print("Testing content-addressed storage...")
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root)
+        first = store.put(PNG_BYTES)
+        second = store.put(PNG_BYTES)
+        print(f"Stored as: {first}")
+        assert first == second
+        assert first.endswith('.png')
+
+        path = store.path_for(first)
+        assert path and os.path.exists(path)
+        with open(path, 'rb') as f:
+            assert f.read() == PNG_BYTES
+
+        # Only one file on disk for two uploads
+        files = [name for _, _, names in os.walk(root) for name in names]
+        assert files == [first]
+
+        # Unsupported content and suspicious names are rejected
+        assert store.put(b'<html>not an image</html>') is None
+        assert store.path_for('../../etc/passwd') is None
+        assert sniff_image_type(JPEG_BYTES) == 'jpg'
+
+
+def test_rewrite_inline_images():
+    print("\nTesting inline image rewrite...")
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root)
+        encoded = base64.b64encode(JPEG_BYTES).decode()
+        description = f'<p>Receipt</p><p><img src="data:image/jpeg;base64,{encoded}"></p>'
+
+        new_description, moved = rewrite_inline_images(description, store)
+        print(f"Rewritten: {new_description}")
+        assert moved == 1
+        assert 'data:image' not in new_description
+        assert '/images/' in new_description and '.jpg' in new_description
+
+        # Nothing to do for plain descriptions
+        assert rewrite_inline_images('<p>Plain</p>', store) == ('<p>Plain</p>', 0)
+
+    print("\nBlob store verification passed!")
+
+
+if __name__ == "__main__":
+    test_put_dedupes_by_content()
+    test_rewrite_inline_images()
@@ -0,0 +1,69 @@
+import pytest
+
+from ctask import CTask
+from db_manager import get_db_connection
+
+
+def test_lazy_construction():
+    print("Testing that CTask loads nothing up front...")
+    ctask = CTask(1, '5')
+    assert ctask.task_id == 5
+    assert ctask._fields is None and ctask._tags is None
+    # __slots__: no per-instance dict
+    try:
+        ctask.other = 1
+        assert False, "CTask instances should not take new attributes"
+    except AttributeError:
+        pass
+    assert CTask.load_many(1, []) == {}
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_load_many():
+    print("\nTesting CTask.load_many...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_ids = []
+    try:
+        for name in ('load_many_check', 'load_many_other'):
+            cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                           (name, f"{name}@example.com", name))
+            user_ids.append(cursor.lastrowid)
+        user_id, other_user_id = user_ids
+
+        ids = []
+        for title in ('First', 'Second', 'Third'):
+            cursor.execute("INSERT INTO tasks (title, user_id) VALUES (%s, %s)", (title, user_id))
+            ids.append(cursor.lastrowid)
+        cursor.execute("INSERT INTO tasks (title, user_id) VALUES (%s, %s)", ('Not mine', other_user_id))
+        foreign_id = cursor.lastrowid
+        cursor.execute("INSERT INTO tags (name, user_id) VALUES (%s, %s)", ('batch', user_id))
+        tag_id = cursor.lastrowid
+        cursor.execute("INSERT INTO task_tags (task_id, tag_id) VALUES (%s, %s), (%s, %s)", (ids[0], tag_id, ids[2], tag_id))
+        conn.commit()
+
+        tasks = CTask.load_many(user_id, ids + [foreign_id], conn)
+        assert sorted(tasks) == ids
+        assert [tasks[task_id].fields['title'] for task_id in ids] == ['First', 'Second', 'Third']
+        assert tasks[ids[0]].get_tags() == [{'id': tag_id, 'name': 'batch'}]
+        assert tasks[ids[1]].get_tags() == []
+
+        # The injected connection is still usable afterwards
+        cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = %s", (user_id,))
+        assert cursor.fetchone()[0] == 3
+
+        # A lazily loaded task sees the same data
+        assert CTask(user_id, ids[2]).tags == [{'id': tag_id, 'name': 'batch'}]
+        assert CTask(user_id, foreign_id).fields == {}
+        print("CTask.load_many passed!")
+    finally:
+        for user_id in user_ids:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    test_lazy_construction()
+    test_load_many()
@@ -0,0 +1,115 @@
+import threading
+from mysql.connector import Error
+from db_manager import ConnectionPool, PooledConnection, PoolTimeout
+
+
+class FakeConnection:
+    """Stands in for a MySQL connection so the pool can be tested without a server."""
+
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise Error("Lost connection")
+
+    def is_connected(self):
+        return self.alive and not self.closed
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_connections():
+    print("Testing connection reuse...")
+    pool = ConnectionPool(FakeConnection, size=2, max_overflow=0, timeout=1, ping_interval=0)
+
+    first = pool.checkout()
+    pool.checkin(first)
+    second = pool.checkout()
+
+    assert first is second
+    assert first.rollbacks == 1  # transaction is always ended on checkin
+    stats = pool.stats()
+    print(f"Stats: {stats}")
+    assert stats['checkouts'] == 2
+    assert stats['created'] == 1
+    assert stats['in_use'] == 1
+
+
+def test_pool_replaces_dead_connection():
+    print("\nTesting health check on checkout...")
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=1, ping_interval=0)
+
+    conn = pool.checkout()
+    pool.checkin(conn)
+    conn.alive = False  # server dropped the idle connection
+
+    fresh = pool.checkout()
+    assert fresh is not conn
+    assert conn.closed
+    stats = pool.stats()
+    print(f"Stats: {stats}")
+    assert stats['failures'] == 1
+    assert stats['discarded'] == 1
+    assert stats['open'] == 1
+
+
+def test_pool_overflow_and_wait():
+    print("\nTesting overflow and waiting...")
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=1, timeout=0.2, ping_interval=0)
+
+    a = pool.checkout()
+    b = pool.checkout()  # overflow connection
+    assert pool.stats()['open'] == 2
+
+    try:
+        pool.checkout()
+        assert False, "Expected PoolTimeout"
+    except PoolTimeout:
+        pass
+
+    # A waiting caller gets the connection as soon as one is returned
+    result = {}
+    waiter = threading.Thread(target=lambda: result.setdefault('conn', pool.checkout()))
+    pool.timeout = 2
+    waiter.start()
+    pool.checkin(a)
+    waiter.join()
+    assert result['conn'] is a
+
+    # Overflow connections are closed instead of kept idle
+    pool.checkin(result['conn'])
+    pool.checkin(b)
+    stats = pool.stats()
+    print(f"Stats: {stats}")
+    assert b.closed
+    assert stats['idle'] == 1
+    assert stats['waits'] == 2
+    assert stats['timeouts'] == 1
+
+
+def test_pooled_connection_close_returns_to_pool():
+    print("\nTesting PooledConnection.close()...")
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=1, ping_interval=0)
+
+    conn = PooledConnection(pool, pool.checkout())
+    assert conn.is_connected()
+    conn.close()
+    conn.close()  # closing twice is harmless
+    assert not conn.is_connected()
+    assert pool.stats()['idle'] == 1
+
+    print("\nConnection pool verification passed!")
+
+
+if __name__ == "__main__":
+    test_pool_reuses_connections()
+    test_pool_replaces_dead_connection()
+    test_pool_overflow_and_wait()
+    test_pooled_connection_close_returns_to_pool()
@@ -0,0 +1,37 @@
+from description_utils import html_to_text, make_description_preview, description_columns, make_search_text, SEARCH_TEXT_LENGTH
+
+
+def test_html_to_text():
+    print("Testing description plain-text conversion...")
+    description = '<p>Buy <strong>milk</strong> &amp; eggs</p><p><img src="data:image/jpeg;base64,AAAA"></p><p>Soon</p>'
+    text = html_to_text(description)
+    print(f"Text: '{text}'")
+    assert text == "Buy milk & eggs Soon"
+    assert html_to_text(None) == ""
+
+
+def test_preview_and_columns():
+    print("\nTesting description preview...")
+    long_description = "<p>" + "word " * 100 + "</p>"
+    preview = make_description_preview(long_description, length=20)
+    print(f"Preview: '{preview}'")
+    assert len(preview) <= 20
+    assert preview.endswith('…')
+
+    assert description_columns(None) == (None, 0)
+    assert description_columns("") == (None, 0)
+    # An image-only description has no text preview but still counts as a description
+    assert description_columns('<p><img src="/images/abc.jpg"></p>') == (None, 1)
+    assert description_columns("<p>Call Bob</p>") == ("Call Bob", 1)
+
+    # Full-text shadow: title plus the description's text, bounded in size
+    assert make_search_text("Call Bob", "<p>about the <b>invoice</b></p>") == "Call Bob\nabout the invoice"
+    assert make_search_text("Call Bob", None) == "Call Bob"
+    assert len(make_search_text("t", "<p>" + "x" * (SEARCH_TEXT_LENGTH + 10) + "</p>")) == SEARCH_TEXT_LENGTH
+
+    print("\nDescription utils verification passed!")
+
+
+if __name__ == "__main__":
+    test_html_to_text()
+    test_preview_and_columns()
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from db_manager import get_db_connection
+from task_manager import TaskManager
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_due_dates_shift_with_branch():
+    print("Testing due date shifting...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    manager = TaskManager()
+
+    def due_dates():
+        cursor.execute("SELECT title, due_at FROM tasks WHERE user_id = %s", (user_id,))
+        rows = dict(cursor.fetchall())
+        conn.commit()
+        return rows
+
+    def newest_task_id():
+        cursor.execute("SELECT MAX(id) FROM tasks WHERE user_id = %s", (user_id,))
+        task_id = cursor.fetchone()[0]
+        conn.commit()
+        return task_id
+
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('due_shift_check', 'due_shift_check@example.com', 'Due shift check'))
+        user_id = cursor.lastrowid
+        conn.commit()
+
+        base = datetime(2030, 1, 10, 9, 0)
+        manager.add_task(user_id, "Project", due_at=base, run_ai=False)
+        project = newest_task_id()
+        manager.add_task(user_id, "Step", parent_id=project, due_at=base + timedelta(days=1), run_ai=False)
+        step = newest_task_id()
+        manager.add_task(user_id, "Sub step", parent_id=step, due_at=base + timedelta(days=2), run_ai=False)
+        manager.add_task(user_id, "Undated", parent_id=step, run_ai=False)
+
+        # Moving the project two days later moves its subtasks with it
+        manager.update_task(user_id, project, due_at=(base + timedelta(days=2)).isoformat(), shift_subtasks=True)
+        dates = due_dates()
+        assert dates['Project'] == base + timedelta(days=2)
+        assert dates['Step'] == base + timedelta(days=3)
+        assert dates['Sub step'] == base + timedelta(days=4)
+        assert dates['Undated'] is None
+
+        # shift_branch moves the task itself too
+        assert manager.shift_branch(user_id, step, -3)
+        dates = due_dates()
+        assert dates['Project'] == base + timedelta(days=2)
+        assert (dates['Step'], dates['Sub step']) == (base, base + timedelta(days=1))
+        assert not manager.shift_branch(user_id, step, 'soon')
+        print("Due date shifting verification passed!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_due_dates_shift_with_branch()
@@ -0,0 +1,71 @@
+import time
+
+from forest_cache import ForestCache
+
+
+def _forest(title, size=10):
+    return [{'id': i, 'title': f"{title} {i}", 'children': []} for i in range(size)], {'total_time': 0}
+
+
+def test_hit_and_invalidate():
+    print("Testing forest cache hits and invalidation...")
+    cache = ForestCache(max_bytes=10 * 1024 * 1024, ttl=60)
+    key = ('search', None, None, 'today')
+
+    assert cache.get(1, key, 5) is None
+    cache.put(1, key, _forest('A'), 5)
+    assert cache.get(1, key, 5)[0][0]['title'] == 'A 0'
+
+    # A write by user 1 invalidates only user 1
+    cache.put(2, key, _forest('B'), 1)
+    cache.invalidate(1)
+    assert cache.get(1, key, 5) is None
+    assert cache.get(2, key, 1) is not None
+
+    stats = cache.stats()
+    print(f"Stats: {stats}")
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+
+
+def test_version_mismatch_is_a_miss():
+    print("\nTesting writes from other workers...")
+    cache = ForestCache(ttl=60)
+    cache.put(1, 'key', _forest('Old'), 3)
+    # Another worker committed a write, so the stored version moved on
+    assert cache.get(1, 'key', 4) is None
+    # The stale entry is gone even when asked with the old version again
+    assert cache.get(1, 'key', 3) is None
+
+
+def test_expiry_and_lru_eviction():
+    print("\nTesting expiry and LRU eviction...")
+    cache = ForestCache(ttl=60)
+    cache.put(1, 'key', _forest('A'), 1, expires_at=time.time() - 1)
+    assert cache.get(1, 'key', 1) is None
+
+    # Room for two forests, not three
+    sizer = ForestCache()
+    sizer.put(1, 'key', _forest('A'), 1)
+    entry_size = sizer.stats()['bytes']
+
+    cache = ForestCache(max_bytes=int(entry_size * 2.5), ttl=60)
+    for user_id in (1, 2, 3):
+        cache.put(user_id, 'key', _forest('A'), 1)
+        if user_id == 2:
+            cache.get(1, 'key', 1)  # Touch user 1 so user 2 is the least recently used
+    assert cache.get(2, 'key', 1) is None
+    assert cache.get(1, 'key', 1) is not None
+    assert cache.get(3, 'key', 1) is not None
+    stats = cache.stats()
+    print(f"Stats: {stats}")
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= cache.max_bytes
+
+    print("\nForest cache verification passed!")
+
+
+if __name__ == "__main__":
+    test_hit_and_invalidate()
+    test_version_mismatch_is_a_miss()
+    test_expiry_and_lru_eviction()
@@ -1,3 +1,7 @@
+import random
+
+import pytest
+
 from info_panel_manager import InfoPanelManager
 
 def test_info_panel_logic():
@@ -67,6 +71,46 @@ def test_info_panel_logic():
     
     print("\nInfo Panel Logic verification passed!")
 
+def random_tasks(count, seed):
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(1, count + 1):
+        parent_id = rng.randint(1, i - 1) if i > 1 and rng.random() < 0.8 else None
+        if rng.random() < 0.01:
+            parent_id = count + 1  # parent not listed (e.g. hidden)
+        tags = [{'name': name} for name in rng.sample(['work', 'home', 'errands', 'work', ''], rng.randint(0, 2))]
+        tasks.append({
+            'id': i,
+            'parent_id': parent_id,
+            'status': 'completed' if rng.random() < 0.3 else 'pending',
+            'time_minutes': rng.choice([None, 0, 5, 15, 60]),
+            'importance': rng.choice([None, '', 'Important', 'Medium', 'Normal', 'Someday']),
+            'tags': tags,
+        })
+    # A parent cycle, which TaskForest cuts
+    tasks[-1]['parent_id'], tasks[-2]['parent_id'] = tasks[-2]['id'], tasks[-1]['id']
+    return tasks
+
+
+def test_array_backend_matches():
+    print("\nComparing the python and numpy stats backends...")
+    pytest.importorskip("numpy")
+    for seed in range(5):
+        tasks = random_tasks(2000, seed)
+        expected = InfoPanelManager.calculate_stats(tasks, backend='python')
+        actual = InfoPanelManager.calculate_stats(tasks, backend='numpy')
+        assert actual == expected, (seed, actual, expected)
+        assert list(actual['tag_summary'].values()) == sorted(actual['tag_summary'].values(), reverse=True)
+    # One long chain (depth is found by pointer jumping, levels are walked one by one)
+    chain = [{'id': i, 'parent_id': i - 1 if i > 1 else None, 'status': 'pending', 'time_minutes': 1,
+              'importance': 'Medium' if i == 500 else None, 'tags': [{'name': 'deep'}] if i % 700 == 0 else []}
+             for i in range(1, 3001)]
+    assert InfoPanelManager.calculate_stats(chain, backend='numpy') == InfoPanelManager.calculate_stats(chain, backend='python')
+    assert InfoPanelManager.calculate_stats([], backend='numpy') == InfoPanelManager.calculate_stats([])
+    print("Array backend verification passed!")
+
+
 if __name__ == "__main__":
     test_info_panel_logic()
+    test_array_backend_matches()
     
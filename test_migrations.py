@@ -0,0 +1,22 @@
+from migrations import MIGRATIONS, LATEST_VERSION
+
+
+def test_migration_order():
+    print("Testing migration list...")
+    versions = [version for version, _, _ in MIGRATIONS]
+    print(f"Versions: {versions}")
+
+    # Versions are unique, strictly increasing and start at 1
+    assert versions[0] == 1
+    assert versions == sorted(set(versions))
+    assert LATEST_VERSION == versions[-1]
+
+    for version, name, step in MIGRATIONS:
+        assert name, f"Migration {version} needs a name"
+        assert callable(step)
+
+    print("Migration list verification passed!")
+
+
+if __name__ == "__main__":
+    test_migration_order()
@@ -0,0 +1,93 @@
+import pytest
+
+from db_manager import get_db_connection
+from task_manager import (LIST_TASKS_QUERY, USER_TASK_TAGS_QUERY, TASK_BRANCH_QUERY, TASK_BRANCH_TAGS_QUERY,
+                          DUPLICATE_BRANCH_QUERY, DUPLICATE_BRANCH_TAGS_QUERY, DUPLICATE_INSERT_QUERY, DUPLICATE_ROW)
+from task_closure import insert_task_closure
+
+# Enough rows that the optimizer prefers the indexes over scanning a tiny table
+USER_TASKS = 300
+OTHER_USER_TASKS = 3000
+
+
+def _create_user(cursor, name):
+    cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                   (f"plan_check_{name}", f"plan_check_{name}@example.com", name))
+    return cursor.lastrowid
+
+
+def _seed_tasks(cursor, user_id, count):
+    rows = [(f"Plan check task {i}", 'completed' if i % 3 == 0 else 'pending', user_id) for i in range(count)]
+    cursor.executemany("INSERT INTO tasks (title, status, user_id) VALUES (%s, %s, %s)", rows)
+    cursor.execute("SELECT id FROM tasks WHERE user_id = %s ORDER BY id", (user_id,))
+    ids = [row[0] for row in cursor.fetchall()]
+    # Give every task after the first ten a parent, and a tag on every other task
+    cursor.executemany("UPDATE tasks SET parent_id = %s, branch_id = %s WHERE id = %s",
+                       [(ids[i % 10], str(ids[i % 10]), tid) for i, tid in enumerate(ids) if i >= 10])
+    for i, tid in enumerate(ids):
+        insert_task_closure(cursor, tid, ids[i % 10] if i >= 10 else None)
+    cursor.execute("INSERT INTO tags (name, user_id) VALUES (%s, %s)", (f"plan{user_id}", user_id))
+    tag_id = cursor.lastrowid
+    cursor.executemany("INSERT INTO task_tags (task_id, tag_id) VALUES (%s, %s)",
+                       [(tid, tag_id) for tid in ids[::2]])
+    return ids
+
+
+def explain(cursor, query, params):
+    """Return the EXPLAIN rows for a query as dicts."""
+    cursor.execute("EXPLAIN " + query, params)
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def assert_indexed(name, plan, allow_filesort=True):
+    for row in plan:
+        print(f"  {name}: table={row['table']} type={row['type']} key={row['key']} extra={row['Extra']}")
+        assert row['type'] != 'ALL', f"{name} does a full scan of {row['table']}"
+        assert row['key'], f"{name} uses no index on {row['table']}"
+        if not allow_filesort:
+            assert 'filesort' not in (row['Extra'] or ''), f"{name} sorts {row['table']} without an index"
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_query_plans():
+    print("Checking query plans of the hot queries...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_ids = []
+    try:
+        user_id = _create_user(cursor, 'target')
+        user_ids.append(user_id)
+        ids = _seed_tasks(cursor, user_id, USER_TASKS)
+        other_id = _create_user(cursor, 'other')
+        user_ids.append(other_id)
+        _seed_tasks(cursor, other_id, OTHER_USER_TASKS)
+        conn.commit()
+        cursor.execute("ANALYZE TABLE tasks, tags, task_tags, task_closure")
+        cursor.fetchall()
+
+        assert_indexed('list_tasks', explain(cursor, LIST_TASKS_QUERY, (user_id,)), allow_filesort=False)
+        assert_indexed('task tags', explain(cursor, USER_TASK_TAGS_QUERY, (user_id,)))
+        assert_indexed('task branch', explain(cursor, TASK_BRANCH_QUERY, (2, ids[0], user_id, 2)))
+        assert_indexed('task branch tags', explain(cursor, TASK_BRANCH_TAGS_QUERY, (ids[0], 2, user_id)))
+
+        # duplicate_task: the subtree is read through the closure, then copied a level per statement
+        assert_indexed('duplicate branch', explain(cursor, DUPLICATE_BRANCH_QUERY, (ids[0], user_id)))
+        assert_indexed('duplicate branch tags', explain(cursor, DUPLICATE_BRANCH_TAGS_QUERY, (ids[0],)))
+        row = [user_id, 'Plan check copy', None, None, False, 'plan check copy', 0, 1, None, ids[0], None, 1, None, 0]
+        plan = explain(cursor, DUPLICATE_INSERT_QUERY.format(rows=', '.join([DUPLICATE_ROW] * 3)), row * 3)
+        print(f"  duplicate insert: {[(r['table'], r['select_type']) for r in plan]}")
+        assert [r['select_type'] for r in plan] == ['INSERT']
+
+        print("Query plan verification passed!")
+    finally:
+        for uid in user_ids:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (uid,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (uid,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_query_plans()
@@ -1,4 +1,4 @@
-from search_manager import SearchManager
+from search_manager import SearchManager, fulltext_query
 
 def test_search_logic():
     print("Testing Search and Filtering Logic...")
@@ -72,5 +72,18 @@ def test_search_logic():
 
     print("\nSearch Logic verification passed!")
 
+def test_fulltext_query():
+    print("Testing full-text query building...")
+    # Every word is required and matched as a prefix; operators typed by the user are dropped
+    assert fulltext_query("Quarterly repo") == "+quarterly* +repo*"
+    assert fulltext_query('-budget "draft"*') == "+budget* +draft*"
+    assert fulltext_query("fix fix") == "+fix*"
+    # Words shorter than the InnoDB minimum token size cannot use the index
+    assert fulltext_query("to do") is None
+    assert fulltext_query("go shopping") == "+shopping*"
+    assert fulltext_query(None) is None
+    print("Full-text query verification passed!")
+
 if __name__ == "__main__":
     test_search_logic()
+    test_fulltext_query()
@@ -0,0 +1,120 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from db_manager import get_db_connection
+from search_manager import SearchManager
+from task_manager import LIST_TASKS_QUERY, USER_TASK_TAGS_QUERY, FILTERED_LIST_TASKS_QUERY
+
+TASKS = 400
+TAG_NAMES = ['work', 'home', 'urgent', 'Work', 'errand_1', '100%']
+TITLE_WORDS = ['Project', 'alpha', 'Beta', 'fix', 'Café', 'report', 'call', '50%', 'a_b']
+IMPORTANCES = [None, '', 'Normal', 'Important', 'Medium', 'Low']
+
+# Filter combinations compared between the SQL and the Python implementation
+CASES = [
+    {'search_query': 'beta'},
+    {'search_query': 'PROJECT'},
+    {'search_query': 'cafe'},
+    {'search_query': '%'},
+    {'search_query': 'a_b'},
+    {'search_query': 'work'},
+    {'search_query': 'normal'},
+    {'tag_filter': 'work'},
+    {'tag_filter': 'Work'},
+    {'tag_filter': 'urgent', 'period_filter': 'today'},
+    {'importance_filter': 'Normal'},
+    {'importance_filter': 'Important'},
+    {'period_filter': 'today'},
+    {'period_filter': 'tomorrow'},
+    {'period_filter': 'this_week'},
+    {'period_filter': 'next_week'},
+    {'period_filter': 'all'},
+    {'search_query': 'fix', 'importance_filter': 'Low', 'period_filter': 'this_week'},
+    {'search_query': 'report', 'tag_filter': 'home'},
+]
+
+
+def _random_date(rng, now):
+    if rng.random() < 0.3:
+        return None
+    # Whole days plus a few hours keep dates away from the period boundaries
+    return now.replace(minute=0, second=0, microsecond=0) + timedelta(days=rng.randint(-10, 20), hours=rng.choice([-5, 3]))
+
+
+def _seed(cursor, user_id, rng):
+    now = datetime.now()
+    ids = []
+    for i in range(TASKS):
+        title = ' '.join(rng.sample(TITLE_WORDS, 2)) + f" {i}"
+        status = 'completed' if rng.random() < 0.3 else 'pending'
+        parent_id = rng.choice(ids) if ids and rng.random() < 0.7 else None
+        hide_until = now + timedelta(days=1) if rng.random() < 0.05 else None
+        cursor.execute("""
+            INSERT INTO tasks (title, status, user_id, parent_id, importance, due_at, completed_at, hide_until)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (title, status, user_id, parent_id, rng.choice(IMPORTANCES), _random_date(rng, now),
+              _random_date(rng, now) if status == 'completed' else None, hide_until))
+        ids.append(cursor.lastrowid)
+
+    tag_ids = []
+    for name in TAG_NAMES:
+        cursor.execute("INSERT INTO tags (name, user_id) VALUES (%s, %s)", (name, user_id))
+        tag_ids.append(cursor.lastrowid)
+    links = {(tid, rng.choice(tag_ids)) for tid in rng.sample(ids, TASKS // 3)}
+    cursor.executemany("INSERT INTO task_tags (task_id, tag_id) VALUES (%s, %s)", sorted(links))
+
+
+def _python_ids(cursor, user_id, filters):
+    cursor.execute(LIST_TASKS_QUERY, (user_id,))
+    tasks = cursor.fetchall()
+    cursor.execute(USER_TASK_TAGS_QUERY, (user_id,))
+    tags = {}
+    for row in cursor.fetchall():
+        tags.setdefault(row['task_id'], []).append({'id': row['id'], 'name': row['name']})
+    for task in tasks:
+        task['tags'] = tags.get(task['id'], [])
+    return {t['id'] for t in SearchManager.filter_tasks(tasks, **filters)}
+
+
+def _sql_ids(cursor, user_id, filters):
+    with_clause, params = SearchManager.build_filter_query(user_id, fulltext=False, **filters)
+    assert with_clause.count('%s') == len(params)
+    cursor.execute(FILTERED_LIST_TASKS_QUERY.format(with_clause=with_clause), (*params, user_id))
+    return {row['id'] for row in cursor.fetchall()}
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_sql_filters_match_python():
+    print("Comparing SQL filters with SearchManager.filter_tasks...")
+    assert SearchManager.build_filter_query(1) is None
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('search_sql_check', 'search_sql_check@example.com', 'Search check'))
+        user_id = cursor.lastrowid
+        _seed(cursor, user_id, random.Random(8))
+        conn.commit()
+
+        for filters in CASES:
+            expected = _python_ids(cursor, user_id, filters)
+            actual = _sql_ids(cursor, user_id, filters)
+            print(f"  {filters}: {len(actual)} tasks")
+            assert actual == expected, f"{filters}: only SQL {sorted(actual - expected)}, only Python {sorted(expected - actual)}"
+
+        print("SQL filter verification passed!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_sql_filters_match_python()
@@ -0,0 +1,163 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from db_manager import get_db_connection
+from info_panel_manager import InfoPanelManager
+from ctask import CTask
+from stats_service import (STATS_QUERY, ROLLUP_QUERY, contribution_from_rows, stats_from_contribution,
+                           rebuild_user_stats)
+from task_closure import insert_task_closure
+from task_manager import TaskManager, LIST_TASKS_QUERY, USER_TASK_TAGS_QUERY
+
+
+def test_stats_from_contribution():
+    print("Testing stats rows...")
+    contribution = contribution_from_rows([
+        ('total', '', 6, 90), ('unrated', '', 2, 20),
+        ('importance', 'Important', 3, 50), ('importance', 'Normal', 1, 5),
+        ('tag', 'home', 1, 10), ('tag', 'work', 4, 60), ('tag', 'gone', 0, 0),
+    ])
+    assert ('tag', 'gone') not in contribution
+    stats = stats_from_contribution(contribution)
+    assert stats['total_time'] == 90
+    assert stats['importance_summary'] == {'Important': 50, 'Medium': 0, 'Normal': 25}
+    assert list(stats['tag_summary'].items()) == [('work', 60), ('home', 10)]
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_sql_stats_match_python():
+    print("\nComparing SQL stats with InfoPanelManager.calculate_stats...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    rng = random.Random(14)
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('stats_check', 'stats_check@example.com', 'Stats check'))
+        user_id = cursor.lastrowid
+
+        ids = []
+        for i in range(300):
+            parent_id = rng.choice(ids) if ids and rng.random() < 0.7 else None
+            hide_until = datetime.now() + timedelta(days=1) if rng.random() < 0.05 else None
+            cursor.execute("""
+                INSERT INTO tasks (title, status, user_id, parent_id, time_minutes, importance, hide_until)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (f"Stats task {i}", 'completed' if rng.random() < 0.2 else 'pending', user_id, parent_id,
+                  rng.choice([None, 0, 15, 30, 60]), rng.choice([None, '', 'Normal', 'Important', 'Medium']), hide_until))
+            ids.append(cursor.lastrowid)
+            insert_task_closure(cursor, ids[-1], parent_id)
+        tag_ids = []
+        for name in ['work', 'home', 'errands']:
+            cursor.execute("INSERT INTO tags (name, user_id) VALUES (%s, %s)", (name, user_id))
+            tag_ids.append(cursor.lastrowid)
+        links = {(tid, rng.choice(tag_ids)) for tid in rng.sample(ids, 80)}
+        cursor.executemany("INSERT INTO task_tags (task_id, tag_id) VALUES (%s, %s)", sorted(links))
+        conn.commit()
+
+        cursor.execute(STATS_QUERY, (user_id,))
+        sql_stats = stats_from_contribution(contribution_from_rows(cursor.fetchall()))
+
+        dict_cursor = conn.cursor(dictionary=True)
+        dict_cursor.execute(LIST_TASKS_QUERY, (user_id,))
+        tasks = dict_cursor.fetchall()
+        dict_cursor.execute(USER_TASK_TAGS_QUERY, (user_id,))
+        tags = {}
+        for row in dict_cursor.fetchall():
+            tags.setdefault(row['task_id'], []).append({'id': row['id'], 'name': row['name']})
+        dict_cursor.close()
+        for task in tasks:
+            task['tags'] = tags.get(task['id'], [])
+        python_stats = InfoPanelManager.calculate_stats(tasks)
+
+        print(f"SQL: {sql_stats}")
+        assert sql_stats == python_stats
+        print("Stats service verification passed!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_rollup_deltas_match_recomputation():
+    print("\nChecking the stats rollup after each kind of write...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    manager = TaskManager()
+
+    def check(step):
+        cursor.execute(ROLLUP_QUERY, (user_id,))
+        stored = contribution_from_rows(cursor.fetchall())
+        cursor.execute(STATS_QUERY, (user_id,))
+        expected = contribution_from_rows(cursor.fetchall())
+        conn.commit()
+        assert stored == expected, f"{step}: {stored} != {expected}"
+
+    def newest_task_id():
+        cursor.execute("SELECT MAX(id) FROM tasks WHERE user_id = %s", (user_id,))
+        task_id = cursor.fetchone()[0]
+        conn.commit()
+        return task_id
+
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('rollup_check', 'rollup_check@example.com', 'Rollup check'))
+        user_id = cursor.lastrowid
+        rebuild_user_stats(cursor, user_id)
+        conn.commit()
+
+        manager.add_task(user_id, "Root #work", time_minutes=30, importance='Important', run_ai=False)
+        root = newest_task_id()
+        check("add root")
+        manager.add_task(user_id, "Child", parent_id=root, time_minutes=20, run_ai=False)
+        child = newest_task_id()
+        manager.add_task(user_id, "Grandchild #home", parent_id=child, time_minutes=10, run_ai=False)
+        grandchild = newest_task_id()
+        manager.add_task(user_id, "Other root", time_minutes=5, run_ai=False)
+        other = newest_task_id()
+        check("add subtasks")
+        manager.update_task(user_id, child, time_minutes=25, importance='Medium')
+        check("update time and importance")
+        manager.update_task(user_id, root, importance='')
+        check("clear importance")
+        CTask(user_id, child).add_tag('errands')
+        check("add tag")
+        tag_id = CTask(user_id, child).get_tags()[0]['id']
+        CTask(user_id, child).remove_tag(tag_id)
+        check("remove tag")
+        manager.complete_task(user_id, child)
+        check("complete")
+        manager.uncomplete_task(user_id, grandchild)
+        check("uncomplete")
+        manager.uncomplete_task(user_id, child, cascade=True)
+        check("uncomplete with subtasks")
+        manager.complete_task(user_id, child)
+        manager.hide_task(user_id, child, 'next_week')
+        check("hide")
+        manager.move_task(user_id, child, other)
+        check("move")
+        manager.duplicate_task(user_id, other)
+        check("duplicate")
+        manager.delete_task(user_id, other)
+        check("delete")
+        print("Stats rollup deltas verified!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_stats_from_contribution()
+    test_sql_stats_match_python()
+    test_rollup_deltas_match_recomputation()
@@ -0,0 +1,110 @@
+import pytest
+
+from db_manager import get_db_connection
+from tag_store import TagIdCache, normalize_tag_name, resolve_tag_ids, link_tags, tag_ids
+
+
+class _CountingCursor:
+    """Wraps a cursor and counts the statements sent through it."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.statements = 0
+
+    def execute(self, *args):
+        self.statements += 1
+        return self.cursor.execute(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def test_tag_id_cache():
+    print("Testing the tag id cache...")
+    assert normalize_tag_name(' #Work ') == 'work'
+    assert normalize_tag_name('#') == ''
+
+    cache = TagIdCache(max_users=2, max_names=2)
+    cache.put_many(1, {'a': 10, 'b': 11})
+    assert cache.get_many(1, ['a', 'b', 'c']) == {'a': 10, 'b': 11}
+
+    # 'a' was used last, so a third name pushes out 'b'
+    cache.get_many(1, ['a'])
+    cache.put_many(1, {'c': 12})
+    assert cache.get_many(1, ['a', 'b', 'c']) == {'a': 10, 'c': 12}
+
+    # A third user pushes out the least recently used one
+    cache.put_many(2, {'x': 20})
+    cache.put_many(3, {'y': 30})
+    assert cache.get_many(1, ['a']) == {}
+    assert cache.get_many(3, ['y']) == {'y': 30}
+
+    cache.invalidate(3)
+    assert cache.get_many(3, ['y']) == {}
+    stats = cache.stats()
+    print(f"Stats: {stats}")
+    assert stats['users'] == 1
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_link_many_tags_in_constant_statements():
+    print("\nTesting batched tag links...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('tag_store_check', 'tag_store_check@example.com', 'Tag store check'))
+        user_id = cursor.lastrowid
+        cursor.execute("INSERT INTO tasks (title, user_id) VALUES (%s, %s)", ('Tagged', user_id))
+        task_id = cursor.lastrowid
+        conn.commit()
+
+        names = [f"#Tag{i}" for i in range(10)] + ['#tag0']
+        counting = _CountingCursor(cursor)
+        links = link_tags(counting, user_id, task_id, names)
+        conn.commit()
+        print(f"Linked {len(links)} tags with {counting.statements} statements")
+        # INSERT tags, SELECT ids, INSERT links
+        assert counting.statements == 3
+        assert sorted(name for _, name in links) == sorted(f"tag{i}" for i in range(10))
+
+        cursor.execute("SELECT COUNT(*) FROM task_tags WHERE task_id = %s", (task_id,))
+        assert cursor.fetchone()[0] == 10
+
+        # Known names come from the cache: only the link statement remains
+        counting = _CountingCursor(cursor)
+        link_tags(counting, user_id, task_id, names[:5])
+        assert counting.statements == 1
+        assert set(resolve_tag_ids(cursor, user_id, ['tag3'], use_cache=False)) == {'tag3'}
+
+        # A cached id whose tag is gone is resolved again
+        cursor.execute("INSERT INTO tasks (title, user_id) VALUES (%s, %s)", ('Other', user_id))
+        other_id = cursor.lastrowid
+        cursor.execute("DELETE FROM tags WHERE user_id = %s AND name = 'tag9'", (user_id,))
+        conn.commit()
+        assert [name for _, name in link_tags(cursor, user_id, other_id, ['tag9'])] == ['tag9']
+        conn.commit()
+
+        # A name equal to an existing tag under the collation ('café' and 'cafe' with the
+        # default accent-insensitive one) resolves to that tag instead of being dropped
+        cursor.execute("INSERT INTO tags (name, user_id) VALUES (%s, %s)", ('cafe', user_id))
+        conn.commit()
+        resolved = resolve_tag_ids(cursor, user_id, ['#Café', 'cafe'], use_cache=False)
+        assert set(resolved) == {'café', 'cafe'}
+        links = link_tags(cursor, user_id, other_id, ['#Café', 'cafe'])
+        assert len(links) == len(set(resolved.values()))
+        conn.commit()
+        print("Batched tag links passed!")
+    finally:
+        if user_id is not None:
+            tag_ids.invalidate(user_id)
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    test_tag_id_cache()
+    test_link_many_tags_in_constant_statements()
@@ -0,0 +1,232 @@
+import pytest
+
+from db_manager import get_db_connection
+from task_closure import (insert_task_closure, move_subtree_closure, is_in_subtree, SUBTREE_IDS_QUERY, ANCESTOR_IDS_QUERY,
+                          BRANCH_TOTAL_DRIFT_QUERY)
+
+
+def _closure_rows(cursor, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"SELECT ancestor_id, descendant_id, depth FROM task_closure WHERE descendant_id IN ({placeholders})", tuple(ids))
+    return set(cursor.fetchall())
+
+
+def _expected_rows(parents):
+    """Closure rows computed in Python from {task_id: parent_id}."""
+    rows = set()
+    for task_id in parents:
+        depth, current = 0, task_id
+        while current is not None:
+            rows.add((current, task_id, depth))
+            current, depth = parents[current], depth + 1
+    return rows
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_closure_maintenance():
+    print("Testing task_closure maintenance...")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('closure_check', 'closure_check@example.com', 'Closure check'))
+        user_id = cursor.lastrowid
+
+        # a -> b -> c, a -> d, and a separate root e
+        parents = {}
+        names = {}
+        for name, parent in [('a', None), ('b', 'a'), ('c', 'b'), ('d', 'a'), ('e', None)]:
+            parent_id = names.get(parent)
+            cursor.execute("INSERT INTO tasks (title, user_id, parent_id) VALUES (%s, %s, %s)", (name, user_id, parent_id))
+            names[name] = cursor.lastrowid
+            insert_task_closure(cursor, names[name], parent_id)
+            parents[names[name]] = parent_id
+        conn.commit()
+        ids = list(names.values())
+        assert _closure_rows(cursor, ids) == _expected_rows(parents)
+
+        cursor.execute(SUBTREE_IDS_QUERY, (names['a'], user_id))
+        assert {row[0] for row in cursor.fetchall()} == {names['a'], names['b'], names['c'], names['d']}
+        cursor.execute(ANCESTOR_IDS_QUERY, (names['c'], user_id))
+        assert [row[0] for row in cursor.fetchall()] == [names['a'], names['b'], names['c']]
+
+        # Move b (with c) under e, then d to the top level
+        assert not is_in_subtree(cursor, names['b'], names['e'])
+        assert is_in_subtree(cursor, names['a'], names['c'])
+        for task, new_parent in [('b', 'e'), ('d', None)]:
+            new_parent_id = names.get(new_parent)
+            cursor.execute("UPDATE tasks SET parent_id = %s WHERE id = %s", (new_parent_id, names[task]))
+            move_subtree_closure(cursor, names[task], new_parent_id)
+            parents[names[task]] = new_parent_id
+        conn.commit()
+        rows = _closure_rows(cursor, ids)
+        print(f"Closure rows after moves: {len(rows)}")
+        assert rows == _expected_rows(parents)
+
+        # Deleting a task removes its subtree's rows through the foreign keys
+        cursor.execute("DELETE FROM tasks WHERE id = %s", (names['e'],))
+        conn.commit()
+        assert _closure_rows(cursor, ids) == _expected_rows({names['a']: None, names['d']: None})
+
+        print("task_closure verification passed!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_branch_totals_follow_writes():
+    print("\nTesting stored branch totals...")
+    from task_manager import TaskManager
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    manager = TaskManager()
+
+    def totals():
+        cursor.execute("SELECT id, branch_total_minutes FROM tasks WHERE user_id = %s", (user_id,))
+        stored = dict(cursor.fetchall())
+        cursor.execute(BRANCH_TOTAL_DRIFT_QUERY)
+        drift = [row for row in cursor.fetchall() if row[0] in stored]
+        conn.commit()
+        assert not drift, drift
+        return stored
+
+    def newest_task_id():
+        cursor.execute("SELECT MAX(id) FROM tasks WHERE user_id = %s", (user_id,))
+        task_id = cursor.fetchone()[0]
+        conn.commit()
+        return task_id
+
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('branch_totals_check', 'branch_totals_check@example.com', 'Branch totals check'))
+        user_id = cursor.lastrowid
+        conn.commit()
+
+        manager.add_task(user_id, "Root", time_minutes=10, run_ai=False)
+        root = newest_task_id()
+        manager.add_task(user_id, "Child", parent_id=root, time_minutes=20, run_ai=False)
+        child = newest_task_id()
+        manager.add_task(user_id, "Grandchild", parent_id=child, time_minutes=30, run_ai=False)
+        grandchild = newest_task_id()
+        manager.add_task(user_id, "Other", time_minutes=5, run_ai=False)
+        other = newest_task_id()
+        assert totals()[root] == 60
+
+        manager.update_task(user_id, grandchild, time_minutes=40)
+        assert totals()[root] == 70
+        manager.complete_task(user_id, child)
+        assert totals()[root] == 10
+        manager.uncomplete_task(user_id, grandchild)
+        assert totals()[child] == 40
+        manager.move_task(user_id, child, other)
+        stored = totals()
+        assert (stored[root], stored[other]) == (10, 45)
+        manager.duplicate_task(user_id, child)
+        assert totals()[other] == 105
+        manager.delete_task(user_id, child)
+        assert totals()[other] == 65
+        manager.complete_task(user_id, other)
+        assert totals()[other] == 0
+        manager.uncomplete_task(user_id, other, cascade=True)
+        assert totals()[other] == 65
+
+        print("Branch total verification passed!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+
+@pytest.mark.usefixtures('requires_database')
+def test_duplicate_many():
+    print("\nTesting bulk duplication...")
+    from ctask import CTask
+    from task_manager import TaskManager
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user_id = None
+    manager = TaskManager()
+    try:
+        cursor.execute("INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s)",
+                       ('duplicate_check', 'duplicate_check@example.com', 'Duplicate check'))
+        user_id = cursor.lastrowid
+        conn.commit()
+
+        def newest_task_id():
+            cursor.execute("SELECT MAX(id) FROM tasks WHERE user_id = %s", (user_id,))
+            task_id = cursor.fetchone()[0]
+            conn.commit()
+            return task_id
+
+        manager.add_task(user_id, "Project", time_minutes=5, run_ai=False)
+        project = newest_task_id()
+        manager.add_task(user_id, "Template #tmpl", parent_id=project, time_minutes=10, run_ai=False)
+        template = newest_task_id()
+        manager.add_task(user_id, "Step 1", parent_id=template, time_minutes=20, run_ai=False)
+        manager.add_task(user_id, "Step 2", parent_id=template, time_minutes=30, run_ai=False)
+        step = newest_task_id()
+        CTask(user_id, step).add_tag('later')
+
+        assert manager.duplicate_task(user_id, template, times=3)
+        cursor.execute("""
+            SELECT id, title, parent_id, level, branch_id, branch_total_minutes
+            FROM tasks WHERE user_id = %s ORDER BY id
+        """, (user_id,))
+        rows = cursor.fetchall()
+        copies = [row for row in rows if row[1].startswith("Template copy")]
+        assert sorted(row[1] for row in copies) == ["Template copy 1", "Template copy 2", "Template copy 3"]
+        assert all(row[2] == project and row[3] == 1 and row[4] == str(project) and row[5] == 60 for row in copies)
+        assert len(rows) == 4 + 3 * 3
+        assert all(row[3] == 2 and row[4] == str(project) for row in rows if row[1].startswith("Step"))
+
+        cursor.execute("SELECT branch_total_minutes FROM tasks WHERE id = %s", (project,))
+        assert cursor.fetchone()[0] == 5 + 4 * 60
+        cursor.execute("""
+            SELECT COUNT(*) FROM task_tags tt JOIN tags g ON g.id = tt.tag_id
+            WHERE g.user_id = %s AND g.name IN ('tmpl', 'later')
+        """, (user_id,))
+        assert cursor.fetchone()[0] == 4 * 2
+
+        parents = {row[0]: row[2] for row in rows}
+        assert _closure_rows(cursor, list(parents)) == _expected_rows(parents)
+        conn.commit()
+        print("Bulk duplication verification passed!")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM tasks WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        conn.close()
+
+
+def test_move_rejects_bad_parent_id():
+    print("\nTesting move_task with a non-numeric parent...")
+    from unittest.mock import patch
+    from task_manager import TaskManager
+    # Rejected before a connection (and the rollup lock's transaction) is taken
+    with patch('task_manager.get_db_connection', side_effect=AssertionError("connection taken")):
+        assert TaskManager().move_task(1, 1, 'not a number') is False
+
+
+if __name__ == "__main__":
+    test_closure_maintenance()
+    test_branch_totals_follow_writes()
+    test_duplicate_many()
+    test_move_rejects_bad_parent_id()
@@ -0,0 +1,57 @@
+from task_forest import TaskForest
+
+
+def test_traversals():
+    print("Testing TaskForest traversals...")
+    #   1         5
+    #   ├── 2     └── 6 (parent 99 is not loaded: a root too)
+    #   │   └── 4
+    #   └── 3
+    forest = TaskForest([1, 2, 3, 4, 5, 6], [None, 1, 1, 2, None, 99])
+    assert forest.roots == [1, 5, 6]
+    assert list(forest.preorder()) == [1, 2, 4, 3, 5, 6]
+    assert list(forest.postorder()) == [4, 2, 3, 1, 5, 6]
+    assert list(forest.preorder(2)) == [2, 4]
+    assert list(forest.postorder(1)) == [4, 2, 3, 1]
+    assert list(forest.descendants(1)) == [2, 4, 3]
+    assert list(forest.descendants(4)) == []
+    assert list(forest.ancestors(4)) == [2, 1]
+    assert forest.children(1) == [2, 3]
+    assert forest.parent(4) == 2 and forest.parent(6) is None
+    assert forest.root(4) == 1 and forest.depth(4) == 2
+    assert 4 in forest and 99 not in forest
+    assert len(forest) == 6 and not forest.cut
+
+    # Dict rows and cursor tuples build the same forest
+    dicts = [{'id': 1, 'parent_id': None}, {'id': 2, 'parent_id': 1}]
+    assert list(TaskForest.from_tasks(dicts).preorder()) == list(TaskForest.from_rows([(1, None), (2, 1)]).preorder())
+
+
+def test_cycles_are_cut():
+    print("\nTesting cycle protection...")
+    # 7 -> 8 -> 9 -> 7 is a cycle with 10 below it; 11 is its own parent
+    forest = TaskForest([1, 7, 8, 9, 10, 11], [None, 8, 9, 7, 9, 11])
+    print(f"Roots: {forest.roots}, cut: {forest.cut}")
+    assert forest.cut == {7, 11}
+    assert forest.roots == [1, 11, 7]
+    assert sorted(forest.preorder()) == [1, 7, 8, 9, 10, 11]
+    assert sorted(forest.postorder()) == [1, 7, 8, 9, 10, 11]
+    assert list(forest.ancestors(10)) == [9, 7]
+    assert forest.parent(8) == 9
+
+
+def test_deep_chain():
+    print("\nTesting a deep chain...")
+    # Far deeper than the recursion limit
+    depth = 100000
+    forest = TaskForest(range(depth), [None] + list(range(depth - 1)))
+    assert sum(1 for _ in forest.preorder()) == depth
+    assert next(forest.postorder()) == depth - 1
+    assert forest.depth(depth - 1) == depth - 1
+    print("TaskForest verification passed!")
+
+
+if __name__ == "__main__":
+    test_traversals()
+    test_cycles_are_cut()
+    test_deep_chain()
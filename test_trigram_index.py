@@ -0,0 +1,99 @@
+from trigram_index import trigrams, TrigramIndex, UserSearchIndex, SearchIndexRegistry
+
+
+def _rows():
+    tasks = [(1, None, 'Quarterly report'), (2, 1, 'Collect receipts'), (3, 2, 'Scan receipts'), (4, None, 'Call plumber')]
+    task_tags = [(2, 10, 'finance'), (4, 11, 'home')]
+    tags = [(10, 'finance'), (11, 'home'), (12, 'fitness')]
+    return tasks, task_tags, tags
+
+
+def test_trigrams_and_ranking():
+    print("Testing trigram matching...")
+    assert trigrams("Cat") == {'  c', ' ca', 'cat', 'at '}
+    assert trigrams("!!") == set()
+
+    index = TrigramIndex()
+    index.set(1, 'Quarterly report')
+    index.set(2, 'Report card')
+    index.set(3, 'Call plumber')
+
+    # Typos still match, and the closer (shorter) text ranks first on equal coverage
+    hits = index.search('reprot')
+    print(f"Hits for 'reprot': {hits}")
+    assert [doc_id for doc_id, _ in hits] == [2, 1]
+    assert index.search('plumbr')[0][0] == 3
+    assert index.search('zzzz') == []
+
+    index.remove(3)
+    assert index.search('plumber') == []
+    assert len(index) == 2
+
+
+def test_user_index_updates():
+    print("\nTesting incremental index updates...")
+    index = UserSearchIndex.build(1, *_rows())
+
+    # Tasks are found through their tag names, tags through their own index
+    assert index.suggest('finance')['tasks'][0]['id'] == 2
+    assert [t['name'] for t in index.suggest('fin')['tags']] == ['finance', 'fitness']
+
+    index.save_task(1, 'Yearly summary')
+    assert not index.suggest('quarterly')['tasks']
+    assert index.suggest('summary')['tasks'][0]['id'] == 1
+
+    index.link_tags(4, [(13, 'urgent')])
+    assert index.suggest('urgent')['tasks'][0]['id'] == 4
+    assert index.suggest('urgent')['tags'][0]['id'] == 13
+    index.unlink_tag(4, 13)
+    assert not index.suggest('urgent')['tasks']
+    index.save_task(5, 'Prune roses', tags=[(14, 'garden')])
+    assert index.suggest('garden')['tasks'][0]['id'] == 5
+
+    # Deleting a task removes its subtree, like ON DELETE CASCADE
+    index.remove_subtree(1)
+    assert not index.suggest('receipts')['tasks']
+    assert index.suggest('plumber')['tasks'][0]['id'] == 4
+
+
+def test_registry_versions():
+    print("\nTesting index versions...")
+    registry = SearchIndexRegistry(max_users=2)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return _rows()
+
+    index = registry.get(1, 5, loader)
+    assert registry.get(1, 5, loader) is index
+    assert len(loads) == 1
+
+    # A write made here (version 5 -> 6) updates the index in place
+    registry.task_saved(1, 6, 5, 'Water plants', None)
+    assert registry.get(1, 6, loader) is index
+    assert index.suggest('plants')['tasks'][0]['id'] == 5
+    assert len(loads) == 1
+
+    # A gap means another worker wrote in between: the index is rebuilt
+    registry.advance(1, 8)
+    registry.get(1, 8, loader)
+    assert len(loads) == 2
+    registry.get(1, 9, loader)
+    assert len(loads) == 3
+
+    # Least recently used users are dropped
+    registry.get(2, 1, loader)
+    registry.get(3, 1, loader)
+    stats = registry.stats()
+    print(f"Stats: {stats}")
+    assert stats['users'] == 2
+    assert stats['incremental_updates'] == 1
+
+    print("\nTrigram index verification passed!")
+
+
+if __name__ == "__main__":
+    test_trigrams_and_ranking()
+    test_user_index_updates()
+    test_registry_versions()
@@ -16,6 +16,13 @@ class BasicTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Login with Google', response.data)
 
+    def test_metrics_are_internal(self):
+        response = self.app.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+        self.assertEqual(response.status_code, 404)
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db_pool', response.get_json())
+
     def test_add_task_logged_in(self):
         # Create a dummy user in DB
         conn = get_db_connection()
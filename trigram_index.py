@@ -0,0 +1,282 @@
+"""
+In-memory trigram index for search-as-you-type (/search/suggest).
+
+Each user gets an inverted index from trigrams to task ids (over the title
+and tag names of every task) and to tag ids (over tag names). A query is
+split into the same trigrams and candidates are ranked by the share of the
+query's trigrams they contain, so typos and partial words still match.
+
+Indexes are built lazily from the database and are tied to the user's data
+version (see db_manager.bump_user_data_version). Writes made by this process
+update the index in place when it is exactly one version behind; any other
+gap (a write from another worker, a bulk change) drops it and the next
+query rebuilds it.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+SEARCH_INDEX_MAX_USERS = int(os.getenv('SEARCH_INDEX_MAX_USERS', 100))
+# Minimum share of the query's trigrams a hit must contain
+MIN_SIMILARITY = 0.3
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """
+    Set of trigrams of the words in text, lower-cased and padded like pg_trgm
+    ("cat" -> "  c", " ca", "cat", "at ") so word starts weigh more.
+    """
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex:
+    """Inverted trigram index over short texts keyed by id."""
+
+    def __init__(self):
+        self._grams = {}  # id -> set of trigrams
+        self._postings = {}  # trigram -> set of ids
+
+    def __len__(self):
+        return len(self._grams)
+
+    def set(self, doc_id, text):
+        self.remove(doc_id)
+        grams = trigrams(text)
+        self._grams[doc_id] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        for gram in self._grams.pop(doc_id, ()):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, query, limit=10, min_similarity=MIN_SIMILARITY):
+        """Return up to `limit` (id, similarity) pairs, most similar first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        needed = max(1, math.ceil(len(query_grams) * min_similarity))
+
+        # A hit must contain at least one of the (len - needed + 1) rarest query trigrams,
+        # so only those posting lists produce candidates; the frequent ones are intersected.
+        grams = sorted(query_grams, key=lambda gram: len(self._postings.get(gram, ())))
+        probe = len(grams) - needed + 1
+        counts = Counter()
+        for gram in grams[:probe]:
+            counts.update(self._postings.get(gram, ()))
+        if not counts:
+            return []
+        candidates = counts.keys()
+        for gram in grams[probe:]:
+            ids = self._postings.get(gram)
+            if ids:
+                counts.update(ids & candidates)
+
+        size = len(query_grams)
+
+        def rank(item):
+            # Coverage of the query first, then overall similarity (shorter texts first)
+            doc_id, shared = item
+            return shared, shared / (size + len(self._grams[doc_id]) - shared)
+
+        hits = heapq.nlargest(limit, ((doc_id, shared) for doc_id, shared in counts.items() if shared >= needed), key=rank)
+        return [(doc_id, round(shared / size, 3)) for doc_id, shared in hits]
+
+
+class UserSearchIndex:
+    """Trigram indexes of one user's tasks (title + tag names) and tags, at a data version."""
+
+    def __init__(self, version):
+        self.version = version
+        self.tasks = TrigramIndex()
+        self.tags = TrigramIndex()
+        self.titles = {}  # task_id -> title
+        self.parents = {}  # task_id -> parent_id
+        self.task_tags = {}  # task_id -> {tag_id: name}
+        self.tag_names = {}  # tag_id -> name
+        # Held while searching or applying a write, as both walk the same sets
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, version, tasks, task_tags, tags):
+        """
+        tasks: (id, parent_id, title) rows; task_tags: (task_id, tag_id, name) rows;
+        tags: (id, name) rows of all the user's tags.
+        """
+        index = cls(version)
+        for tag_id, name in tags:
+            index.tag_names[tag_id] = name
+            index.tags.set(tag_id, name)
+        for task_id, tag_id, name in task_tags:
+            index.task_tags.setdefault(task_id, {})[tag_id] = name
+        for task_id, parent_id, title in tasks:
+            index.parents[task_id] = parent_id
+            index.titles[task_id] = title or ''
+            index._reindex_task(task_id)
+        return index
+
+    def _reindex_task(self, task_id):
+        names = self.task_tags.get(task_id, {}).values()
+        self.tasks.set(task_id, ' '.join([self.titles.get(task_id, ''), *names]))
+
+    def save_task(self, task_id, title, parent_id=None, tags=()):
+        """Add or update a task; tags are (tag_id, name) pairs newly linked to it."""
+        self.titles[task_id] = title or ''
+        if parent_id is not None or task_id not in self.parents:
+            self.parents[task_id] = parent_id
+        for tag_id, name in tags:
+            self._link(task_id, tag_id, name)
+        self._reindex_task(task_id)
+
+    def move_task(self, task_id, parent_id):
+        if task_id in self.parents:
+            self.parents[task_id] = parent_id
+
+    def remove_subtree(self, task_id):
+        """Remove a task and, like the ON DELETE CASCADE in the database, all its descendants."""
+        children = {}
+        for tid, parent_id in self.parents.items():
+            children.setdefault(parent_id, []).append(tid)
+        stack = [task_id]
+        seen = set()
+        while stack:
+            tid = stack.pop()
+            if tid in seen:
+                continue
+            seen.add(tid)
+            stack.extend(children.get(tid, ()))
+            self.tasks.remove(tid)
+            self.titles.pop(tid, None)
+            self.parents.pop(tid, None)
+            self.task_tags.pop(tid, None)
+
+    def _link(self, task_id, tag_id, name):
+        if tag_id not in self.tag_names:
+            self.tag_names[tag_id] = name
+            self.tags.set(tag_id, name)
+        self.task_tags.setdefault(task_id, {})[tag_id] = name
+
+    def link_tags(self, task_id, tags):
+        for tag_id, name in tags:
+            self._link(task_id, tag_id, name)
+        if task_id in self.titles:
+            self._reindex_task(task_id)
+
+    def unlink_tag(self, task_id, tag_id):
+        self.task_tags.get(task_id, {}).pop(tag_id, None)
+        if task_id in self.titles:
+            self._reindex_task(task_id)
+
+    def suggest(self, query, limit=10):
+        with self.lock:
+            tasks = [{'id': tid, 'title': self.titles[tid], 'score': score}
+                     for tid, score in self.tasks.search(query, limit)]
+            tags = [{'id': tag_id, 'name': self.tag_names[tag_id], 'score': score}
+                    for tag_id, score in self.tags.search(query, limit)]
+        return {'tasks': tasks, 'tags': tags}
+
+
+class SearchIndexRegistry:
+    """Per-user UserSearchIndex objects, least recently used dropped beyond max_users."""
+
+    def __init__(self, max_users=SEARCH_INDEX_MAX_USERS):
+        self.max_users = max_users
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.incremental_updates = 0
+
+    def get(self, user_id, version, loader):
+        """
+        Return the user's index at `version`, building it with loader() -> (tasks, task_tags, tags)
+        (see UserSearchIndex.build) when missing or stale.
+        """
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(user_id)
+                return index
+        rows = loader()
+        if rows is None:
+            return None
+        index = UserSearchIndex.build(version, *rows)
+        with self._lock:
+            self.builds += 1
+            current = self._indexes.get(user_id)
+            # Keep whichever is newer if a write raced the build
+            if current is None or current.version <= version:
+                self._indexes[user_id] = index
+                self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _apply(self, user_id, version, change=None):
+        # Incremental updates are only safe on top of the previous version of the same data
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            if index.version != version - 1:
+                del self._indexes[user_id]
+                return
+            with index.lock:
+                if change:
+                    change(index)
+                index.version = version
+            self.incremental_updates += 1
+
+    def advance(self, user_id, version):
+        """Record a write that changed no title or tag (status, dates, folding...)."""
+        self._apply(user_id, version)
+
+    def task_saved(self, user_id, version, task_id, title, parent_id=None, tags=()):
+        self._apply(user_id, version, lambda index: index.save_task(task_id, title, parent_id, tags))
+
+    def task_moved(self, user_id, version, task_id, parent_id):
+        self._apply(user_id, version, lambda index: index.move_task(task_id, parent_id))
+
+    def task_deleted(self, user_id, version, task_id):
+        self._apply(user_id, version, lambda index: index.remove_subtree(task_id))
+
+    def tags_linked(self, user_id, version, task_id, tags):
+        """tags: (tag_id, name) pairs linked to the task by one write."""
+        self._apply(user_id, version, lambda index: index.link_tags(task_id, tags))
+
+    def tag_unlinked(self, user_id, version, task_id, tag_id):
+        self._apply(user_id, version, lambda index: index.unlink_tag(task_id, tag_id))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._indexes),
+                'max_users': self.max_users,
+                'builds': self.builds,
+                'incremental_updates': self.incremental_updates,
+            }
+
+
+# Shared by every TaskManager and CTask in the process
+search_index = SearchIndexRegistry()